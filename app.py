@@ -3,18 +3,22 @@
 # 主應用程式 (app.py)
 import streamlit as st
 from streamlit_drawable_canvas import st_canvas
-import numpy as np
-from PIL import Image, ImageOps
+import os
 import time
 import random
-import streamlit.components.v1 as components
 
 # 匯入自訂模組
-from model import load_ai_model, predict_image
-from app_utils import preprocess_image
+from model import load_ai_model, CachedEngine, MicroBatcher
+from app_utils import prepare_canvas, prepare_strokes
 from fish_animation import FishTank
+from tank_store import TankStore
+from tank_component import fish_tank
+import metrics
 
 # --- 1. 頁面設定與資源載入 ---
+# 辨識的輸入模式："bitmap" 縮小整張 RGBA 畫布；"strokes" 直接由筆畫 (json_data) 繪製 28x28 圖片
+INPUT_MODE = os.environ.get("FISH_INPUT_MODE", "bitmap")
+
 st.set_page_config(
     page_title="AI 互動魚缸",
     page_icon="🐠",
@@ -38,56 +42,47 @@ div[data-testid="stDrawableCanvasToolbar"] button:last-child svg {
 
 @st.cache_resource
 def get_model():
-    """載入並快取 AI 模型"""
-    return load_ai_model()
+    """載入並快取 AI 推論引擎 (載入時即完成暖機)，並加上所有 session 共用的預測快取"""
+    engine = load_ai_model()
+    return CachedEngine(engine) if engine is not None else None
+
+@st.cache_resource
+def get_batcher(_model):
+    """建立所有 session 共用的微批次推論服務，合併同時送出的辨識請求"""
+    return MicroBatcher(_model, max_batch_size=32, max_wait_ms=5.0)
+
+@st.cache_resource
+def get_tank_store():
+    """所有 session 共用的魚缸儲存區 (SQLite)，讀取經過行程內快取"""
+    return TankStore()
 
 model = get_model()
+batcher = get_batcher(model)
 
 # 初始化 session_state
 if "tank" not in st.session_state:
-    st.session_state.tank = FishTank(width=560, height=560)
+    st.session_state.tank = FishTank(width=560, height=560, store=get_tank_store())
 if "canvas_key" not in st.session_state:
     st.session_state.canvas_key = f"canvas_{random.randint(0, 1000)}"
 if "last_prediction_info" not in st.session_state:
     st.session_state.last_prediction_info = None
 
 # --- 2. 輔助函式：處理使用者繪製的魚 ---
-def crop_and_prepare_sprite(image_data: np.ndarray) -> Image:
-    """
-    將使用者在畫布上畫的圖案去背、裁切並縮放，製成魚的圖片。
-    使用 NumPy 進行高效處理。
+def prepare_input(canvas_result):
     """
-    if image_data is None or image_data.shape[2] < 4 or np.all(image_data[:, :, 3] == 0):
-        return None # 畫布是空的
+    依 `INPUT_MODE` 產生 (28x28 模型輸入, sprite, 顯示用的原始畫作)；畫布是空的時回傳 None。
 
-    # 尋找邊界框
-    alpha = image_data[:, :, 3]
-    non_transparent_coords = np.argwhere(alpha > 0)
-    if non_transparent_coords.size == 0:
+    筆畫模式以 QuickDraw 的方式直接由 json_data 繪製模型輸入，sprite 也由筆畫重新繪製，
+    完全不使用整張 RGBA 畫布。
+    """
+    if INPUT_MODE == "strokes":
+        img_array_28x28, fish_sprite = prepare_strokes(canvas_result.json_data)
+        return None if img_array_28x28 is None else (img_array_28x28, fish_sprite, fish_sprite)
+    if canvas_result.image_data is None:
         return None
-    
-    y_min, x_min = non_transparent_coords.min(axis=0)
-    y_max, x_max = non_transparent_coords.max(axis=0)
-
-    # 裁切圖片
-    cropped_data = image_data[y_min:y_max+1, x_min:x_max+1]
-
-    # 將接近白色的像素變為透明
-    pixels = cropped_data.copy()
-    white_threshold = 245
-    is_white = (pixels[:, :, 0] > white_threshold) & \
-               (pixels[:, :, 1] > white_threshold) & \
-               (pixels[:, :, 2] > white_threshold)
-    
-    pixels[is_white, 3] = 0 # 將 alpha 通道設為 0
-
-    # 從 NumPy 陣列建立 PIL 圖片
-    final_sprite = Image.fromarray(pixels, 'RGBA')
-
-    # 縮放圖片到適合的大小，保持長寬比
-    final_sprite.thumbnail((120, 120), Image.Resampling.LANCZOS)
-    
-    return final_sprite
+    # 一次掃描畫布，同時取得模型輸入與魚缸用的 sprite
+    img_array_28x28, fish_sprite = prepare_canvas(canvas_result.image_data)
+    return img_array_28x28, fish_sprite, canvas_result.image_data
 
 # --- 3. 主標題與介紹 ---
 st.title("🎨 AI 互動魚缸：畫魚成真！")
@@ -141,20 +136,19 @@ with col1:
     if st.button("✨ AI 魔法辨識", type="primary", use_container_width=True):
         if model is None:
             st.error("模型載入失敗，請檢查 `fish_classifier.h5` 檔案。")
-        elif canvas_result.image_data is not None:
-            img_array_28x28 = preprocess_image(canvas_result.image_data)
-            is_fish, confidence = predict_image(img_array_28x28, model)
+        elif (prepared := prepare_input(canvas_result)) is not None:
+            img_array_28x28, fish_sprite, original = prepared
+            is_fish, confidence = batcher.predict(img_array_28x28)
 
             # 將最新的辨識結果存入 session_state
             st.session_state.last_prediction_info = {
-                "image_data": canvas_result.image_data,
+                "image_data": original,
                 "img_array_28x28": img_array_28x28,
                 "is_fish": is_fish,
                 "confidence": confidence
             }
             
             if is_fish:
-                fish_sprite = crop_and_prepare_sprite(canvas_result.image_data)
                 if fish_sprite:
                     st.session_state.tank.add_fish(fish_sprite)
                     # 清空畫布以便畫下一隻
@@ -171,9 +165,12 @@ with col1:
 with col2:
     st.header("步驟 3: 欣賞您的魚缸")
 
-    # 永遠渲染魚缸，空的魚缸會由 fish_animation 模組負責顯示提示
-    html_render = st.session_state.tank.render_as_html()
-    components.html(html_render, height=st.session_state.tank.height + 40, width=st.session_state.tank.width + 40)
+    # 永遠渲染魚缸，空的魚缸會由元件負責顯示提示；
+    # 渲染前先取得其他訪客新畫的魚，並依經過的時間推進魚的運動，讓新載入的魚缸從目前的位置開始。
+    # 元件只在第一次渲染時建立 iframe，之後每次 rerun 只傳送新加入的魚
+    st.session_state.tank.sync()
+    st.session_state.tank.catch_up()
+    fish_tank(st.session_state.tank)
 
 
 
@@ -189,4 +186,30 @@ st.sidebar.info(
 )
 st.sidebar.header("魚缸狀態")
 st.sidebar.metric("目前魚缸中的魚數量", f"{len(st.session_state.tank.fishes)} 隻")
-st.sidebar.image("https://storage.googleapis.com/kaggle-avatars/images/1332573-kg.png", width=150)
\ No newline at end of file
+st.sidebar.image("https://storage.googleapis.com/kaggle-avatars/images/1332573-kg.png", width=150)
+
+# 效能診斷面板：以 FISH_METRICS=1 啟動時才記錄與顯示，關閉時不增加任何成本
+if metrics.is_enabled():
+    with st.sidebar.expander("效能診斷", expanded=False):
+        summary = metrics.snapshot()
+        if summary:
+            st.table([
+                {
+                    "階段": stage,
+                    "次數": stats["count"],
+                    "平均 (ms)": round(stats["mean_ms"], 2),
+                    "p50 (ms)": round(stats["p50_ms"], 2),
+                    "p95 (ms)": round(stats["p95_ms"], 2),
+                    "p99 (ms)": round(stats["p99_ms"], 2),
+                }
+                for stage, stats in summary.items()
+            ])
+        else:
+            st.write("尚未記錄到任何資料。")
+        if model is not None:
+            cache_stats = model.cache.stats()
+            st.write(f"預測快取命中率: {cache_stats['hit_rate']:.0%} ({cache_stats['entries']} 筆)")
+        st.download_button("下載 Prometheus 指標", metrics.export_prometheus(), file_name="metrics.prom")
+        st.download_button("下載 JSON", metrics.export_json(), file_name="metrics.json")
+        if st.button("清除診斷資料"):
+            metrics.reset()
@@ -1,113 +1,532 @@
 # 共用輔助函式 (utils.py)
 import numpy as np
 from PIL import Image
-import os
-import urllib.request
-import cv2
 
-def preprocess_image(canvas_image_data):
+from dataset_cache import QuickDrawCache, default_cache
+from metrics import timed
+
+def ink_bounding_box(ink, threshold=0):
+    """
+    以列/行的 any 歸約找出筆跡的邊界框，不需建立座標陣列。
+
+    Args:
+        ink (np.array): (H, W) 的筆跡強度 (越大越黑)。
+        threshold (float): 大於此值才視為筆跡。
+
+    Returns:
+        tuple: (y_min, y_max, x_min, x_max)，皆為包含端點；沒有筆跡時回傳 None。
+    """
+    mask = ink > threshold
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return rows[0], rows[-1], cols[0], cols[-1]
+
+def _square_crop(ink, box, margin):
+    """將邊界框擴成置中的正方形 (加上 margin 比例的留白)，超出畫布的部分補 0。"""
+    y_min, y_max, x_min, x_max = box
+    side = max(y_max - y_min + 1, x_max - x_min + 1)
+    side = int(np.ceil(side * (1 + 2 * margin)))
+    top = (y_min + y_max + 1 - side) // 2
+    left = (x_min + x_max + 1 - side) // 2
+
+    square = np.zeros((side, side), dtype=ink.dtype)
+    src_top, src_left = max(top, 0), max(left, 0)
+    src_bottom, src_right = min(top + side, ink.shape[0]), min(left + side, ink.shape[1])
+    square[src_top - top:src_bottom - top, src_left - left:src_right - left] = \
+        ink[src_top:src_bottom, src_left:src_right]
+    return square
+
+@timed("app_utils.preprocess_images")
+def preprocess_images(canvas_images, crop_to_ink=False, margin=0.1):
+    """
+    將一批 Streamlit Drawable Canvas 的 RGBA 輸出轉換為模型可用的格式。
+
+    直接在 NumPy 陣列上計算亮度 (不經過 PIL 物件)，再以面積平均縮小到 28x28。
+
+    Args:
+        canvas_images (np.array): (N, H, W, 4) 或 (H, W, 4) 的 RGBA 圖片資料。
+        crop_to_ink (bool): 是否先裁切到筆跡的正方形邊界框再縮小，
+                            讓畫在角落或畫得很小的魚也能填滿 28x28。
+        margin (float): 裁切時在邊界框四周保留的留白比例。
+
+    Returns:
+        np.array: (N, 28, 28) 的 uint8 圖片 (黑底白線)。
+    """
+    import cv2
+
+    canvas_images = np.asarray(canvas_images, dtype=np.uint8)
+    if canvas_images.ndim == 3:
+        canvas_images = canvas_images[None]
+    n, height, width, _ = canvas_images.shape
+
+    # 整批圖片攤平成一張高圖，一次呼叫完成灰階轉換 (與 PIL 的 L 模式係數相同)
+    gray = cv2.cvtColor(canvas_images.reshape(n * height, width, 4), cv2.COLOR_RGBA2GRAY)
+    # QuickDraw 是黑底白線，但畫布是白底黑線，所以需要反轉顏色
+    ink = np.subtract(255, gray, out=gray).reshape(n, height, width)
+
+    resized = np.zeros((n, 28, 28), dtype=np.uint8)
+    for i, image in enumerate(ink):
+        _resize_ink(image, resized[i], crop_to_ink, margin)
+    return resized
+
+def _resize_ink(ink, out, crop_to_ink=False, margin=0.1):
+    """將單張 (H, W) 的筆跡圖縮小成 28x28 寫入 out；裁切模式下沒有筆跡時保持全黑。"""
+    import cv2
+
+    if crop_to_ink:
+        box = ink_bounding_box(ink)
+        if box is None:
+            return
+        ink = _square_crop(ink, box, margin)
+    # INTER_AREA 即面積平均，比 LANCZOS 便宜且縮小時不會產生振鈴
+    cv2.resize(ink, (28, 28), dst=out, interpolation=cv2.INTER_AREA)
+
+def preprocess_image(canvas_image_data, crop_to_ink=False):
     """
     將 Streamlit Drawable Canvas 的輸出轉換為模型可用的格式。
 
     Args:
         canvas_image_data (np.array): 來自 st_canvas 的 RGBA 圖片資料。
+        crop_to_ink (bool): 是否先裁切到筆跡的邊界框，見 `preprocess_images`。
 
     Returns:
-        np.array: 處理過的圖片陣列。
+        np.array: 處理過的 28x28 圖片陣列 (黑底白線)。
     """
-    # TODO: 根據你的模型輸入要求，完善這個函式。
-    # 例如：灰階、尺寸調整、正規化等。
+    if canvas_image_data is None:
+        return None
+    return preprocess_images(canvas_image_data, crop_to_ink=crop_to_ink)[0]
 
-    if canvas_image_data is not None:
-        # 轉換為 PIL Image 物件
-        img = Image.fromarray(canvas_image_data.astype('uint8'), 'RGBA')
-        
-        # 轉換為灰階
-        img_gray = img.convert('L')
-        
-        # 調整尺寸到 28x28 (配合 QuickDraw 資料集)
-        img_resized = img_gray.resize((28, 28), Image.LANCZOS)
-        
-        # 轉換為 numpy array
-        img_array = np.array(img_resized)
-        
-        # QuickDraw 是黑底白線，但畫布是白底黑線，所以需要反轉顏色
-        img_inverted = 255 - img_array
-        
-        #正規化到 0-1 之間 (如果模型需要)
-        # img_normalized = img_inverted / 255.0
-        
-        # 增加一個維度以符合模型輸入 (e.g., (1, 28, 28, 1))
-        # return np.expand_dims(img_normalized, axis=(0, -1))
-        
-        return img_inverted
-    
-    return None
+def _resize_premultiplied(rgba, size):
+    """
+    以面積平均縮小含透明像素的 RGBA 圖片。
 
-def download_quickdraw_dataset(dataset_name="fish", dest_path="."):
+    先以 alpha 預乘 RGB，縮小後再還原，透明像素 (0, 0, 0, 0) 的黑色才不會
+    混進半透明的筆畫邊緣。
+    """
+    import cv2
+
+    premultiplied = rgba.astype(np.float32)
+    premultiplied[:, :, :3] *= premultiplied[:, :, 3:] / 255
+    resized = cv2.resize(premultiplied, size, interpolation=cv2.INTER_AREA)
+    resized[:, :, :3] *= 255 / np.maximum(resized[:, :, 3:], 1e-3)
+    return np.clip(resized + 0.5, 0, 255).astype(np.uint8)
+
+@timed("app_utils.prepare_canvas")
+def prepare_canvas(canvas_image_data, crop_to_ink=False, sprite_size=120, white_threshold=245):
+    """
+    只掃描畫布一次，同時產生模型輸入與魚缸用的 sprite。
+
+    - 灰階圖用來縮小成 28x28；邊界框與去白共用同一條規則 (最小通道大於門檻即為背景)，
+      淡色筆跡不會被裁到邊界框外卻又保留為不透明。
+    - 以列/行的 any 歸約找出筆跡邊界框，不再用 argwhere 產生每個像素的座標。
+    - sprite 先縮小到 sprite_size 以內才做去白，去白只在小圖上用一個合併的遮罩原地修改 alpha。
+
+    Args:
+        canvas_image_data (np.array): 來自 st_canvas 的 (H, W, 4) RGBA 圖片資料。
+        crop_to_ink (bool): 模型輸入是否先裁切到筆跡的邊界框，見 `preprocess_images`。
+        sprite_size (int): sprite 的最大邊長 (保持長寬比，不放大)。
+        white_threshold (int): RGB 三個通道都大於此值的像素視為背景，變為透明。
+
+    Returns:
+        tuple: (28x28 的模型輸入, PIL RGBA sprite)；畫布上沒有筆跡時 sprite 為 None。
+               canvas_image_data 為 None 時回傳 (None, None)。
+    """
+    import cv2
+
+    if canvas_image_data is None:
+        return None, None
+    canvas = np.asarray(canvas_image_data, dtype=np.uint8)
+
+    # 與畫布等大的 uint8 暫存：先是灰階，之後原地反轉成筆跡強度
+    gray = cv2.cvtColor(canvas, cv2.COLOR_RGBA2GRAY)
+    # 與畫布等大的布林遮罩：不透明且不是白色。判斷白色的規則與最後去白相同 (最小通道大於門檻)，
+    # 用灰階判斷的話 (255, 250, 200) 這類淡色筆跡會被裁到邊界框外，卻又不會被去背
+    visible = canvas[:, :, :3].min(axis=2) <= white_threshold
+    np.logical_and(visible, canvas[:, :, 3], out=visible)
+    ink = np.subtract(255, gray, out=gray)
+
+    img_28x28 = np.zeros((28, 28), dtype=np.uint8)
+    _resize_ink(ink, img_28x28, crop_to_ink)
+
+    rows = np.flatnonzero(visible.any(axis=1))
+    if rows.size == 0:
+        return img_28x28, None # 畫布是空的
+    cols = np.flatnonzero(visible.any(axis=0))
+    cropped = canvas[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1] # 不複製的視圖
+
+    # 與 Image.thumbnail 相同：保持長寬比縮到 sprite_size 以內，不放大
+    height, width = cropped.shape[:2]
+    scale = min(1.0, sprite_size / max(height, width))
+    if scale < 1.0:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if cropped[:, :, 3].min() == 255:
+            # st_canvas 的背景是不透明的白色，完全不透明時預乘 alpha 沒有作用，直接做面積平均
+            pixels = cv2.resize(cropped, size, interpolation=cv2.INTER_AREA)
+        else:
+            pixels = _resize_premultiplied(cropped, size)
+    else:
+        pixels = cropped.copy()
+
+    # 三個通道都大於門檻 <=> 最小的通道大於門檻，一個遮罩完成去白 (與上面的 visible 同一條規則)
+    pixels[pixels[:, :, :3].min(axis=2) > white_threshold, 3] = 0
+    return img_28x28, Image.fromarray(pixels, 'RGBA')
+
+# QuickDraw 點陣圖的繪製方式：筆畫先正規化到 0-255 的座標，在 256x256 的畫布上
+# 以固定粗細 (不論原本的筆刷大小) 繪製，四周留白後縮成 28x28
+QUICKDRAW_SIDE = 256
+QUICKDRAW_LINE_WIDTH = 16
+QUICKDRAW_PADDING = 16
+
+def _parse_color(color):
+    """把 fabric.js 的顏色字串 ("#rrggbb"、"rgb(...)"、"rgba(...)") 轉成 (r, g, b)。"""
+    color = (color or "#000000").strip()
+    if color.startswith("#"):
+        value = color[1:]
+        if len(value) == 3:
+            value = "".join(c * 2 for c in value)
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    values = color[color.index("(") + 1:color.rindex(")")].split(",")
+    return tuple(int(float(v)) for v in values[:3])
+
+def canvas_strokes(json_data, white_threshold=245):
+    """
+    從 st_canvas 的 `json_data` 取出 freedraw 筆畫。
+
+    freedraw 的路徑是 fabric.js 的 "M" / "Q" / "L" 指令，座標就是畫布座標；
+    二次貝茲曲線的控制點正是原始取樣點，因此直接把控制點與端點當成折線的頂點。
+
+    Args:
+        json_data (dict): st_canvas 回傳的 fabric.js 畫布 JSON。
+        white_threshold (int): RGB 三個通道都大於此值的筆畫視為橡皮擦。
+
+    Returns:
+        list: 每個筆畫一個 dict (points: (K, 2) float32 的 (x, y)、width、color、erase)。
+    """
+    strokes = []
+    for obj in (json_data or {}).get("objects", []):
+        if obj.get("type") != "path" or not obj.get("path"):
+            continue
+        points = [value for command in obj["path"] for value in command[1:]]
+        if len(points) < 2:
+            continue
+        color = _parse_color(obj.get("stroke"))
+        strokes.append({
+            "points": np.asarray(points, dtype=np.float32).reshape(-1, 2),
+            "width": float(obj.get("strokeWidth", 1)),
+            "color": color,
+            "erase": min(color) > white_threshold,
+        })
+    return strokes
+
+def ndjson_strokes(drawing):
+    """把 QuickDraw simplified ndjson 的 drawing ([[x...], [y...]] 的列表) 轉成 `canvas_strokes` 的格式。"""
+    return [
+        {"points": np.stack([xs, ys], axis=1).astype(np.float32), "width": float(QUICKDRAW_LINE_WIDTH),
+         "color": (0, 0, 0), "erase": False}
+        for xs, ys in drawing if len(xs)
+    ]
+
+def rasterize_strokes(strokes, size=28, supersample=4):
+    """
+    以 QuickDraw 的方式把筆畫直接繪製成 size x size 的黑底白線圖片。
+
+    - 以筆跡 (不含橡皮擦) 的邊界框對齊左上角，長邊等比例縮放到 0-255 (與 simplified 資料集相同)。
+    - 在 256 的座標中置中，四周加上留白與半個筆寬後縮放到輸出大小。
+    - 筆跡一律使用 `QUICKDRAW_LINE_WIDTH` 的粗細；橡皮擦保留原本的粗細 (隨座標一起縮放)。
+    - 先以 supersample 倍的解析度反鋸齒繪製，再以面積平均縮小。
+
+    Args:
+        strokes (list): `canvas_strokes` 或 `ndjson_strokes` 的筆畫。
+        size (int): 輸出的邊長。
+        supersample (int): 繪製時的放大倍數。
+
+    Returns:
+        np.array: (size, size) 的 uint8 圖片；沒有筆跡時為全黑。
+    """
+    import cv2
+
+    image = np.zeros((size, size), dtype=np.uint8)
+    ink = [stroke["points"] for stroke in strokes if not stroke["erase"]]
+    if not ink:
+        return image
+    all_ink = np.concatenate(ink)
+    origin = all_ink.min(axis=0)
+    extent = float((all_ink.max(axis=0) - origin).max())
+    normalize = 255.0 / extent if extent > 0 else 1.0
+
+    # 與 QuickDraw 相同：置中後四周留白 (padding + 半個筆寬)，再縮放到輸出大小
+    offset = (QUICKDRAW_SIDE - (all_ink.max(axis=0) - origin) * normalize) / 2
+    total_padding = 2 * QUICKDRAW_PADDING + QUICKDRAW_LINE_WIDTH
+    canvas_size = size * supersample
+    to_canvas = canvas_size / (QUICKDRAW_SIDE + total_padding)
+
+    canvas = np.zeros((canvas_size, canvas_size), dtype=np.uint8)
+    for stroke in strokes:
+        points = ((stroke["points"] - origin) * normalize + offset + total_padding / 2) * to_canvas
+        width = stroke["width"] * normalize if stroke["erase"] else QUICKDRAW_LINE_WIDTH
+        # cv2 以 1/16 像素的定點座標繪製，讓反鋸齒能反映次像素的位置
+        cv2.polylines(canvas, [np.round(points * 16).astype(np.int32)], False, 0 if stroke["erase"] else 255,
+                      thickness=max(1, int(round(width * to_canvas))), lineType=cv2.LINE_AA, shift=4)
+    cv2.resize(canvas, (size, size), dst=image, interpolation=cv2.INTER_AREA)
+    return image
+
+def render_stroke_sprite(strokes, sprite_size=120, supersample=2):
+    """
+    以筆畫原本的顏色與粗細繪製透明背景的 sprite，長邊不超過 sprite_size (不放大)。
+
+    先在放大的畫布上繪製預乘 alpha 的顏色，縮小後再還原，邊緣不會混入黑色。
+
+    Returns:
+        PIL.Image: RGBA sprite；沒有筆跡時回傳 None。
+    """
+    import cv2
+
+    ink = [stroke for stroke in strokes if not stroke["erase"]]
+    if not ink:
+        return None
+    # 邊界框包含筆寬，與畫布上看到的範圍相同
+    lower = np.min([stroke["points"].min(axis=0) - stroke["width"] / 2 for stroke in ink], axis=0)
+    upper = np.max([stroke["points"].max(axis=0) + stroke["width"] / 2 for stroke in ink], axis=0)
+    scale = min(1.0, sprite_size / float((upper - lower).max()))
+    width, height = (max(1, int(np.ceil(v))) for v in (upper - lower) * scale)
+
+    canvas = np.zeros((height * supersample, width * supersample, 4), dtype=np.uint8)
+    for stroke in strokes:
+        points = (stroke["points"] - lower) * scale * supersample
+        color = (0, 0, 0, 0) if stroke["erase"] else (*stroke["color"], 255)
+        cv2.polylines(canvas, [np.round(points * 16).astype(np.int32)], False, color,
+                      thickness=max(1, int(round(stroke["width"] * scale * supersample))), lineType=cv2.LINE_8, shift=4)
+    pixels = cv2.resize(canvas, (width, height), interpolation=cv2.INTER_AREA)
+    alpha = np.maximum(pixels[:, :, 3:].astype(np.float32), 1)
+    pixels[:, :, :3] = np.minimum(pixels[:, :, :3] * 255.0 / alpha, 255).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGBA')
+
+@timed("app_utils.prepare_strokes")
+def prepare_strokes(json_data, sprite_size=120):
+    """
+    筆畫輸入模式：直接由 st_canvas 的 `json_data` 產生模型輸入與魚缸用的 sprite，
+    不需要整張 RGBA 畫布。
+
+    Args:
+        json_data (dict): st_canvas 回傳的 fabric.js 畫布 JSON。
+        sprite_size (int): sprite 的最大邊長。
+
+    Returns:
+        tuple: (28x28 的模型輸入, PIL RGBA sprite)；沒有筆跡時回傳 (None, None)。
+    """
+    strokes = canvas_strokes(json_data)
+    if not any(not stroke["erase"] for stroke in strokes):
+        return None, None
+    return rasterize_strokes(strokes), render_stroke_sprite(strokes, sprite_size)
+
+def _iter_ndjson_drawings(path, max_items=None, recognized_only=False):
+    """逐行讀取 simplified ndjson，產生每筆塗鴉的 drawing。"""
+    import gzip
+    import json
+
+    opener = gzip.open if path.endswith(".gz") else open
+    total = 0
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if max_items is not None and total >= max_items:
+                return
+            record = json.loads(line)
+            if recognized_only and not record.get("recognized", True):
+                continue
+            total += 1
+            yield record["drawing"]
+
+def iter_quickdraw_strokes(path, chunk_size=1024, max_items=None, recognized_only=False):
+    """
+    串流讀取 QuickDraw simplified 格式的 `.ndjson` (或 `.ndjson.gz`) 檔，
+    以與服務端相同的 `rasterize_strokes` 繪製成 28x28 圖片。
+
+    一次只保留一個區塊的圖片，記憶體用量與檔案大小無關。
+
+    Args:
+        path (str): ndjson 檔案路徑。
+        chunk_size (int): 每個區塊的圖片數量。
+        max_items (int): 最多讀取的圖片數量，None 表示全部。
+        recognized_only (bool): 是否只保留 QuickDraw 遊戲中被正確辨識的塗鴉。
+
+    Yields:
+        np.array: 形狀為 (n, 28, 28) 的 uint8 圖片區塊 (黑底白線)。
+    """
+    chunk = np.empty((chunk_size, 28, 28), dtype=np.uint8)
+    n = 0
+    for drawing in _iter_ndjson_drawings(path, max_items, recognized_only):
+        chunk[n] = rasterize_strokes(ndjson_strokes(drawing))
+        n += 1
+        if n == chunk_size:
+            yield chunk.copy()
+            n = 0
+    if n:
+        yield chunk[:n].copy()
+
+def rasterize_ndjson(path, output_path, max_items=None, recognized_only=False, chunk_size=1024):
+    """
+    把 simplified ndjson 轉成與 numpy_bitmap 相同格式的 (N, 784) uint8 `.npy` 檔，
+    之後即可用 `QUICKDRAW_CACHE_DIR` 指向輸出資料夾，以相同的繪製方式訓練模型。
+
+    先串流計算筆數，再逐塊寫入記憶體映射的輸出檔，整個過程只需一個區塊的記憶體。
+
+    Returns:
+        int: 寫入的圖片數量。
+    """
+    count = sum(1 for _ in _iter_ndjson_drawings(path, max_items, recognized_only))
+    output = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=(count, 784))
+    start = 0
+    for chunk in iter_quickdraw_strokes(path, chunk_size, max_items, recognized_only):
+        output[start:start + len(chunk)] = chunk.reshape(len(chunk), 784)
+        start += len(chunk)
+    output.flush()
+    del output
+    print(f"已將 '{path}' 的 {count} 筆塗鴉繪製並儲存至 '{output_path}'。")
+    return count
+
+def download_quickdraw_dataset(dataset_name="fish", dest_path=None):
     """
     從 Google Cloud Storage 下載 QuickDraw 資料集的 .npy 檔案。
 
+    下載由 `dataset_cache.QuickDrawCache` 負責：支援斷點續傳、大小與雜湊驗證，
+    並在完成後才原子性地改名成正式檔名。
+
     Args:
         dataset_name (str): 要下載的資料集名稱 (例如 "fish", "cat", "apple")。
-        dest_path (str): 儲存檔案的目標資料夾。
+        dest_path (str): 儲存檔案的目標資料夾，None 表示使用預設的快取資料夾。
 
     Returns:
         str: 下載檔案的完整路徑，如果失敗則回傳 None。
     """
-    file_name = f"{dataset_name}.npy"
-    file_path = os.path.join(dest_path, file_name)
-    
-    # 檢查檔案是否已存在
-    if os.path.exists(file_path):
-        print(f"資料集 '{file_name}' 已存在於 '{file_path}'。")
-        return file_path
+    cache = default_cache if dest_path is None else QuickDrawCache(cache_dir=dest_path)
+    return cache.fetch(dataset_name)
 
-    # 下載 URL
-    url = f"https://storage.googleapis.com/quickdraw_dataset/full/numpy_bitmap/{file_name}"
-    
-    print(f"正在從 {url} 下載 '{file_name}'...")
+def download_quickdraw_datasets(dataset_names, dest_path=None):
+    """
+    同時下載多個 QuickDraw 資料集。
+
+    Args:
+        dataset_names (list): 要下載的資料集名稱。
+        dest_path (str): 儲存檔案的目標資料夾，None 表示使用預設的快取資料夾。
+
+    Returns:
+        dict: 資料集名稱對應的檔案路徑 (失敗者為 None)。
+    """
+    cache = default_cache if dest_path is None else QuickDrawCache(cache_dir=dest_path)
+    return cache.fetch_many(dataset_names)
+
+def open_quickdraw_memmap(dataset_name="fish", dest_path=None):
+    """
+    以記憶體映射 (memory-map) 的方式開啟 QuickDraw 資料集，不將整個檔案讀入記憶體。
+
+    QuickDraw 的 numpy_bitmap 檔案是 (N, 784) 的 uint8 陣列，不需要 pickle；
+    只有實際被存取的頁面才會從磁碟讀入。
+
+    Args:
+        dataset_name (str): 要開啟的資料集名稱。
+        dest_path (str): 資料集所在的資料夾 (不存在時會先下載)，None 表示預設的快取資料夾。
+
+    Returns:
+        np.array: 形狀為 (N, 28, 28) 的唯讀 uint8 視圖，失敗則回傳 None。
+    """
+    file_path = download_quickdraw_dataset(dataset_name, dest_path)
     
-    try:
-        # 使用 urllib 進行下載
-        urllib.request.urlretrieve(url, file_path)
-        print(f"下載完成！檔案儲存於: {file_path}")
-        return file_path
-    except Exception as e:
-        print(f"下載失敗: {e}")
-        # 如果下載失敗，清理不完整的檔案
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    if file_path is None:
         return None
 
-def load_quickdraw_images(dataset_name="fish", max_items=5000):
+    try:
+        images = np.load(file_path, mmap_mode='r')
+    except ValueError:
+        # 舊版以 pickle 儲存的物件陣列無法映射，只能退回完整載入
+        images = np.load(file_path, encoding='latin1', allow_pickle=True)
+
+    # 將 784 的向量轉換為 28x28 的圖片 (對映射陣列而言只是改變視圖，不複製資料)
+    return images.reshape(-1, 28, 28)
+
+def select_quickdraw_indices(total, max_items=None, subset="head", seed=0):
+    """
+    決定要從 `total` 筆資料中取出哪些圖片。
+
+    Args:
+        total (int): 資料集中的圖片總數。
+        max_items (int): 最多取出的數量，None 表示全部。
+        subset (str): "head" 取前段、"strided" 等距取樣、"random" 隨機取樣。
+        seed (int): "random" 模式使用的亂數種子。
+
+    Returns:
+        slice | np.array: "head" / "strided" 回傳 slice (可產生零複製視圖)，
+                          "random" 回傳排序過的索引陣列 (讓磁碟讀取保持順序)。
+    """
+    n = total if max_items is None else min(max_items, total)
+    if subset == "head":
+        return slice(0, n)
+    if subset == "strided":
+        step = max(total // max(n, 1), 1)
+        return slice(0, step * n, step)
+    if subset == "random":
+        rng = np.random.default_rng(seed)
+        return np.sort(rng.choice(total, size=n, replace=False))
+    raise ValueError(f"未知的取樣方式 '{subset}'")
+
+def iter_quickdraw_chunks(dataset_name="fish", chunk_size=1024, max_items=None, subset="head", seed=0, dest_path=None):
+    """
+    分塊走訪 QuickDraw 資料集，每次只讀入一個區塊。
+
+    "head" / "strided" 模式產生的是映射陣列的零複製視圖；"random" 模式則只
+    複製該區塊選中的圖片。
+
+    Args:
+        dataset_name (str): 要載入的資料集名稱。
+        chunk_size (int): 每個區塊的圖片數量。
+        max_items (int): 最多走訪的圖片數量，None 表示全部。
+        subset (str): 取樣方式，見 `select_quickdraw_indices`。
+        seed (int): "random" 模式使用的亂數種子。
+        dest_path (str): 資料集所在的資料夾，None 表示預設的快取資料夾。
+
+    Yields:
+        np.array: 形狀為 (n, 28, 28) 的 uint8 圖片區塊 (黑底白線)。
+    """
+    images = open_quickdraw_memmap(dataset_name, dest_path)
+    if images is None:
+        return
+
+    selection = select_quickdraw_indices(len(images), max_items, subset, seed)
+    if isinstance(selection, slice):
+        selected = images[selection]
+        for start in range(0, len(selected), chunk_size):
+            yield selected[start:start + chunk_size]
+    else:
+        for start in range(0, len(selection), chunk_size):
+            yield images[selection[start:start + chunk_size]]
+
+def load_quickdraw_images(dataset_name="fish", max_items=5000, subset="head", seed=0, dest_path=None):
     """
     下載並載入 QuickDraw 資料集，將其轉換為 28x28 的圖片陣列。
 
+    資料集以記憶體映射開啟，只有被選中的圖片會從磁碟讀入，
+    不會為了取前 `max_items` 筆而載入整個檔案。
+
     Args:
         dataset_name (str): 要載入的資料集名稱。
         max_items (int): 要載入的最大圖片數量。
+        subset (str): 取樣方式，見 `select_quickdraw_indices`。
+        seed (int): "random" 模式使用的亂數種子。
+        dest_path (str): 資料集所在的資料夾，None 表示預設的快取資料夾。
 
     Returns:
         np.array: 包含圖片資料的 NumPy 陣列，形狀為 (數量, 28, 28)。
-                  圖片為黑底白線 (0-255)。
+                  圖片為黑底白線 (0-255)。"head" / "strided" 模式回傳的是
+                  唯讀的映射視圖。
     """
-    # 確保資料集已下載
-    file_path = download_quickdraw_dataset(dataset_name)
+    images = open_quickdraw_memmap(dataset_name, dest_path)
     
-    if file_path is None:
+    if images is None:
         return np.array([]) # 回傳空陣列
 
-    # 載入 .npy 檔案
-    # allow_pickle=True 是載入 QuickDraw 資料集所必需的
-    images = np.load(file_path, encoding='latin1', allow_pickle=True)
-    
-    # 取前 max_items 筆資料
-    images = images[:max_items]
-    
     # 資料的數值範圍是 0-255，型別是 uint8
-    # 將 784 的向量轉換為 28x28 的圖片
-    images = images.reshape(-1, 28, 28)
+    images = images[select_quickdraw_indices(len(images), max_items, subset, seed)]
     
     print(f"成功載入 {len(images)} 張 '{dataset_name}' 圖片，形狀為: {images.shape}")
     
@@ -116,6 +535,9 @@ def load_quickdraw_images(dataset_name="fish", max_items=5000):
 
 # --- 測試用 ---
 if __name__ == '__main__':
+    # OpenCV 只用於這裡的視覺化測試，不在匯入模組時載入
+    import cv2
+
     print("--- 測試 QuickDraw 資料集載入功能 ---")
     
     # 載入魚的圖片
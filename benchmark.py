@@ -0,0 +1,1023 @@
+# 效能基準測試 (benchmark.py)
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+from model import load_ai_model, load_validation_split, predict_image, predict_images, export_tflite, MicroBatcher
+from app_utils import preprocess_images, prepare_canvas, prepare_strokes
+from fish_animation import FishTank, RENDERERS, SPRITE_MODES, clear_sprite_cache, encode_png
+
+def measure_latency(func, repeats=200, warmup=10):
+    """
+    重複執行函式並量測每次呼叫的延遲。
+
+    Args:
+        func (callable): 不帶參數的待測函式。
+        repeats (int): 量測次數。
+        warmup (int): 正式量測前的暖機次數。
+
+    Returns:
+        dict: 包含 p50 / p95 / p99 / 平均延遲 (毫秒) 的字典。
+    """
+    for _ in range(warmup):
+        func()
+
+    latencies = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        func()
+        latencies[i] = (time.perf_counter() - start) * 1000
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+    }
+
+def print_latency(name, stats):
+    """以固定格式印出延遲統計。"""
+    print(f"{name:<28} p50={stats['p50_ms']:8.3f} ms  p99={stats['p99_ms']:8.3f} ms")
+
+def bench_predict_image(repeats=200):
+    """
+    比較舊的 `model.predict` 路徑與新的推論引擎在單張圖片上的延遲 (CPU)。
+    """
+    engine = load_ai_model(backend="keras")
+    if engine is None:
+        return
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(28, 28), dtype=np.uint8)
+
+    def legacy_predict():
+        # 原本 predict_image 的作法：每次點擊都跑一次 model.predict
+        img = np.expand_dims(image.astype('float32'), axis=(0, -1))
+        return engine.model.predict(img, verbose=0)[0][0]
+
+    print("--- predict_image 單張延遲 ---")
+    print_latency("model.predict (舊)", measure_latency(legacy_predict, repeats))
+    print_latency("InferenceEngine (新)", measure_latency(lambda: predict_image(image, engine), repeats))
+
+def bench_concurrent_callers(concurrency_levels=(1, 8, 32, 128), requests_per_caller=32):
+    """
+    模擬多個 session 同時點擊「AI 魔法辨識」，比較各自跑單張推論與經過
+    MicroBatcher 合併後的吞吐量 (images/sec)。
+    """
+    engine = load_ai_model()
+    if engine is None:
+        return
+
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(64, 28, 28), dtype=np.uint8)
+
+    def run(predict, n_callers):
+        def caller(worker_id):
+            for i in range(requests_per_caller):
+                predict(images[(worker_id + i) % len(images)])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_callers) as pool:
+            list(pool.map(caller, range(n_callers)))
+        return n_callers * requests_per_caller / (time.perf_counter() - start)
+
+    print("--- 並行呼叫吞吐量 (images/sec) ---")
+    print(f"{'callers':>8} {'predict_image':>15} {'MicroBatcher':>15}")
+    for n_callers in concurrency_levels:
+        batcher = MicroBatcher(engine, max_batch_size=max(n_callers, 1), max_wait_ms=5.0)
+        single = run(lambda img: predict_image(img, engine), n_callers)
+        batched = run(batcher.predict, n_callers)
+        batcher.close()
+        print(f"{n_callers:>8} {single:>15.1f} {batched:>15.1f}")
+
+# 在全新的 Python 行程中匯入模組、載入模型並推論一次，回報冷啟動時間、
+# 最大常駐記憶體 (KB) 以及是否載入了 TensorFlow / scikit-learn
+COLD_START_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import numpy as np
+from model import load_ai_model, predict_image
+engine = load_ai_model(sys.argv[1], backend=sys.argv[2])
+predict_image(np.zeros((28, 28), dtype=np.uint8), engine)
+seconds = time.perf_counter() - start
+# ru_maxrss 在 Linux 上會從 fork 出子行程的父行程繼承，優先使用 exec 後重新計算的 VmHWM
+try:
+    with open("/proc/self/status") as f:
+        max_rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "seconds": seconds,
+    "max_rss_kb": max_rss_kb,
+    "tensorflow": "tensorflow" in sys.modules,
+    "sklearn": "sklearn" in sys.modules,
+}))
+"""
+
+def measure_cold_start(model_path, backend="numpy"):
+    """
+    在獨立行程中從匯入 `model` 到完成第一次推論，量測冷啟動成本。
+
+    Returns:
+        dict: seconds、max_rss_kb 以及 tensorflow / sklearn 是否被匯入。
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START_PROBE, model_path, backend],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def bench_numpy_backend(model_path="fish_classifier.h5", n_images=256, tolerance=1e-5):
+    """
+    檢查 NumPy 後端與 Keras 的數值一致性，並比較兩者與 TFLite 的冷啟動時間。
+    """
+    keras_engine = load_ai_model(model_path, backend="keras")
+    numpy_engine = load_ai_model(model_path, backend="numpy")
+    if keras_engine is None or numpy_engine is None:
+        return
+
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(n_images, 28, 28), dtype=np.uint8)
+    max_diff = float(np.abs(keras_engine.predict_proba(images) - numpy_engine.predict_proba(images)).max())
+    status = "通過" if max_diff <= tolerance else "失敗"
+    print(f"--- NumPy 與 Keras 數值一致性 ({n_images} 張) ---")
+    print(f"最大絕對誤差: {max_diff:.2e} (容許 {tolerance:.0e}) -> {status}")
+
+    candidates = [(model_path, "keras"), (model_path, "numpy")]
+    tflite_path = os.path.splitext(model_path)[0] + "_fp16.tflite"
+    if os.path.exists(tflite_path):
+        candidates.append((tflite_path, "tflite"))
+
+    print("--- 冷啟動 (匯入 + 載入 + 第一次推論) ---")
+    print(f"{'backend':<10} {'seconds':>10} {'RSS(MB)':>10} {'tensorflow':>12} {'sklearn':>10}")
+    for path, backend in candidates:
+        stats = measure_cold_start(path, backend)
+        print(
+            f"{backend:<10} {stats['seconds']:>10.3f} {stats['max_rss_kb'] / 1024:>10.1f} "
+            f"{str(stats['tensorflow']):>12} {str(stats['sklearn']):>10}"
+        )
+
+def bench_tflite(model_path="fish_classifier.h5", repeats=200):
+    """
+    比較 Keras 與 TFLite (float16 / int8) 後端的驗證集準確率、模型大小、
+    峰值 RSS 與單張圖片延遲。
+    """
+    paths = export_tflite(model_path)
+    if paths is None:
+        return
+    X_val, y_val = load_validation_split()
+    if X_val is None:
+        return
+
+    candidates = {"keras": model_path, **paths}
+    baseline_accuracy = None
+    print("--- Keras vs TFLite ---")
+    print(f"{'backend':<10} {'size(KB)':>10} {'RSS(MB)':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'acc':>8} {'delta':>8}")
+    for name, path in candidates.items():
+        engine = load_ai_model(path, backend="keras")
+        predictions = np.array([is_fish for is_fish, _ in predict_images(X_val, engine)])
+        accuracy = float((predictions == y_val.astype(bool)).mean())
+        if baseline_accuracy is None:
+            baseline_accuracy = accuracy
+        stats = measure_latency(lambda: predict_image(X_val[0], engine), repeats)
+        print(
+            f"{name:<10} {os.path.getsize(path) / 1024:>10.1f} {measure_cold_start(path, 'keras')['max_rss_kb'] / 1024:>10.1f} "
+            f"{stats['p50_ms']:>10.3f} {stats['p99_ms']:>10.3f} {accuracy:>8.4f} {accuracy - baseline_accuracy:>+8.4f}"
+        )
+
+def make_synthetic_sprites(n, seed=0):
+    """產生 n 張大小不一的 RGBA sprite (透明背景上的實心橢圓與線條)，模擬使用者畫的魚。"""
+    from PIL import ImageDraw
+
+    rng = np.random.default_rng(seed)
+    sprites = []
+    for _ in range(n):
+        width, height = (int(v) for v in rng.integers(60, 121, size=2))
+        sprite = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(sprite)
+        color = tuple(int(v) for v in rng.integers(0, 256, size=3)) + (255,)
+        draw.ellipse((0, height // 4, width * 3 // 4, height * 3 // 4), outline=color, width=6)
+        draw.polygon([(width * 3 // 4, height // 2), (width - 1, 0), (width - 1, height - 1)], outline=color)
+        sprites.append(sprite)
+    return sprites
+
+def make_synthetic_canvases(n, seed=0, height=400, width=560):
+    """
+    產生 n 張與 st_canvas 相同格式的 RGBA 畫布 (白色不透明背景、黑色粗筆畫的魚)，
+    位置與大小隨機，模擬使用者在畫布上的作畫。
+    """
+    from PIL import ImageDraw
+
+    rng = np.random.default_rng(seed)
+    canvases = np.empty((n, height, width, 4), dtype=np.uint8)
+    for i in range(n):
+        canvas = Image.new('RGBA', (width, height), (255, 255, 255, 255))
+        draw = ImageDraw.Draw(canvas)
+        fish_w = int(rng.integers(width // 4, width * 3 // 4))
+        fish_h = int(rng.integers(height // 5, height // 2))
+        left = int(rng.integers(0, width - fish_w))
+        top = int(rng.integers(0, height - fish_h))
+        body_right = left + fish_w * 3 // 4
+        draw.ellipse((left, top, body_right, top + fish_h), outline=(0, 0, 0, 255), width=20)
+        draw.line([(body_right, top + fish_h // 2), (left + fish_w, top), (left + fish_w, top + fish_h),
+                   (body_right, top + fish_h // 2)], fill=(0, 0, 0, 255), width=20)
+        canvases[i] = np.asarray(canvas)
+    return canvases
+
+def preprocess_image_pil(canvas_image_data):
+    """原本 preprocess_image 的 PIL 作法 (灰階 -> LANCZOS 縮小 -> 反轉)，作為比較基準。"""
+    img = Image.fromarray(canvas_image_data.astype('uint8'), 'RGBA')
+    return 255 - np.array(img.convert('L').resize((28, 28), Image.LANCZOS))
+
+def bench_preprocess(batch_sizes=(1, 16, 64), repeats=20, min_agreement=0.97):
+    """
+    比較 PIL 逐張前處理與 NumPy 批次前處理 (面積平均) 的速度，
+    並檢查兩者送進模型後的預測是否一致。
+
+    面積平均比 LANCZOS 模糊一些，筆畫邊緣的像素會有差異，
+    因此以「是不是魚」的判斷一致率作為通過標準，信心值差異僅供參考。
+    """
+    print("--- 畫布前處理 (每張毫秒) ---")
+    print(f"{'batch':>6} {'PIL 逐張':>12} {'NumPy 批次':>12} {'NumPy+裁切':>12}")
+    for batch_size in batch_sizes:
+        canvases = make_synthetic_canvases(batch_size, seed=batch_size)
+        pil = measure_latency(lambda: [preprocess_image_pil(c) for c in canvases], repeats, warmup=2)
+        vectorized = measure_latency(lambda: preprocess_images(canvases), repeats, warmup=2)
+        cropped = measure_latency(lambda: preprocess_images(canvases, crop_to_ink=True), repeats, warmup=2)
+        print(
+            f"{batch_size:>6} {pil['p50_ms'] / batch_size:>12.3f} {vectorized['p50_ms'] / batch_size:>12.3f} "
+            f"{cropped['p50_ms'] / batch_size:>12.3f}"
+        )
+
+    engine = load_ai_model()
+    if engine is None:
+        return
+    canvases = make_synthetic_canvases(256, seed=1)
+    legacy = np.stack([preprocess_image_pil(c) for c in canvases])
+    current = preprocess_images(canvases)
+    pixel_diff = np.abs(legacy.astype(np.int16) - current).astype(np.float32)
+    legacy_proba = engine.predict_proba(legacy)
+    current_proba = engine.predict_proba(current)
+    proba_diff = np.abs(legacy_proba - current_proba)
+    agreement = float(((legacy_proba > 0.5) == (current_proba > 0.5)).mean())
+    status = "通過" if agreement >= min_agreement else "失敗"
+    print(f"--- PIL 與 NumPy 前處理的一致性 ({len(canvases)} 張) ---")
+    print(f"像素平均差 {pixel_diff.mean():.2f} / 最大差 {pixel_diff.max():.0f} (0-255)")
+    print(f"信心值平均差 {proba_diff.mean():.4f} / 最大差 {proba_diff.max():.4f}")
+    print(f"判斷結果一致率 {agreement:.2%} (需 >= {min_agreement:.0%}) -> {status}")
+
+def make_synthetic_strokes(n, seed=0, height=400, width=560, samples=40):
+    """
+    產生 n 份 st_canvas 格式的 freedraw 筆畫 JSON (魚身的橢圓與三角形尾巴)，
+    以及同樣筆畫畫在白色畫布上的 RGBA 圖片，模擬同一次作畫的兩種輸出。
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    drawings, canvases = [], np.empty((n, height, width, 4), dtype=np.uint8)
+    for i in range(n):
+        fish_w = int(rng.integers(width // 4, width * 3 // 4))
+        fish_h = int(rng.integers(height // 5, height // 2))
+        left = int(rng.integers(20, width - fish_w - 20))
+        top = int(rng.integers(20, height - fish_h - 20))
+        body_w = fish_w * 3 // 4
+        t = np.linspace(0, 2 * np.pi, samples) + rng.normal(0, 0.02, samples)
+        body = np.stack([left + body_w / 2 * (1 + np.cos(t)), top + fish_h / 2 * (1 + np.sin(t))], axis=1)
+        tail = np.array([[left + body_w, top + fish_h / 2], [left + fish_w, top],
+                         [left + fish_w, top + fish_h], [left + body_w, top + fish_h / 2]], dtype=np.float64)
+        # freedraw 的路徑格式：M 起點，Q (控制點 = 取樣點，端點 = 相鄰取樣點的中點)，L 終點
+        paths = []
+        for points in (body, tail):
+            points = points.round(1)
+            mid = (points[:-1] + points[1:]) / 2
+            path = [["M", *points[0]]] + [["Q", *p, *m] for p, m in zip(points[1:-1], mid[1:])] + [["L", *points[-1]]]
+            paths.append({"type": "path", "path": [[c, *map(float, v)] for c, *v in path],
+                          "stroke": "#000000", "strokeWidth": 20})
+        drawings.append({"version": "4.4.0", "objects": paths, "background": "#FFFFFF"})
+
+        canvas = np.full((height, width, 4), 255, dtype=np.uint8)
+        for points in (body, tail):
+            cv2.polylines(canvas, [points.round().astype(np.int32)], False, (0, 0, 0, 255), thickness=20,
+                          lineType=cv2.LINE_AA)
+        canvases[i] = canvas
+    return drawings, canvases
+
+def bench_strokes(n_drawings=64, repeats=50):
+    """
+    比較點陣圖輸入 (整張 RGBA 畫布) 與筆畫輸入 (json_data) 的傳輸大小與前處理時間，
+    並確認 simplified ndjson 載入器與服務端畫出的圖片相同。
+    """
+    import tempfile
+    from app_utils import canvas_strokes, iter_quickdraw_strokes, rasterize_strokes
+
+    drawings, canvases = make_synthetic_strokes(n_drawings, seed=3)
+    json_sizes = np.array([len(json.dumps(d, separators=(",", ":"))) for d in drawings])
+    print(f"--- 畫布 -> 模型輸入的傳輸大小 ({n_drawings} 張) ---")
+    print(f"RGBA 點陣圖: {canvases[0].nbytes / 1024:.1f} KB；筆畫 JSON: 平均 {json_sizes.mean() / 1024:.2f} KB "
+          f"(最大 {json_sizes.max() / 1024:.2f} KB，約 {canvases[0].nbytes / json_sizes.mean():.0f} 倍)")
+
+    print("--- 前處理 (每張) ---")
+    print(f"{'':<28} {'p50(ms)':>10} {'p99(ms)':>10} {'peak(KB)':>10}")
+    canvas, drawing = canvases[0], drawings[0]
+    for name, func in [
+        ("點陣圖: 模型輸入", lambda: preprocess_images(canvas)),
+        ("筆畫: 模型輸入", lambda: rasterize_strokes(canvas_strokes(drawing))),
+        ("點陣圖: 模型輸入 + sprite", lambda: prepare_canvas(canvas)),
+        ("筆畫: 模型輸入 + sprite", lambda: prepare_strokes(drawing)),
+    ]:
+        stats = measure_latency(func, repeats, warmup=2)
+        print(f"{name:<28} {stats['p50_ms']:>10.3f} {stats['p99_ms']:>10.3f} {measure_peak_allocation(func):>10.1f}")
+
+    # 訓練用的 ndjson 載入器必須與服務端畫出相同的圖片：把筆畫轉成 simplified 格式 (0-255 的整數) 再讀回
+    served = np.stack([rasterize_strokes(canvas_strokes(d)) for d in drawings])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "fish.ndjson")
+        with open(path, "w", encoding="utf-8") as f:
+            for strokes in map(canvas_strokes, drawings):
+                all_points = np.concatenate([s["points"] for s in strokes])
+                origin, extent = all_points.min(axis=0), (all_points.max(axis=0) - all_points.min(axis=0)).max()
+                drawing = [np.round((s["points"] - origin) * 255 / extent).astype(int).T.tolist() for s in strokes]
+                f.write(json.dumps({"word": "fish", "recognized": True, "drawing": drawing}) + "\n")
+        loaded = np.concatenate(list(iter_quickdraw_strokes(path, chunk_size=16)))
+    pixel_diff = np.abs(served.astype(np.int16) - loaded)
+    print(f"ndjson 載入器與服務端的像素差: 平均 {pixel_diff.mean():.2f} / 最大 {pixel_diff.max()} (0-255，來自座標取整)")
+
+    engine = load_ai_model()
+    if engine is not None:
+        agreement = float(((engine.predict_proba(preprocess_images(canvases)) > 0.5)
+                           == (engine.predict_proba(served) > 0.5)).mean())
+        print(f"點陣圖與筆畫輸入的判斷一致率: {agreement:.2%}")
+
+def crop_and_prepare_sprite_legacy(image_data):
+    """原本 app.crop_and_prepare_sprite 的作法 (argwhere 找邊界、全尺寸去白後才縮小)，作為比較基準。"""
+    if np.all(image_data[:, :, 3] == 0):
+        return None
+    coords = np.argwhere(image_data[:, :, 3] > 0)
+    y_min, x_min = coords.min(axis=0)
+    y_max, x_max = coords.max(axis=0)
+    pixels = image_data[y_min:y_max+1, x_min:x_max+1].copy()
+    is_white = (pixels[:, :, 0] > 245) & (pixels[:, :, 1] > 245) & (pixels[:, :, 2] > 245)
+    pixels[is_white, 3] = 0
+    sprite = Image.fromarray(pixels, 'RGBA')
+    sprite.thumbnail((120, 120), Image.Resampling.LANCZOS)
+    return sprite
+
+def measure_peak_allocation(func):
+    """以 tracemalloc 量測單次呼叫期間的峰值記憶體配置 (KB，包含 NumPy 陣列)。"""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+def bench_sprite(n_canvases=32, repeats=20):
+    """
+    比較「PIL 前處理 + 舊的 sprite 擷取」與一次掃描完成兩者的 `prepare_canvas`，
+    回報每次呼叫的延遲與峰值記憶體配置。
+    """
+    canvases = make_synthetic_canvases(n_canvases, seed=2)
+    canvas = canvases[0]
+
+    def legacy():
+        return preprocess_image_pil(canvas), crop_and_prepare_sprite_legacy(canvas)
+
+    print("--- 畫布 -> 模型輸入 + sprite (每次呼叫) ---")
+    print(f"{'':<24} {'p50(ms)':>10} {'p99(ms)':>10} {'peak(KB)':>10}")
+    for name, func in [("PIL + argwhere (舊)", legacy), ("prepare_canvas (新)", lambda: prepare_canvas(canvas))]:
+        stats = measure_latency(func, repeats, warmup=2)
+        print(f"{name:<24} {stats['p50_ms']:>10.3f} {stats['p99_ms']:>10.3f} {measure_peak_allocation(func):>10.1f}")
+
+    # 模型輸入必須與批次前處理一致
+    batch = preprocess_images(canvases)
+    mismatched = sum(not np.array_equal(prepare_canvas(c)[0], batch[i]) for i, c in enumerate(canvases))
+    print(f"與 preprocess_images 不一致的模型輸入: {mismatched} / {len(canvases)} 張")
+    # 畫布背景是不透明的白色，舊作法以 alpha 找邊界框會框住整張畫布；新作法只框住筆跡
+    legacy_sizes = np.array([crop_and_prepare_sprite_legacy(c).size for c in canvases])
+    current_sizes = np.array([prepare_canvas(c)[1].size for c in canvases])
+    print(f"sprite 平均尺寸 (寬 x 高): 舊 {legacy_sizes.mean(axis=0).round(1)}，新 {current_sizes.mean(axis=0).round(1)}")
+
+def bench_render(fish_counts=(10, 100, 1000), repeats=5):
+    """
+    量測 `FishTank.render_as_html` 在不同魚數下的耗時。
+
+    "uncached" 是清空所有快取後的渲染，等同過去每次 rerun 都重新編碼兩張 PNG
+    的成本；"cached" 是之後的 rerun，所有 sprite 都已編碼過。
+    """
+    print("--- render_as_html 耗時 (ms) ---")
+    print(f"{'fish':>6} {'uncached':>12} {'cached':>12} {'HTML(KB)':>12}")
+    for n_fish in fish_counts:
+        tank = FishTank(width=560, height=560, max_fish=None, max_sprite_bytes=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for sprite in make_synthetic_sprites(n_fish, seed=n_fish):
+                tank.add_fish(sprite)
+
+        clear_sprite_cache()
+        start = time.perf_counter()
+        html = tank.render_as_html()
+        uncached_ms = (time.perf_counter() - start) * 1000
+
+        cached = measure_latency(tank.render_as_html, repeats=repeats, warmup=1)
+        print(f"{n_fish:>6} {uncached_ms:>12.1f} {cached['p50_ms']:>12.2f} {len(html) / 1024:>12.1f}")
+
+def bench_tank_memory(fish_counts=(100, 300, 1000, 2000), max_fish=300):
+    """
+    以 tracemalloc 量測一個 session 的魚缸在持續新增魚 (並渲染) 後佔用的記憶體，
+    比較不設上限與設定 max_fish 時的成長情形。
+    """
+    import tracemalloc
+
+    sprites = make_synthetic_sprites(max(fish_counts), seed=3)
+    # 先完整跑一次，避免把模組層級的一次性配置 (PNG 編碼器等) 算進第一筆結果
+    warmup = FishTank(width=560, height=560)
+    with contextlib.redirect_stdout(io.StringIO()):
+        warmup.add_fish(sprites[0])
+    warmup.render_as_html()
+
+    print("--- 每個 session 魚缸佔用的記憶體 (KB) ---")
+    print(f"{'fish':>6} {'不設上限':>12} {f'max_fish={max_fish}':>14}")
+    for n_fish in fish_counts:
+        row = []
+        for limit in (None, max_fish):
+            tracemalloc.start()
+            tank = FishTank(width=560, height=560, max_fish=limit, max_sprite_bytes=None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for sprite in sprites[:n_fish]:
+                    tank.add_fish(sprite)
+            tank.render_as_html()
+            row.append(tracemalloc.get_traced_memory()[0] / 1024)
+            tracemalloc.stop()
+            del tank
+        print(f"{n_fish:>6} {row[0]:>12.1f} {row[1]:>14.1f}")
+
+def bench_physics(fish_counts=(1000, 10000, 100000), n_steps=100, unique_sprites=20):
+    """
+    量測伺服器端 `FishTank.step` 在不同魚數下每一步的耗時。
+    """
+    sprites = [(encode_png(sprite), *sprite.size) for sprite in make_synthetic_sprites(unique_sprites)]
+    print("--- FishTank.step 每步耗時 ---")
+    print(f"{'fish':>8} {'ms/step':>10} {'fish-steps/sec':>16}")
+    for n_fish in fish_counts:
+        tank = FishTank(width=560, height=560, max_fish=None, max_sprite_bytes=None, seed=0)
+        for i in range(n_fish):
+            tank.add_encoded_fish(*sprites[i % unique_sprites])
+        tank.step(n_steps=5)
+        start = time.perf_counter()
+        tank.step(n_steps=n_steps)
+        ms_per_step = (time.perf_counter() - start) * 1000 / n_steps
+        print(f"{n_fish:>8} {ms_per_step:>10.3f} {n_fish / ms_per_step * 1000:>16.3e}")
+
+def bench_store(writer_counts=(1, 4, 16), fish_per_writer=50, db_path="bench_tank.db"):
+    """
+    量測共用魚缸儲存區在多個 session 同時新增魚時的吞吐量，
+    以及 session 同步 (有新魚 / 沒有變動) 的延遲。
+    """
+    from tank_store import TankStore
+
+    sprites = [(encode_png(sprite), *sprite.size) for sprite in make_synthetic_sprites(20, seed=4)]
+
+    def remove_db():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    print("--- 共用魚缸：多個 session 同時新增 ---")
+    print(f"{'writers':>8} {'fish/sec':>10} {'stored':>8}")
+    for n_writers in writer_counts:
+        remove_db()
+        store = TankStore(db_path, max_fish=300, max_sprite_bytes=None)
+
+        def writer(worker_id):
+            for i in range(fish_per_writer):
+                png, width, height = sprites[(worker_id + i) % len(sprites)]
+                store.add_fish(png, width, height, (0, 0), (1, 0))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_writers) as pool:
+            list(pool.map(writer, range(n_writers)))
+        rate = n_writers * fish_per_writer / (time.perf_counter() - start)
+        print(f"{n_writers:>8} {rate:>10.1f} {store.count():>8}")
+
+    # 一個 session 的魚缸同步：第一次載入全部、之後沒有變動、有一隻新魚
+    tank = FishTank(width=560, height=560, store=store)
+    start = time.perf_counter()
+    tank.sync()
+    first_ms = (time.perf_counter() - start) * 1000
+    idle = measure_latency(tank.sync, repeats=200)
+
+    def sync_with_new_fish():
+        store.add_fish(*sprites[0], (0, 0), (1, 0))
+        with contextlib.redirect_stdout(io.StringIO()):
+            tank.sync()
+
+    print("--- FishTank.sync 延遲 ---")
+    print(f"{'第一次載入 (' + str(len(tank.fishes)) + ' 隻)':<28} {first_ms:8.3f} ms")
+    print_latency("沒有變動 (快取)", idle)
+    print_latency("新增一隻後 (含寫入)", measure_latency(sync_with_new_fish, repeats=50))
+    remove_db()
+
+# 附加在輸出頁面上的量測腳本：把 first-contentful-paint 寫進標題與 console
+PAINT_PROBE = """
+<script>
+new PerformanceObserver((list) => {
+    for (const entry of list.getEntries()) {
+        if (entry.name === 'first-contentful-paint') {
+            document.title = `FCP ${entry.startTime.toFixed(1)} ms`;
+            console.log(document.title);
+        }
+    }
+}).observe({ type: 'paint', buffered: true });
+</script>
+"""
+
+def bench_payload(fish_counts=(10, 100, 1000), pages_dir=None):
+    """
+    比較各種 sprite 模式送到瀏覽器的 HTML 大小。
+
+    指定 pages_dir 時會另外輸出附有 first-contentful-paint 量測腳本的頁面，
+    以瀏覽器 (或 headless Chrome) 開啟後即可在標題列讀到首次繪製時間。
+    """
+    print("--- render_as_html 輸出大小 (KB) ---")
+    print(f"{'fish':>6} " + " ".join(f"{mode:>10}" for mode in SPRITE_MODES))
+    for n_fish in fish_counts:
+        sprites = make_synthetic_sprites(n_fish, seed=n_fish)
+        sizes = []
+        for mode in SPRITE_MODES:
+            tank = FishTank(width=560, height=560, sprite_mode=mode, max_fish=None, max_sprite_bytes=None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for sprite in sprites:
+                    tank.add_fish(sprite)
+            html = tank.render_as_html()
+            sizes.append(len(html.encode()))
+            if pages_dir:
+                os.makedirs(pages_dir, exist_ok=True)
+                with open(os.path.join(pages_dir, f"tank_{mode}_{n_fish}.html"), "w", encoding="utf-8") as f:
+                    f.write(PAINT_PROBE + html)
+        print(f"{n_fish:>6} " + " ".join(f"{size / 1024:>10.1f}" for size in sizes))
+
+def bench_delta(fish_counts=(10, 100, 1000), repeats=20):
+    """
+    比較每次互動 (新增一隻魚後 rerun) 傳給瀏覽器的資料量與產生時間：
+    `components.html` 每次送出整個魚缸，自訂元件只送出新魚的差異。
+    """
+    sprites = make_synthetic_sprites(max(fish_counts) + 1, seed=5)
+    print("--- 每次互動傳給瀏覽器的資料 ---")
+    print(f"{'fish':>6} {'完整 HTML(KB)':>14} {'差異(KB)':>10} {'完整(ms)':>10} {'差異(ms)':>10}")
+    for n_fish in fish_counts:
+        tank = FishTank(width=560, height=560, max_fish=None, max_sprite_bytes=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for sprite in sprites[:n_fish]:
+                tank.add_fish(sprite)
+            tank.render_as_html()
+            version = tank.delta_since(0)["version"]
+            tank.add_fish(sprites[n_fish])
+
+        full_html = tank.render_as_html()
+        delta_json = json.dumps(tank.delta_since(version))
+        full = measure_latency(tank.render_as_html, repeats, warmup=1)
+        delta = measure_latency(lambda: json.dumps(tank.delta_since(version)), repeats, warmup=1)
+        print(
+            f"{n_fish + 1:>6} {len(full_html.encode()) / 1024:>14.1f} {len(delta_json.encode()) / 1024:>10.2f} "
+            f"{full['p50_ms']:>10.3f} {delta['p50_ms']:>10.3f}"
+        )
+
+# 附加在輸出頁面上的 FPS 量測腳本：暖機 1 秒後計算 5 秒內 requestAnimationFrame 的次數
+FPS_PROBE = """
+<script>
+(function () {
+    let frames = 0, start = null;
+    function tick(now) {
+        if (start === null) {
+            if (now < 1000) { requestAnimationFrame(tick); return; }
+            start = now;
+        }
+        frames++;
+        if (now - start < 5000) {
+            requestAnimationFrame(tick);
+        } else {
+            const fps = frames * 1000 / (now - start);
+            document.title = `FPS ${fps.toFixed(1)}`;
+            const result = document.createElement('pre');
+            result.id = 'fps-result';
+            result.textContent = JSON.stringify({ fps });
+            document.body.appendChild(result);
+        }
+    }
+    requestAnimationFrame(tick);
+})();
+</script>
+"""
+
+def find_headless_browser():
+    """尋找可用於 headless 量測的 Chrome / Chromium 執行檔。"""
+    for name in ("chromium", "chromium-browser", "google-chrome", "google-chrome-stable"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def bench_fps(fish_counts=(100, 500, 1000, 2000, 5000), pages_dir="bench_pages", unique_sprites=20):
+    """
+    輸出 DOM 與 canvas 兩種繪製方式在不同魚數下的 FPS 量測頁面。
+
+    找得到 Chrome / Chromium 時會以 headless 模式開啟每個頁面並讀回 FPS；
+    否則只輸出頁面，可手動以瀏覽器開啟並在標題列讀到結果。
+    """
+    os.makedirs(pages_dir, exist_ok=True)
+    browser = find_headless_browser()
+    sprites = make_synthetic_sprites(unique_sprites)
+
+    print("--- 瀏覽器端 FPS ---")
+    print(f"{'fish':>6} " + " ".join(f"{renderer:>10}" for renderer in RENDERERS))
+    for n_fish in fish_counts:
+        results = []
+        for renderer in RENDERERS:
+            tank = FishTank(width=560, height=560, renderer=renderer, max_fish=None, max_sprite_bytes=None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(n_fish):
+                    tank.add_fish(sprites[i % unique_sprites])
+            page_path = os.path.abspath(os.path.join(pages_dir, f"fps_{renderer}_{n_fish}.html"))
+            with open(page_path, "w", encoding="utf-8") as f:
+                f.write(tank.render_as_html() + FPS_PROBE)
+
+            fps = None
+            if browser:
+                result = subprocess.run(
+                    [browser, "--headless=new", "--disable-gpu", "--timeout=8000", "--dump-dom", f"file://{page_path}"],
+                    capture_output=True, text=True,
+                )
+                match = re.search(r'<pre id="fps-result">(.*?)</pre>', result.stdout)
+                if match:
+                    fps = json.loads(match.group(1))["fps"]
+            results.append(f"{fps:>10.1f}" if fps is not None else f"{'-':>10}")
+        print(f"{n_fish:>6} " + " ".join(results))
+
+    if browser is None:
+        print(f"找不到 headless 瀏覽器，請以瀏覽器開啟 '{pages_dir}' 中的頁面並讀取標題列的 FPS。")
+
+def bench_metrics(calls=200000):
+    """
+    量測 `metrics.timed` 裝飾器在關閉與開啟時，每次呼叫額外增加的成本 (奈秒)。
+    """
+    import metrics
+
+    def noop():
+        return None
+
+    decorated = metrics.timed("benchmark.noop")(noop)
+
+    def per_call_ns(func):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        return (time.perf_counter() - start) * 1e9 / calls
+
+    was_enabled = metrics.is_enabled()
+    baseline = per_call_ns(noop)
+    metrics.enable(False)
+    disabled = per_call_ns(decorated)
+    metrics.enable(True)
+    enabled = per_call_ns(decorated)
+    metrics.enable(was_enabled)
+
+    print("--- metrics.timed 每次呼叫的額外成本 ---")
+    print(f"未裝飾的函式: {baseline:8.1f} ns")
+    print(f"關閉時:       {disabled:8.1f} ns (+{disabled - baseline:.1f} ns)")
+    print(f"開啟時:       {enabled:8.1f} ns (+{enabled - baseline:.1f} ns)")
+    stats = metrics.snapshot()["benchmark.noop"]
+    print(f"記錄了 {stats['count']} 次，估計 p50 {stats['p50_ms'] * 1000:.2f} us")
+    metrics.reset()
+
+# 要比較的訓練設定：名稱與傳給 `python model.py` 的額外參數
+TRAINING_CONFIGS = (
+    ("預設", []),
+    ("快速", ["--fast"]),
+    ("快速 + XLA", ["--fast", "--jit"]),
+)
+
+def bench_training(max_items=5000, epochs=3, configs=TRAINING_CONFIGS):
+    """
+    在獨立行程中以相同資料分別用預設與快速設定訓練，比較總耗時、
+    穩定後 (第一個週期之後) 的 images/sec 與最終驗證準確率。
+
+    執行緒數與混合精度必須在 TensorFlow 初始化前設定，因此每個設定各用一個行程。
+    """
+    import tempfile
+
+    print(f"--- 訓練設定比較 (每類別最多 {max_items} 張，{epochs} 個週期) ---")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, extra_args in configs:
+            report_path = os.path.join(tmp_dir, "report.json")
+            subprocess.run(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.py"),
+                 "--max-items", str(max_items), "--epochs", str(epochs),
+                 "--model-path", os.path.join(tmp_dir, "model.h5"), "--report", report_path] + extra_args,
+                capture_output=True, text=True, check=True,
+            )
+            with open(report_path, encoding="utf-8") as f:
+                results[name] = json.load(f)
+
+    baseline = next(iter(results.values()))
+    print(f"{'設定':<12} {'批次':>6} {'bf16':>6} {'XLA':>6} {'總耗時(s)':>10} {'images/sec':>11} {'加速':>7} {'驗證準確率':>10}")
+    for name, summary in results.items():
+        steady = summary["epoch_images_per_sec"][1:] or summary["epoch_images_per_sec"]
+        print(f"{name:<12} {summary['batch_size']:>6} {str(summary['mixed_precision']):>6} "
+              f"{str(summary['jit_compile']):>6} {summary['seconds']:>10.1f} {np.mean(steady):>11.0f} "
+              f"{baseline['seconds'] / summary['seconds']:>6.2f}x {summary['val_accuracy']:>10.4f}")
+    return results
+
+def load_training_arrays_legacy(max_items=10000, seed=42):
+    """原本 train_and_save_model 的資料準備 (合併、轉為 float32、增加維度、切分)，作為比較基準。"""
+    from app_utils import load_quickdraw_images
+
+    fish_images = load_quickdraw_images("fish", max_items=max_items)
+    cat_images = load_quickdraw_images("cat", max_items=max_items)
+    X = np.concatenate((fish_images, cat_images), axis=0)
+    y = np.concatenate((np.ones(len(fish_images)), np.zeros(len(cat_images))), axis=0)
+    X = np.expand_dims(X.astype('float32') / 255.0, axis=-1)
+    order = np.random.default_rng(seed).permutation(len(X))
+    n_val = int(round(len(X) * 0.2))
+    return X[order[n_val:]], X[order[:n_val]], y[order[n_val:]], y[order[:n_val]]
+
+def bench_dataset(max_items=10000):
+    """
+    比較每次訓練前重新準備 float32 陣列，與切分好的 uint8 資料集快取的耗時與峰值記憶體配置。
+    """
+    import tempfile
+    from model import build_split_cache, load_split
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        stages = {
+            "舊版 (float32 陣列)": lambda: load_training_arrays_legacy(max_items),
+            "快取 (第一次建立)": lambda: build_split_cache(max_items=max_items, cache_dir=cache_dir, rebuild=True),
+            "快取 (之後的執行)": lambda: (load_split("train", max_items=max_items, cache_dir=cache_dir),
+                                         load_split("val", max_items=max_items, cache_dir=cache_dir)),
+        }
+        print(f"--- 訓練資料準備 (每類別最多 {max_items} 張) ---")
+        print(f"{'方式':<20} {'秒數':>8} {'峰值(MB)':>10}")
+        for name, func in stages.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                func()
+                seconds = time.perf_counter() - start
+                peak_kb = measure_peak_allocation(func)
+            print(f"{name:<20} {seconds:>8.3f} {peak_kb / 1024:>10.1f}")
+
+# 輕量化架構的比較：(名稱, model.py 的額外參數)；學生模型以同一次比較中的 cnn 作為教師
+VARIANT_CONFIGS = (
+    ("cnn", ["--architecture", "cnn"]),
+    ("gap", ["--architecture", "gap"]),
+    ("separable", ["--architecture", "separable"]),
+    ("student", ["--architecture", "separable", "--distill-from", "{cnn}"]),
+)
+
+def bench_variants(max_items=10000, epochs=5, output_dir="variants", batch_size=256, repeats=200,
+                   configs=VARIANT_CONFIGS):
+    """
+    比較各種架構的檔案大小、參數量、單張延遲、批次吞吐量與驗證準確率。
+
+    尚未訓練的架構會以相同資料在獨立行程中訓練並存到 output_dir，之後直接沿用；
+    延遲與吞吐量以服務時預設的 NumPy 後端量測。
+    """
+    from model import NumpyEngine
+
+    X_val, y_val = load_validation_split(max_items=max_items)
+    if X_val is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f"{name}.h5") for name, _ in configs}
+
+    for name, extra_args in configs:
+        if os.path.exists(paths[name]):
+            continue
+        print(f"訓練 {name} ...")
+        subprocess.run(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.py"),
+             "--max-items", str(max_items), "--epochs", str(epochs), "--model-path", paths[name]]
+            + [arg.format(**paths) for arg in extra_args],
+            capture_output=True, text=True, check=True,
+        )
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(1, 28, 28), dtype=np.uint8)
+    batch = rng.integers(0, 256, size=(batch_size, 28, 28), dtype=np.uint8)
+
+    print(f"--- 輕量化架構比較 (驗證集 {len(X_val)} 張，批次 {batch_size}) ---")
+    print(f"{'架構':<10} {'h5(KB)':>8} {'npz(KB)':>8} {'參數量':>8} {'單張p50(ms)':>12} {'images/sec':>11} {'驗證準確率':>10}")
+    results = {}
+    for name, _ in configs:
+        engine = NumpyEngine(paths[name])
+        batch_stats = measure_latency(lambda: engine.predict_proba(batch), max(repeats // 10, 5), warmup=2)
+        probs = np.concatenate([engine.predict_proba(X_val[i:i + 1024]) for i in range(0, len(X_val), 1024)])
+        results[name] = {
+            "h5_kb": os.path.getsize(paths[name]) / 1024,
+            "npz_kb": os.path.getsize(os.path.splitext(paths[name])[0] + ".npz") / 1024,
+            "params": sum(weights.size for _, layer in engine.layers for weights in layer),
+            "p50_ms": measure_latency(lambda: engine.predict_proba(image), repeats)["p50_ms"],
+            "images_per_sec": batch_size / (batch_stats["p50_ms"] / 1000),
+            "val_accuracy": float(((probs > 0.5) == y_val).mean()),
+        }
+        r = results[name]
+        print(f"{name:<10} {r['h5_kb']:>8.1f} {r['npz_kb']:>8.1f} {r['params']:>8} {r['p50_ms']:>12.3f} "
+              f"{r['images_per_sec']:>11.0f} {r['val_accuracy']:>10.4f}")
+    return results
+
+def measure_stage(func, repeats=50, warmup=3, items_per_call=1):
+    """
+    量測一個流程階段：延遲百分位數、吞吐量 (每秒處理的項目數) 與單次呼叫的峰值記憶體配置。
+    """
+    stats = measure_latency(func, repeats, warmup)
+    stats["throughput_per_s"] = items_per_call * 1000 / stats["mean_ms"] if stats["mean_ms"] > 0 else None
+    stats["peak_kb"] = measure_peak_allocation(func)
+    return stats
+
+def bench_suite(repeats=50, model_path="fish_classifier.h5"):
+    """
+    畫圖 -> 辨識 -> 放進魚缸的端對端基準測試，完全離線：
+    畫布是合成的筆畫，QuickDraw 資料集是暫存資料夾中的合成 .npy 檔。
+
+    Returns:
+        dict: 每個階段的統計 (見 `measure_stage`)，以及執行環境的資訊。
+    """
+    import platform
+    import tempfile
+    from app_utils import preprocess_image, load_quickdraw_images
+
+    canvases = make_synthetic_canvases(16, seed=6)
+    canvas = canvases[0]
+    sprite = prepare_canvas(canvas)[1]
+    stages = {}
+
+    stages["preprocess_image"] = measure_stage(lambda: preprocess_image(canvas), repeats)
+    stages["preprocess_images_x16"] = measure_stage(lambda: preprocess_images(canvases), repeats, items_per_call=16)
+    stages["prepare_canvas"] = measure_stage(lambda: prepare_canvas(canvas), repeats)
+
+    engine = load_ai_model(model_path) if os.path.exists(model_path) else None
+    if engine is not None:
+        image = preprocess_image(canvas)
+        stages["predict_image"] = measure_stage(lambda: predict_image(image, engine), repeats)
+        batch = preprocess_images(canvases)
+        stages["predict_images_x16"] = measure_stage(lambda: predict_images(batch, engine), repeats, items_per_call=16)
+        cold = [measure_cold_start(model_path) for _ in range(3)]
+        stages["load_ai_model_cold"] = {
+            "p50_ms": float(np.median([c["seconds"] for c in cold]) * 1000),
+            "max_rss_kb": max(c["max_rss_kb"] for c in cold),
+        }
+    else:
+        print(f"找不到模型 '{model_path}'，略過推論相關的階段。")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tank = FishTank(width=560, height=560)
+        stages["add_fish"] = measure_stage(lambda: tank.add_fish(sprite), repeats)
+        tank = FishTank(width=560, height=560)
+        for s in make_synthetic_sprites(100, seed=6):
+            tank.add_fish(s)
+        stages["render_as_html_100"] = measure_stage(tank.render_as_html, repeats)
+        stages["delta_since_100"] = measure_stage(lambda: tank.delta_since(99), repeats)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            rng = np.random.default_rng(6)
+            np.save(os.path.join(data_dir, "fish.npy"), rng.integers(0, 256, size=(20000, 784), dtype=np.uint8))
+            stages["load_quickdraw_images_5000"] = measure_stage(
+                lambda: load_quickdraw_images("fish", 5000, subset="random", dest_path=data_dir),
+                repeats=max(repeats // 5, 3), items_per_call=5000,
+            )
+
+        if engine is not None:
+            # 使用者按下按鈕後的完整流程：一次掃描畫布 -> 推論 -> 放進魚缸 -> 產生給瀏覽器的差異
+            pipeline_tank = FishTank(width=560, height=560)
+
+            def pipeline():
+                img, fish_sprite = prepare_canvas(canvas)
+                is_fish, _ = predict_image(img, engine)
+                pipeline_tank.add_fish(fish_sprite)
+                return pipeline_tank.delta_since(pipeline_tank.fishes[-1].fish_id - 1)
+
+            stages["end_to_end"] = measure_stage(pipeline, repeats)
+
+    print("--- 端對端基準測試 ---")
+    print(f"{'stage':<28} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'items/s':>10} {'peak(KB)':>10}")
+    for name, stats in stages.items():
+        if "p95_ms" not in stats:
+            print(f"{name:<28} {stats['p50_ms']:>9.1f} {'':>9} {'':>9} {'':>10} {stats['max_rss_kb']:>10} (RSS)")
+            continue
+        print(
+            f"{name:<28} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+            f"{stats['throughput_per_s']:>10.1f} {stats['peak_kb']:>10.1f}"
+        )
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "stages": stages,
+    }
+
+# 比較時檢查的指標：延遲與記憶體都是越小越好 (p99 在重複次數不多時波動很大，只列出不比較)
+REGRESSION_METRICS = ("p50_ms", "peak_kb", "max_rss_kb")
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    比較兩次 `bench_suite` 的結果，列出增加幅度超過 threshold 的指標。
+
+    Args:
+        baseline (dict): 作為基準的結果 (例如前一個 commit 存下的 JSON)。
+        current (dict): 這次的結果。
+        threshold (float): 容許的相對增加幅度 (0.1 = 10%)。
+
+    Returns:
+        list: 退步的 (階段, 指標, 基準值, 目前值) 列表。
+    """
+    regressions = []
+    for stage, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            if metric in stats and base.get(metric):
+                if stats[metric] > base[metric] * (1 + threshold):
+                    regressions.append((stage, metric, base[metric], stats[metric]))
+
+    print(f"--- 與基準 ({baseline.get('commit')}) 比較，門檻 +{threshold:.0%} ---")
+    for stage, metric, before, after in regressions:
+        print(f"退步: {stage} {metric} {before:.3f} -> {after:.3f} ({after / before - 1:+.1%})")
+    if not regressions:
+        print("沒有超過門檻的退步。")
+    return regressions
+
+BENCHMARKS = {
+    "predict": bench_predict_image,
+    "preprocess": bench_preprocess,
+    "sprite": bench_sprite,
+    "strokes": bench_strokes,
+    "batch": bench_concurrent_callers,
+    "tflite": bench_tflite,
+    "numpy": bench_numpy_backend,
+    "render": bench_render,
+    "memory": bench_tank_memory,
+    "physics": bench_physics,
+    "store": bench_store,
+    "payload": bench_payload,
+    "delta": bench_delta,
+    "metrics": bench_metrics,
+    "train": bench_training,
+    "dataset": bench_dataset,
+    "variants": bench_variants,
+    "fps": bench_fps,
+    "suite": bench_suite,
+}
+
+# --- 測試用 ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="執行效能基準測試")
+    parser.add_argument("names", nargs="*", help=f"要執行的測試，可選 {', '.join(BENCHMARKS)} (預設全部)")
+    parser.add_argument("--save", help="將 suite 的結果存成 JSON 檔")
+    parser.add_argument("--compare", help="與先前存下的 suite 結果 JSON 比較，有退步時以狀態碼 1 結束")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退步的相對增加幅度 (預設 0.1 = 10%%)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"未知的測試: {', '.join(sorted(unknown))}")
+    names = args.names or list(BENCHMARKS)
+    if (args.save or args.compare) and "suite" not in names:
+        parser.error("--save / --compare 只適用於 suite")
+
+    results = None
+    for name in names:
+        if name == "suite":
+            results = bench_suite()
+        else:
+            BENCHMARKS[name]()
+
+    if results is not None and args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"結果已儲存至 {args.save}")
+    if results is not None and args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare_results(baseline, results, args.threshold):
+            sys.exit(1)
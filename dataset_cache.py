@@ -0,0 +1,195 @@
+# 資料集快取管理 (dataset_cache.py)
+import base64
+import hashlib
+import http.client
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# QuickDraw numpy_bitmap 檔案的下載位置，測試時可改成本機的替身伺服器
+QUICKDRAW_BASE_URL = os.environ.get(
+    "QUICKDRAW_BASE_URL", "https://storage.googleapis.com/quickdraw_dataset/full/numpy_bitmap"
+)
+# 資料集快取資料夾，預設沿用過去的做法放在目前的工作目錄
+QUICKDRAW_CACHE_DIR = os.environ.get("QUICKDRAW_CACHE_DIR", ".")
+
+class DownloadVerificationError(Exception):
+    """下載完成的檔案大小或雜湊值與預期不符。"""
+
+class QuickDrawCache:
+    """
+    QuickDraw 資料集的本機快取。
+
+    - 多個類別以執行緒池同時下載。
+    - 下載中的資料寫入 `<名稱>.npy.part`，連線中斷後以 HTTP Range 從斷點續傳。
+    - 完成後檢查大小 (Content-Length / Content-Range) 與雜湊值
+      (GCS 的 `x-goog-hash` MD5，或呼叫端提供的 SHA-256)，
+      通過後才以 `os.replace` 原子性地改名成正式檔名。
+    """
+    def __init__(self, cache_dir=None, base_url=None, max_workers=8, checksums=None,
+                 retries=3, timeout=60, chunk_size=1 << 20):
+        """
+        Args:
+            cache_dir (str): 快取資料夾，None 表示使用 `QUICKDRAW_CACHE_DIR`。
+            base_url (str): 下載來源，None 表示使用 `QUICKDRAW_BASE_URL`。
+            max_workers (int): 同時下載的最大類別數。
+            checksums (dict): 類別名稱對應的 SHA-256 十六進位字串 (選用)。
+            retries (int): 每個檔案最多嘗試的次數。
+            timeout (float): 每次連線的逾時秒數。
+            chunk_size (int): 每次寫入磁碟的位元組數。
+        """
+        self.cache_dir = cache_dir or QUICKDRAW_CACHE_DIR
+        self.base_url = (base_url or QUICKDRAW_BASE_URL).rstrip("/")
+        self.max_workers = max_workers
+        self.checksums = checksums or {}
+        self.retries = retries
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def path(self, dataset_name):
+        """回傳資料集在快取中的完整路徑 (不論是否已下載)。"""
+        return os.path.join(self.cache_dir, f"{dataset_name}.npy")
+
+    def fetch(self, dataset_name):
+        """
+        確保資料集存在於快取中，必要時下載。
+
+        Args:
+            dataset_name (str): 資料集名稱 (例如 "fish", "cat")。
+
+        Returns:
+            str: 檔案的完整路徑，如果失敗則回傳 None。
+        """
+        with self._locks_guard:
+            lock = self._locks.setdefault(dataset_name, threading.Lock())
+
+        # 同一個類別同時只允許一個執行緒下載，其餘的等它完成後直接使用快取
+        with lock:
+            file_path = self.path(dataset_name)
+            if os.path.exists(file_path):
+                print(f"資料集 '{dataset_name}.npy' 已存在於 '{file_path}'。")
+                return file_path
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self._download(dataset_name, file_path)
+                    print(f"下載完成！檔案儲存於: {file_path}")
+                    return file_path
+                except DownloadVerificationError as e:
+                    # 內容已損毀，續傳無意義，刪除後從頭下載
+                    print(f"'{dataset_name}' 驗證失敗 (第 {attempt} 次): {e}")
+                    self._remove(file_path + ".part")
+                except urllib.error.HTTPError as e:
+                    if 400 <= e.code < 500 and e.code not in (408, 429):
+                        # 類別名稱錯誤等用戶端錯誤，重試也不會成功
+                        print(f"下載失敗: {e}")
+                        return None
+                    print(f"'{dataset_name}' 下載中斷 (第 {attempt} 次): {e}")
+                except (OSError, http.client.HTTPException) as e:
+                    # 保留 .part 檔，下一次從斷點續傳
+                    print(f"'{dataset_name}' 下載中斷 (第 {attempt} 次): {e}")
+
+            print(f"下載失敗: 已重試 {self.retries} 次仍無法取得 '{dataset_name}'。")
+            return None
+
+    def fetch_many(self, dataset_names):
+        """
+        以執行緒池同時下載多個資料集。
+
+        Returns:
+            dict: 資料集名稱對應的檔案路徑 (失敗者為 None)。
+        """
+        dataset_names = list(dict.fromkeys(dataset_names))
+        with ThreadPoolExecutor(max_workers=max(min(self.max_workers, len(dataset_names)), 1)) as pool:
+            return dict(zip(dataset_names, pool.map(self.fetch, dataset_names)))
+
+    def _download(self, dataset_name, file_path):
+        url = f"{self.base_url}/{dataset_name}.npy"
+        part_path = file_path + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+            print(f"從第 {offset} 位元組續傳 '{dataset_name}.npy'...")
+        else:
+            print(f"正在從 {url} 下載 '{dataset_name}.npy'...")
+
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 416 or not offset:
+                raise
+            # 416：請求的範圍超出檔案大小，代表 .part 其實已經下載完整
+            self._verify(dataset_name, part_path, expected_size=None, expected_md5=None)
+            os.replace(part_path, file_path)
+            return
+
+        with response:
+            if offset and response.status == 206:
+                mode = "ab"
+                match = re.search(r"/(\d+)$", response.headers.get("Content-Range", ""))
+                expected_size = int(match.group(1)) if match else None
+            else:
+                # 伺服器不支援 Range 時會回傳完整內容 (200)，只能從頭寫入
+                mode = "wb"
+                length = response.headers.get("Content-Length")
+                expected_size = int(length) if length else None
+
+            with open(part_path, mode) as f:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+
+            self._verify(dataset_name, part_path, expected_size, self._goog_md5(response.headers))
+
+        os.replace(part_path, file_path)
+
+    def _verify(self, dataset_name, part_path, expected_size, expected_md5):
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            if size < expected_size:
+                # 連線提早結束，保留已下載的部分以便續傳
+                raise OSError(f"只收到 {size} / {expected_size} 位元組")
+            raise DownloadVerificationError(f"檔案大小 {size} 超過預期的 {expected_size}")
+
+        expected_sha256 = self.checksums.get(dataset_name)
+        if expected_md5 is None and expected_sha256 is None:
+            return
+
+        md5, sha256 = hashlib.md5(), hashlib.sha256()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                md5.update(chunk)
+                sha256.update(chunk)
+
+        if expected_md5 is not None and md5.digest() != expected_md5:
+            raise DownloadVerificationError("MD5 與伺服器提供的 x-goog-hash 不符")
+        if expected_sha256 is not None and sha256.hexdigest() != expected_sha256.lower():
+            raise DownloadVerificationError("SHA-256 與預期的雜湊值不符")
+
+    @staticmethod
+    def _goog_md5(headers):
+        # GCS 以 "x-goog-hash: crc32c=...,md5=<base64>" 提供整個物件的 MD5
+        for value in headers.get_all("x-goog-hash") or []:
+            for item in value.split(","):
+                key, _, digest = item.strip().partition("=")
+                if key == "md5":
+                    return base64.b64decode(digest)
+        return None
+
+    @staticmethod
+    def _remove(path):
+        if os.path.exists(path):
+            os.remove(path)
+
+# 預設的共用快取
+default_cache = QuickDrawCache()
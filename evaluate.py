@@ -0,0 +1,293 @@
+# 離線批次評估 (evaluate.py)
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from model import load_ai_model, split_category_indices
+
+# 機率分數的直方圖區間數；所有指標都由直方圖計算，記憶體用量與資料量無關
+SCORE_BINS = 10000
+# 門檻掃描的預設門檻
+SWEEP_THRESHOLDS = tuple(round(t, 2) for t in np.arange(0.05, 1.0, 0.05))
+
+def npy_layout(path):
+    """
+    解析 QuickDraw `.npy` 檔的檔頭，之後以 `read_rows` 分段讀取。
+
+    不使用記憶體映射：映射過的頁面會一直算在行程的常駐記憶體中，
+    檔案越大佔用越多；逐段讀取則只需要一個批次的緩衝區。
+
+    Returns:
+        tuple: (資料起點的位元組偏移, 列數)；形狀不是 uint8 的 (N, 784) 或 (N, 28, 28) 時丟出 ValueError。
+    """
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        if dtype != np.uint8 or fortran_order or shape[1:] not in ((784,), (28, 28)):
+            raise ValueError(f"'{path}' 不是 uint8 的 (N, 784) 或 (N, 28, 28) 圖片陣列")
+        return f.tell(), shape[0]
+
+def read_rows(path, start, stop):
+    """讀入第 start 到 stop 列，回傳 (n, 28, 28) 的 uint8 陣列；檔案只在這次讀取期間開啟。"""
+    offset, _ = npy_layout(path)
+    with open(path, "rb") as f:
+        f.seek(offset + start * 784)
+        return np.fromfile(f, dtype=np.uint8, count=(stop - start) * 784).reshape(-1, 28, 28)
+
+def read_chunk(task):
+    """
+    讀入一段連續的圖片並轉成推論引擎的輸入格式，可在 worker 行程中執行。
+
+    Args:
+        task (tuple): (path, start, stop, excluded)；excluded 是這一段中要略過的列號 (已排序)。
+
+    Returns:
+        np.array: 形狀為 (n, 28, 28) 的 uint8 連續陣列。
+    """
+    path, start, stop, excluded = task
+    chunk = read_rows(path, start, stop)
+    if len(excluded):
+        chunk = np.delete(chunk, np.asarray(excluded) - start, axis=0)
+    return chunk
+
+def plan_chunks(path, batch_size, max_items=None, exclude=None):
+    """
+    把一個檔案切成多段 (path, start, stop, excluded) 的讀取工作。
+
+    Args:
+        path (str): `.npy` 檔路徑。
+        batch_size (int): 每段的列數。
+        max_items (int): 最多讀取的列數，None 表示全部。
+        exclude (np.array): 要略過的列號 (已排序)，例如訓練時用過的圖片。
+
+    Yields:
+        tuple: 讀取工作。
+    """
+    total = npy_layout(path)[1]
+    stop_at = total if max_items is None else min(max_items, total)
+    exclude = np.empty(0, dtype=np.int64) if exclude is None else exclude
+    for start in range(0, stop_at, batch_size):
+        stop = min(start + batch_size, stop_at)
+        lo, hi = np.searchsorted(exclude, [start, stop])
+        yield path, start, stop, exclude[lo:hi]
+
+def training_indices(path, max_items=10000, caps=None, seed=42):
+    """
+    重現 `train_and_save_model` 從這個類別選用的圖片 (訓練與驗證)，評估時可將它們排除。
+
+    類別名稱取自檔名 (例如 `cat.npy` -> cat)，與資料集快取的切分方式相同。
+
+    Returns:
+        np.array: 已排序的列號。
+    """
+    category = os.path.splitext(os.path.basename(path))[0]
+    cap = (caps or {}).get(category, max_items)
+    train, val = split_category_indices(category, npy_layout(path)[1], cap, seed=seed)
+    return np.union1d(train, val)
+
+def iter_chunks(tasks, workers=0, prefetch=2):
+    """
+    依序產生每段讀取工作的結果。
+
+    有 worker 時以行程池平行讀取，同時進行中的工作最多 `workers * prefetch` 個，
+    因此不論檔案多大，佔用的記憶體都只有固定的幾個批次。
+
+    Args:
+        tasks (iterable): `plan_chunks` 產生的工作。
+        workers (int): 讀取與前處理的 worker 行程數，0 表示在主行程中讀取。
+        prefetch (int): 每個 worker 預先排入的工作數。
+
+    Yields:
+        tuple: (task, images)。
+    """
+    if workers <= 0:
+        for task in tasks:
+            yield task, read_chunk(task)
+        return
+
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append((task, pool.apply_async(read_chunk, (task,))))
+            if len(pending) >= workers * prefetch:
+                task, result = pending.popleft()
+                yield task, result.get()
+        while pending:
+            task, result = pending.popleft()
+            yield task, result.get()
+
+def score_histogram(probabilities, bins=SCORE_BINS):
+    """把一批機率累計成固定區間數的直方圖 (區間 k 涵蓋 [k/bins, (k+1)/bins))。"""
+    index = np.minimum((np.asarray(probabilities, dtype=np.float64) * bins).astype(np.int64), bins - 1)
+    return np.bincount(index, minlength=bins)
+
+def threshold_bin(threshold, bins=SCORE_BINS):
+    """門檻對齊到最近的區間邊界後的區間索引；索引以上的區間判定為魚。"""
+    return min(max(int(round(threshold * bins)), 0), bins)
+
+def confusion_at(pos_hist, neg_hist, threshold):
+    """
+    由正負樣本的分數直方圖計算某個門檻 (機率 > 門檻判定為魚) 的混淆矩陣。
+
+    門檻會對齊到直方圖的區間邊界，誤差不超過 1 / bins。
+
+    Returns:
+        dict: tp、fn、fp、tn 與 accuracy、precision、recall、f1。
+    """
+    k = threshold_bin(threshold, len(pos_hist))
+    tp, fn = int(pos_hist[k:].sum()), int(pos_hist[:k].sum())
+    fp, tn = int(neg_hist[k:].sum()), int(neg_hist[:k].sum())
+    total = tp + fn + fp + tn
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "threshold": threshold,
+        "tp": tp, "fn": fn, "fp": fp, "tn": tn,
+        "accuracy": (tp + tn) / total if total else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+def roc_curve(pos_hist, neg_hist):
+    """
+    由分數直方圖計算 ROC 曲線與 AUC。
+
+    每個區間邊界是一個門檻；同一個區間內的分數視為同分，以梯形面積計算 AUC。
+
+    Returns:
+        tuple: (fpr, tpr, auc)，fpr 與 tpr 從 (0, 0) 遞增到 (1, 1)。
+    """
+    # 從最高分往下累計，得到門檻逐漸降低時的 TP / FP 數
+    tps = np.concatenate([[0], np.cumsum(pos_hist[::-1])])
+    fps = np.concatenate([[0], np.cumsum(neg_hist[::-1])])
+    tpr = tps / max(tps[-1], 1)
+    fpr = fps / max(fps[-1], 1)
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    return fpr, tpr, auc
+
+def evaluate(positives, negatives, model_path="fish_classifier.h5", backend=None, batch_size=1024,
+             workers=0, max_items=None, holdout=None, threshold=0.5, thresholds=SWEEP_THRESHOLDS):
+    """
+    以串流方式評估一個或多個 `.npy` 類別檔。
+
+    每個檔案依檔頭的偏移分段讀入 (不使用記憶體映射) 並送進推論引擎，只累計分數直方圖，
+    因此記憶體用量固定，與檔案大小無關。
+
+    Args:
+        positives (list): 正樣本 (魚) 的 `.npy` 檔路徑。
+        negatives (list): 負樣本的 `.npy` 檔路徑。
+        model_path (str): 模型路徑 (`.h5` 或 `.tflite`)。
+        backend (str): "numpy" 或 "keras"，None 表示使用預設後端。
+        batch_size (int): 每次送進引擎的圖片數量。
+        workers (int): 讀取與前處理的 worker 行程數，0 表示在主行程中讀取。
+        max_items (int): 每個檔案最多評估的圖片數量，None 表示全部。
+        holdout (dict): 指定時排除訓練用過的圖片，內容為傳給 `training_indices` 的
+                        max_items / caps / seed。
+        threshold (float): 混淆矩陣使用的門檻。
+        thresholds (tuple): 門檻掃描的門檻。
+
+    Returns:
+        dict: 每個檔案與整體的評估結果；無法載入模型時回傳 None。
+    """
+    engine = load_ai_model(model_path, backend=backend)
+    if engine is None:
+        return None
+
+    files = [(path, 1) for path in positives] + [(path, 0) for path in negatives]
+    exclude = {path: training_indices(path, **holdout) if holdout is not None else None for path, _ in files}
+    tasks = (task for path, _ in files for task in plan_chunks(path, batch_size, max_items, exclude[path]))
+    labels = dict(files)
+    histograms = {path: np.zeros(SCORE_BINS, dtype=np.int64) for path, _ in files}
+
+    n_images, inference_seconds = 0, 0.0
+    start = time.perf_counter()
+    for (path, _, _, _), images in iter_chunks(tasks, workers):
+        if len(images) == 0:
+            continue
+        inference_start = time.perf_counter()
+        probabilities = engine.predict_proba(images)
+        inference_seconds += time.perf_counter() - inference_start
+        histograms[path] += score_histogram(probabilities)
+        n_images += len(images)
+    seconds = time.perf_counter() - start
+
+    pos_hist = sum((histograms[path] for path, label in files if label == 1), np.zeros(SCORE_BINS, dtype=np.int64))
+    neg_hist = sum((histograms[path] for path, label in files if label == 0), np.zeros(SCORE_BINS, dtype=np.int64))
+    fpr, tpr, auc = roc_curve(pos_hist, neg_hist)
+    sweep = [confusion_at(pos_hist, neg_hist, t) for t in thresholds]
+    # ROC 曲線只保留約 100 個點，方便存成 JSON 或繪圖
+    keep = np.unique(np.linspace(0, len(fpr) - 1, 101).astype(int))
+
+    return {
+        "model_path": model_path,
+        "images": n_images,
+        "seconds": seconds,
+        "images_per_sec": n_images / seconds if seconds else 0.0,
+        "inference_images_per_sec": n_images / inference_seconds if inference_seconds else 0.0,
+        "confusion": confusion_at(pos_hist, neg_hist, threshold),
+        "sweep": sweep,
+        "best_f1": max(sweep, key=lambda r: r["f1"]),
+        "auc": auc,
+        "roc": {"fpr": fpr[keep].tolist(), "tpr": tpr[keep].tolist()},
+        "files": {
+            path: {
+                "label": labels[path],
+                "images": int(histograms[path].sum()),
+                # 以 threshold 判定為魚的比例 (正樣本即為召回率，負樣本即為誤判率)
+                "fish_rate": float(histograms[path][threshold_bin(threshold):].sum() / max(histograms[path].sum(), 1)),
+            }
+            for path, _ in files
+        },
+    }
+
+def print_report(report):
+    """印出混淆矩陣、門檻掃描、AUC 與吞吐量。"""
+    c = report["confusion"]
+    print(f"\n--- 評估結果：{report['images']} 張，{report['seconds']:.1f} 秒 "
+          f"({report['images_per_sec']:.0f} images/sec，純推論 {report['inference_images_per_sec']:.0f} images/sec) ---")
+    for path, stats in report["files"].items():
+        print(f"{path:<32} 標籤 {stats['label']}  {stats['images']:>9} 張  判定為魚 {stats['fish_rate']:.4f}")
+
+    print(f"\n混淆矩陣 (門檻 {c['threshold']})")
+    print(f"{'':>10} {'預測:魚':>10} {'預測:非魚':>10}")
+    print(f"{'實際:魚':>10} {c['tp']:>10} {c['fn']:>10}")
+    print(f"{'實際:非魚':>10} {c['fp']:>10} {c['tn']:>10}")
+
+    print(f"\n{'門檻':>6} {'準確率':>8} {'精確率':>8} {'召回率':>8} {'F1':>8}")
+    for r in report["sweep"]:
+        mark = "*" if r is report["best_f1"] else " "
+        print(f"{mark}{r['threshold']:>5.2f} {r['accuracy']:>8.4f} {r['precision']:>8.4f} {r['recall']:>8.4f} {r['f1']:>8.4f}")
+    print(f"\nROC AUC: {report['auc']:.4f}  (F1 最佳門檻 {report['best_f1']['threshold']:.2f}，以 * 標示)")
+
+# --- 測試用 ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="以串流方式在大型 QuickDraw .npy 檔上評估魚分類模型")
+    parser.add_argument("--positive", nargs="+", default=["fish.npy"], help="正樣本 (魚) 的 .npy 檔")
+    parser.add_argument("--negative", nargs="+", default=["cat.npy"], help="負樣本的 .npy 檔")
+    parser.add_argument("--model-path", default="fish_classifier.h5", help="模型路徑 (.h5 或 .tflite)")
+    parser.add_argument("--backend", choices=["numpy", "keras"], default=None, help="Keras 權重檔使用的推論後端")
+    parser.add_argument("--batch-size", type=int, default=1024, help="每次送進模型的圖片數量")
+    parser.add_argument("--workers", type=int, default=0, help="讀取與前處理的 worker 行程數 (0 表示在主行程中讀取)")
+    parser.add_argument("--max-items", type=int, default=None, help="每個檔案最多評估的圖片數量")
+    parser.add_argument("--holdout", action="store_true", help="排除訓練時用過的圖片 (依 --train-max-items 重現切分)")
+    parser.add_argument("--train-max-items", type=int, default=10000, help="訓練時每個類別的數量上限")
+    parser.add_argument("--threshold", type=float, default=0.5, help="混淆矩陣使用的門檻")
+    parser.add_argument("--report", help="將完整結果存成 JSON 檔")
+    args = parser.parse_args()
+
+    holdout = {"max_items": args.train_max_items} if args.holdout else None
+    report = evaluate(args.positive, args.negative, args.model_path, args.backend, args.batch_size,
+                      args.workers, args.max_items, holdout, args.threshold)
+    if report is not None:
+        print_report(report)
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"結果已儲存至 {args.report}")
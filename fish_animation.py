@@ -1,91 +1,527 @@
 # 魚缸動畫 (fish_animation.py)
-import random
 import base64
+import hashlib
+from collections import OrderedDict
 from io import BytesIO
+import numpy as np
 from PIL import Image
 import json
+import time
 
-def pil_to_base64(image: Image.Image) -> str:
-    """將 Pillow 圖片物件轉換為 Base64 編碼的字串。"""
+from metrics import timed
+
+def encode_png(image: Image.Image) -> bytes:
+    """將 Pillow 圖片物件壓縮為 PNG 位元組。"""
     buffered = BytesIO()
     image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+    return buffered.getvalue()
+
+def pil_to_base64(image: Image.Image) -> str:
+    """將 Pillow 圖片物件轉換為 Base64 編碼的字串。"""
+    return base64.b64encode(encode_png(image)).decode()
+
+# 以圖片內容雜湊為鍵的 data URI 快取，相同的 sprite 只需編碼一次
+SPRITE_CACHE_SIZE = 4096
+_sprite_uri_cache = OrderedDict()
+
+def clear_sprite_cache():
+    """清空 data URI 快取 (主要供效能測試量測未快取的情況)。"""
+    _sprite_uri_cache.clear()
+
+def sprite_hash(image: Image.Image) -> str:
+    """以圖片的模式、尺寸與像素內容計算雜湊值。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def sprite_to_data_uri(image: Image.Image) -> str:
+    """
+    將 sprite 轉換為 PNG data URI，並以內容雜湊快取結果 (LRU，最多 SPRITE_CACHE_SIZE 筆)。
+    """
+    key = sprite_hash(image)
+    uri = _sprite_uri_cache.get(key)
+    if uri is None:
+        uri = f"data:image/png;base64,{pil_to_base64(image)}"
+        _sprite_uri_cache[key] = uri
+        if len(_sprite_uri_cache) > SPRITE_CACHE_SIZE:
+            _sprite_uri_cache.popitem(last=False)
+    else:
+        _sprite_uri_cache.move_to_end(key)
+    return uri
 
 class Fish:
     """
-    代表一隻魚的類別，現在使用傳入的 sprite 圖片。
-    這個類別現在主要用於儲存魚的初始狀態，動畫邏輯已移至客戶端 JavaScript。
+    代表一隻魚的 sprite。
+
+    每隻魚只保存壓縮後的 PNG 位元組與尺寸；位置與速度存放在 `FishTank`
+    的 NumPy 陣列中，動畫邏輯則在客戶端 JavaScript。
     """
-    def __init__(self, bounds, sprite_image):
+    __slots__ = ("fish_id", "png", "width", "height")
+
+    def __init__(self, png, width, height, fish_id=0):
         """
         初始化一隻魚。
 
         Args:
-            bounds (tuple): 魚缸的邊界 (width, height)。
-            sprite_image (PIL.Image): 這隻魚的圖片 (需為 RGBA 格式以支援透明度)。
+            png (bytes): 這隻魚的 RGBA 圖片，以 PNG 壓縮 (見 `encode_png`)。
+            width (int): 圖片寬度 (px)。
+            height (int): 圖片高度 (px)。
+            fish_id (int): 魚在魚缸中的編號，移除較舊的魚後也不會改變。
         """
-        self.bounds = bounds
-        
-        # 儲存原始及水平翻轉的圖片
-        self.sprite_right = sprite_image
-        self.sprite_left = self.sprite_right.transpose(Image.FLIP_LEFT_RIGHT)
-        
-        self.width, self.height = self.sprite_right.size
-        
-        # 初始位置
-        self.pos = [
-            random.uniform(self.width, bounds[0] - self.width),
-            random.uniform(self.height, bounds[1] - self.height)
-        ]
-        
-        # 初始速度
-        self.vel = [
-            random.uniform(-2, 2),
-            random.uniform(-1, 1)
-        ]
-        # 確保初始速度不為零
-        if self.vel[0] == 0 and self.vel[1] == 0:
-            self.vel[0] = 1
+        self.fish_id = fish_id
+        self.png = png
+        self.width = width
+        self.height = height
+
+    @property
+    def sprite_right(self):
+        """朝右的原始圖片，每次存取時從 PNG 解碼。"""
+        return Image.open(BytesIO(self.png))
+
+    @property
+    def sprite_left(self):
+        """水平翻轉 (朝左) 的圖片，不會常駐在記憶體中。"""
+        return self.sprite_right.transpose(Image.FLIP_LEFT_RIGHT)
+
+    @property
+    def sprite_right_uri(self):
+        """朝右圖片的 PNG data URI，直接使用已壓縮的位元組，不需重新編碼。"""
+        return f"data:image/png;base64,{base64.b64encode(self.png).decode()}"
+
+    @property
+    def sprite_left_uri(self):
+        """朝左圖片的 PNG data URI ("dual" 模式)，經由共用的 data URI 快取產生。"""
+        return sprite_to_data_uri(self.sprite_left)
+
+def pack_sprite_atlas(sizes, max_width=1024):
+    """
+    以簡單的 shelf 演算法決定每張 sprite 在圖集中的位置。
+
+    依序由左到右擺放，放不下時換到下一列；新增 sprite 不會改變既有 sprite 的位置。
+
+    Args:
+        sizes (list): 每張 sprite 的 (width, height)。
+        max_width (int): 圖集的最大寬度。
+
+    Returns:
+        tuple: (每張 sprite 的 (x, y) 位置列表, (圖集寬度, 圖集高度))。
+    """
+    positions = []
+    x = y = shelf_height = atlas_width = 0
+    for width, height in sizes:
+        if x > 0 and x + width > max_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions.append((x, y))
+        x += width
+        shelf_height = max(shelf_height, height)
+        atlas_width = max(atlas_width, x)
+    return positions, (atlas_width, y + shelf_height)
+
+# 每個魚缸預設的容量上限，超過時從最舊的魚開始移除
+MAX_FISH = 300
+MAX_SPRITE_BYTES = 8 * 1024 * 1024 # 所有 sprite 的 PNG 總位元組數
+
+# 魚的運動規則 (瀏覽器端動畫使用)
+JITTER_PROBABILITY = 0.02 # 每一幀隨機微調速度的機率
+JITTER_AMOUNT = 0.3       # 微調速度的最大幅度
+MIN_SPEED = 1.5
+MAX_SPEED = 4
+# 瀏覽器 requestAnimationFrame 的幀率；伺服器端以此把經過的時間換算成步數
+FRAME_RATE = 60
+# 伺服器端追趕經過時間時最多模擬的步數 (約 10 秒)，更久之後魚的位置已與起點無關
+MAX_CATCH_UP_STEPS = 600
+
+# 繪製方式："dom" 以每隻魚一個元素呈現，"canvas" 以單一 <canvas> 繪製所有魚
+RENDERERS = ("dom", "canvas")
+
+# sprite 的傳送方式：
+# - "dual":  每隻魚送出朝右、朝左兩張 data URI，JS 轉向時切換 src (舊版作法)
+# - "flip":  每隻魚只送出一張朝右的 data URI，轉向以 CSS scaleX(-1) 完成
+# - "atlas": 所有魚打包成一張圖集，每隻魚以 background-position 取出自己的區塊
+SPRITE_MODES = ("dual", "flip", "atlas")
 
 class FishTank:
     """
     管理整個魚缸的狀態與繪圖。
     """
-    def __init__(self, width, height):
+    def __init__(self, width, height, sprite_mode="flip", renderer="dom",
+                 max_fish=MAX_FISH, max_sprite_bytes=MAX_SPRITE_BYTES, seed=None, store=None):
+        """
+        Args:
+            width (int): 魚缸寬度 (px)。
+            height (int): 魚缸高度 (px)。
+            sprite_mode (str): "dom" 繪製方式下 sprite 的傳送方式，見 `SPRITE_MODES`。
+            renderer (str): 繪製方式，見 `RENDERERS`。
+            max_fish (int): 魚的數量上限，None 表示不限制。
+            max_sprite_bytes (int): 所有 sprite 壓縮後的總位元組數上限，None 表示不限制。
+            seed (int): 產生初始位置與速度的亂數種子。
+            store (TankStore): 所有 session 共用的魚缸儲存區 (見 `tank_store`)；
+                               指定時新增的魚寫入儲存區，容量上限也改由儲存區管理。
+        """
+        if sprite_mode not in SPRITE_MODES:
+            raise ValueError(f"未知的 sprite 模式 '{sprite_mode}'，可用的模式: {SPRITE_MODES}")
+        if renderer not in RENDERERS:
+            raise ValueError(f"未知的繪製方式 '{renderer}'，可用的方式: {RENDERERS}")
         self.width = width
         self.height = height
+        self.sprite_mode = sprite_mode
+        self.renderer = renderer
+        self.store = store
+        self.max_fish = None if store is not None else max_fish
+        self.max_sprite_bytes = None if store is not None else max_sprite_bytes
         self.fishes = []
+        self.sprite_bytes = 0
+        self._next_id = 1 # 編號從 1 開始，0 代表「還沒有任何魚」
+        self._rng = np.random.default_rng(seed)
+        self._last_step_time = None
+        # 以 struct-of-arrays 存放運動狀態：第 i 列對應 self.fishes[i]，
+        # 陣列預留額外容量，新增魚時不必每次重新配置
+        self._pos = np.zeros((0, 2))
+        self._vel = np.zeros((0, 2))
+        self._size = np.zeros((0, 2))
         self.background_image_url = "https://www.stickpng.com/assets/images/580b585b2edb1692510b5865.png"
+        # 每隻魚已產生的 (fish, JSON 片段, HTML 片段)，讓重新渲染只需處理新加入的魚
+        self._fragments = []
+        # "atlas" 模式下的圖集 data URI 與其包含的魚數
+        self._atlas_uri = None
+        self._atlas_count = 0
+
+    @property
+    def positions(self):
+        """(N, 2) 的位置陣列 (左上角 x, y)。"""
+        return self._pos[:len(self.fishes)]
+
+    @property
+    def velocities(self):
+        """(N, 2) 的速度陣列 (每一幀的位移 px)。"""
+        return self._vel[:len(self.fishes)]
 
+    @property
+    def sizes(self):
+        """(N, 2) 的 sprite 尺寸陣列 (width, height)。"""
+        return self._size[:len(self.fishes)]
+
+    @timed("fish_animation.add_fish")
     def add_fish(self, sprite_image):
         """
-        新增一隻使用自訂 sprite 的魚到魚缸裡。
+        新增一隻使用自訂 sprite 的魚到魚缸裡，超過容量上限時移除最舊的魚。
         
         Args:
             sprite_image (PIL.Image): 要新增的魚的圖片。
         """
-        new_fish = Fish(bounds=(self.width, self.height), sprite_image=sprite_image)
-        self.fishes.append(new_fish)
+        png, (width, height) = encode_png(sprite_image), sprite_image.size
+        if self.store is not None:
+            # 寫入共用儲存區，再與其他 session 新增的魚一起同步回來
+            pos, vel = self._spawn(width, height)
+            self.store.add_fish(png, width, height, pos, vel)
+            self.sync()
+        else:
+            before = len(self.fishes)
+            self.add_encoded_fish(png, width, height)
+            # 只有本地容量淘汰才提示；從共用儲存區同步回來的淘汰是其他 session 造成的，不逐一印出
+            evicted = before + 1 - len(self.fishes)
+            if evicted:
+                print(f"魚缸已滿，移除最舊的 {evicted} 隻魚。")
         print(f"新增一隻自訂魚！目前共有 {len(self.fishes)} 隻。")
 
-    def render_as_html(self) -> str:
+    def _spawn(self, width, height):
+        """產生一隻魚的初始位置與速度。"""
+        # 初始位置，範圍為 [sprite 尺寸, 魚缸尺寸 - sprite 尺寸] (sprite 過大時範圍會反轉，與 random.uniform 相同)
+        low = np.array([width, height])
+        pos = low + (np.array([self.width, self.height]) - 2 * low) * self._rng.random(2)
+        # 初始速度，並確保不為零
+        vel = self._rng.uniform((-2, -1), (2, 1))
+        if not vel.any():
+            vel[0] = 1
+        return pos, vel
+
+    @timed("fish_animation.sync")
+    def sync(self):
         """
-        將魚缸狀態轉換為 HTML 和客戶端 JavaScript 以進行流暢的動畫渲染。
+        與共用儲存區同步：移除已被儲存區淘汰的魚，並加入上次同步後新增的魚。
+
+        讀取經過儲存區的行程內快取，沒有變動時不會讀取磁碟；新魚的 PNG 位元組
+        與快取共用同一個物件，不會在每個 session 複製一份。
+        """
+        if self.store is None:
+            return
+        last_id = self.fishes[-1].fish_id if self.fishes else 0
+        min_id, rows = self.store.fish_since(last_id)
+        if min_id is None:
+            self.remove_oldest(len(self.fishes))
+            return
+        evicted = 0
+        while evicted < len(self.fishes) and self.fishes[evicted].fish_id < min_id:
+            evicted += 1
+        self.remove_oldest(evicted)
+        for fish_id, png, width, height, pos_x, pos_y, vel_x, vel_y in rows:
+            self.add_encoded_fish(png, width, height, pos=(pos_x, pos_y), vel=(vel_x, vel_y), fish_id=fish_id)
+
+    def add_encoded_fish(self, png, width, height, pos=None, vel=None, fish_id=None):
+        """
+        新增一隻 sprite 已壓縮為 PNG 的魚 (例如從共用的魚缸儲存區讀回)。
+
+        Args:
+            png (bytes): RGBA sprite 的 PNG 位元組。
+            width (int): sprite 寬度 (px)。
+            height (int): sprite 高度 (px)。
+            pos (tuple): 初始位置，None 表示隨機產生。
+            vel (tuple): 初始速度，None 表示隨機產生。
+            fish_id (int): 魚的編號，None 表示使用魚缸內遞增的編號。
+
+        Returns:
+            Fish: 新增的魚。
+        """
+        if fish_id is None:
+            fish_id = self._next_id
+        self._next_id = max(self._next_id, fish_id + 1)
+        new_fish = Fish(png, width, height, fish_id=fish_id)
+
+        n = len(self.fishes)
+        if n == len(self._pos):
+            # 容量加倍，讓連續新增的攤銷成本為 O(1)
+            capacity = max(2 * n, 16)
+            for name in ("_pos", "_vel", "_size"):
+                grown = np.zeros((capacity, 2))
+                grown[:n] = getattr(self, name)[:n]
+                setattr(self, name, grown)
+
+        self._size[n] = (width, height)
+        if pos is None or vel is None:
+            pos, vel = self._spawn(width, height)
+        self._pos[n] = pos
+        self._vel[n] = vel
+
+        self.fishes.append(new_fish)
+        self.sprite_bytes += len(png)
+        self._enforce_limits()
+        return new_fish
+
+    def _enforce_limits(self):
+        """依 max_fish / max_sprite_bytes 從最舊的魚開始移除，最新加入的魚一定保留。"""
+        n = len(self.fishes)
+        evict = 0
+        remaining_bytes = self.sprite_bytes
+        while evict < n - 1 and (
+            (self.max_fish is not None and n - evict > self.max_fish)
+            or (self.max_sprite_bytes is not None and remaining_bytes > self.max_sprite_bytes)
+        ):
+            remaining_bytes -= len(self.fishes[evict].png)
+            evict += 1
+        if evict:
+            self.remove_oldest(evict)
+
+    def remove_oldest(self, count=1):
+        """
+        移除最舊的 count 隻魚。
+
+        Args:
+            count (int): 要移除的數量。
+        """
+        n = len(self.fishes)
+        count = min(count, n)
+        if count <= 0:
+            return
+        self.sprite_bytes -= sum(len(fish.png) for fish in self.fishes[:count])
+        del self.fishes[:count]
+        for array in (self._pos, self._vel, self._size):
+            array[:n - count] = array[count:n]
+
+        if self.sprite_mode == "atlas":
+            # 圖集中的位置依序排列，移除任何一隻都必須重新打包
+            self._fragments.clear()
+            self._atlas_uri = None
+        else:
+            # 其餘魚的片段以固定編號識別，仍可沿用
+            del self._fragments[:count]
+
+    @timed("fish_animation.step")
+    def step(self, dt=1.0, n_steps=1):
+        """
+        以向量化的方式推進所有魚的運動，規則與瀏覽器端的 JavaScript 相同：
+        移動 -> 隨機微調速度 -> 邊界反彈 -> 速度限制在 [MIN_SPEED, MAX_SPEED]。
+
+        Args:
+            dt (float): 每一步相當於瀏覽器的幾幀 (1 = 一幀)。
+            n_steps (int): 要模擬的步數。
+        """
+        n = len(self.fishes)
+        if n == 0 or n_steps <= 0:
+            return
+        pos, vel = self._pos[:n], self._vel[:n]
+        # 超過此位置即碰到右/下邊界；sprite 比魚缸大時與 JS 相同，優先貼齊左/上邊界
+        limit = np.array([self.width, self.height]) - self._size[:n]
+        jitter_probability = min(JITTER_PROBABILITY * dt, 1.0)
+        # 迴圈內重複使用的暫存陣列，避免每一步重新配置
+        speed = np.empty(n)
+        scale = np.empty(n)
+        delta = np.empty((n, 2))
+        hit = np.empty((n, 2), dtype=bool)
+        over = np.empty((n, 2), dtype=bool)
+
+        for _ in range(n_steps):
+            # 更新位置
+            pos += np.multiply(vel, dt, out=delta)
+
+            # 隨機微調速度
+            jitter = np.flatnonzero(self._rng.random(n) < jitter_probability)
+            if jitter.size:
+                vel[jitter] += self._rng.uniform(-JITTER_AMOUNT, JITTER_AMOUNT, size=(jitter.size, 2))
+
+            # 邊界碰撞檢測
+            np.less(pos, 0, out=hit)
+            hit |= np.greater(pos, limit, out=over)
+            np.minimum(pos, limit, out=pos)
+            np.maximum(pos, 0, out=pos)
+            np.negative(vel, out=vel, where=hit)
+
+            # 速度限制 (速度為 0 時除以極小值，速度仍維持 0)
+            np.hypot(vel[:, 0], vel[:, 1], out=speed)
+            np.clip(speed, MIN_SPEED, MAX_SPEED, out=scale)
+            scale /= np.maximum(speed, 1e-12, out=speed)
+            vel *= scale[:, None]
+
+    def catch_up(self, now=None):
+        """
+        依上次呼叫後經過的時間推進魚的運動，讓 rerun 後的動畫從魚「現在」
+        應在的位置接續，而不是回到產生時的位置。
+
+        Args:
+            now (float): 目前時間 (`time.monotonic()`)，None 表示現在。
+
+        Returns:
+            int: 實際模擬的步數。
         """
-        # 1. 準備魚的數據
-        fishes_data = []
-        for i, fish in enumerate(self.fishes):
-            fishes_data.append({
-                "id": f"fish-{i}",
-                "pos": fish.pos,
-                "vel": fish.vel,
+        now = time.monotonic() if now is None else now
+        if self._last_step_time is None:
+            self._last_step_time = now
+            return 0
+        n_steps = min(int((now - self._last_step_time) * FRAME_RATE), MAX_CATCH_UP_STEPS)
+        if n_steps > 0:
+            self.step(n_steps=n_steps)
+            # 只扣掉已模擬的幀數，不足一幀的時間留到下次
+            self._last_step_time = max(self._last_step_time + n_steps / FRAME_RATE, now - 1 / FRAME_RATE)
+        return n_steps
+
+    @timed("fish_animation.delta_since")
+    def delta_since(self, version=0):
+        """
+        產生讓瀏覽器端魚缸從 version 更新到目前狀態所需的差異 (供 `tank_component` 使用)。
+
+        魚的編號只會遞增，且總是從最舊的魚開始移除，因此差異只需包含：
+        編號大於 version 的新魚 (含 sprite 與目前的位置、速度)，以及目前最舊的
+        魚的編號 (比它小的魚都已移除)。大小與魚的總數無關，只與新魚的數量有關。
+
+        Args:
+            version (int): 瀏覽器端已有的最大魚編號，0 表示尚未載入任何魚。
+
+        Returns:
+            dict: 可直接以 JSON 傳給瀏覽器的差異。
+        """
+        start = len(self.fishes)
+        while start > 0 and self.fishes[start - 1].fish_id > version:
+            start -= 1
+        added = [
+            {
+                "id": fish.fish_id,
+                "uri": fish.sprite_right_uri,
                 "width": fish.width,
                 "height": fish.height,
-                "sprite_left": f"data:image/png;base64,{pil_to_base64(fish.sprite_left)}",
-                "sprite_right": f"data:image/png;base64,{pil_to_base64(fish.sprite_right)}",
-            })
+                "pos": pos,
+                "vel": vel,
+            }
+            for fish, pos, vel in zip(
+                self.fishes[start:],
+                self.positions[start:].round(2).tolist(),
+                self.velocities[start:].round(3).tolist(),
+            )
+        ]
+        return {
+            "since": version,
+            "version": max(version, self._next_id - 1),
+            "min_id": self.fishes[0].fish_id if self.fishes else self._next_id,
+            "added": added,
+        }
 
-        # 2. 建立魚缸容器和魚的 <img> 元素
+    def _update_fragments(self):
+        """
+        增量更新每隻魚的 HTML / JSON 片段。
+
+        從第一隻與快取不一致的魚開始重建 (一般情況下只有新加入的魚)，
+        因此 sprite 不會在每次 Streamlit rerun 時重新編碼。
+        """
+        fragments = self._fragments
+        reused = 0
+        while (reused < len(fragments) and reused < len(self.fishes)
+               and fragments[reused][0] is self.fishes[reused]):
+            reused += 1
+        del fragments[reused:]
+
+        if self.sprite_mode == "atlas":
+            if reused < self._atlas_count or len(self.fishes) != self._atlas_count:
+                self._atlas_uri = None
+            positions, _ = pack_sprite_atlas([(fish.width, fish.height) for fish in self.fishes])
+
+        for i in range(reused, len(self.fishes)):
+            fish = self.fishes[i]
+            # 片段只包含不會變動的部分；位置與速度每次渲染時才從陣列取出，
+            # 讓瀏覽器從伺服器端目前的狀態接續動畫
+            fish_data = {
+                "id": f"fish-{fish.fish_id}",
+                "width": fish.width,
+                "height": fish.height,
+            }
+            style = f"""
+                    position: absolute;
+                    left: 0; top: 0; /* JS will control position via transform */
+                    width: {fish.width}px;
+                    height: {fish.height}px;
+                    will-change: transform;"""
+
+            if self.sprite_mode == "dual":
+                fish_data["sprite_left"] = fish.sprite_left_uri
+                fish_data["sprite_right"] = fish.sprite_right_uri
+                element_html = f"""
+                <img id="{fish_data['id']}" src="{fish.sprite_right_uri}" style="{style}
+                ">
+                """
+            elif self.sprite_mode == "flip":
+                # 朝左時以 scaleX(-1) 鏡像，sprite 本身只送一次
+                element_html = f"""
+                <img id="{fish_data['id']}" src="{fish.sprite_right_uri}" style="{style}
+                ">
+                """
+            else:
+                x, y = positions[i]
+                element_html = f"""
+                <div id="{fish_data['id']}" class="fish-sprite" style="{style}
+                    background-position: -{x}px -{y}px;
+                "></div>
+                """
+            fragments.append((fish, json.dumps(fish_data), element_html))
+        return fragments
+
+    def _atlas_style(self):
+        """產生 "atlas" 模式共用的 CSS；圖集只在魚群變動時重新打包與編碼。"""
+        if self._atlas_uri is None:
+            positions, size = pack_sprite_atlas([(fish.width, fish.height) for fish in self.fishes])
+            atlas = Image.new('RGBA', (max(size[0], 1), max(size[1], 1)), (0, 0, 0, 0))
+            for fish, position in zip(self.fishes, positions):
+                atlas.paste(fish.sprite_right, position)
+            self._atlas_uri = sprite_to_data_uri(atlas)
+            self._atlas_count = len(self.fishes)
+        return f"""
+        <style>
+        .fish-sprite {{
+            background-image: url('{self._atlas_uri}');
+            background-repeat: no-repeat;
+        }}
+        </style>
+        """
+
+    def _tank_container(self, content):
+        """產生魚缸外框 <div>；魚缸是空的時候顯示提示文字。"""
         tank_html = f"""
         <div id="fish-tank" style="
             width: {self.width}px;
@@ -113,21 +549,39 @@ class FishTank:
             </div>
             """
         else:
-            for fish_data in fishes_data:
-                tank_html += f"""
-                <img id="{fish_data['id']}" src="{fish_data['sprite_right']}" style="
-                    position: absolute;
-                    left: 0; top: 0; /* JS will control position via transform */
-                    width: {fish_data['width']}px;
-                    height: {fish_data['height']}px;
-                    transform: translate({fish_data['pos'][0]}px, {fish_data['pos'][1]}px);
-                    will-change: transform;
-                ">
-                """
+            tank_html += content
         
         tank_html += "</div>"
+        return tank_html
+
+    @timed("fish_animation.render_as_html")
+    def render_as_html(self) -> str:
+        """
+        將魚缸狀態轉換為 HTML 和客戶端 JavaScript 以進行流暢的動畫渲染。
+        """
+        if self.renderer == "canvas":
+            return self._render_canvas_html()
+
+        # 1. 準備魚的數據 (只為新加入的魚產生片段)
+        fragments = self._update_fragments()
+
+        # 2. 建立魚缸容器和魚的 <img> 元素
+        tank_html = self._atlas_style() if self.sprite_mode == "atlas" and self.fishes else ""
+        tank_html += self._tank_container("".join(element_html for _, _, element_html in fragments))
 
         # 3. 建立客戶端 JavaScript 動畫腳本
+        if self.sprite_mode == "dual":
+            # 更新 DOM，並根據速度方向切換朝左/朝右的圖片
+            direction_js = """fishElement.style.transform = `translate(${fish.pos[0]}px, ${fish.pos[1]}px)`;
+                        const sprite = fish.vel[0] < 0 ? fish.sprite_left : fish.sprite_right;
+                        if (fishElement.src !== sprite) {
+                            fishElement.src = sprite;
+                        }"""
+        else:
+            # 更新 DOM，朝左時以 scaleX(-1) 鏡像同一張圖片
+            direction_js = """const flip = fish.vel[0] < 0 ? ' scaleX(-1)' : '';
+                        fishElement.style.transform = `translate(${fish.pos[0]}px, ${fish.pos[1]}px)${flip}`;"""
+
         js_script = f"""
         <script>
         // 確保腳本只執行一次
@@ -135,18 +589,26 @@ class FishTank:
             window.fishAnimationStarted = true;
 
             const tank = document.getElementById('fish-tank');
-            const fishes = {json.dumps(fishes_data)};
+            const fishes = [{','.join(data_json for _, data_json, _ in fragments)}];
+            const positions = {json.dumps(self.positions.round(2).tolist())};
+            const velocities = {json.dumps(self.velocities.round(3).tolist())};
             const bounds = {{ width: {self.width}, height: {self.height} }};
 
+            // 從伺服器端目前的狀態接續
+            fishes.forEach((fish, i) => {{
+                fish.pos = positions[i];
+                fish.vel = velocities[i];
+            }});
+
             function updateFish(fish) {{
                 // 更新位置
                 fish.pos[0] += fish.vel[0];
                 fish.pos[1] += fish.vel[1];
 
                 // 隨機微調速度
-                if (Math.random() < 0.02) {{
-                    fish.vel[0] += Math.random() * 0.6 - 0.3;
-                    fish.vel[1] += Math.random() * 0.6 - 0.3;
+                if (Math.random() < {JITTER_PROBABILITY}) {{
+                    fish.vel[0] += Math.random() * {2 * JITTER_AMOUNT} - {JITTER_AMOUNT};
+                    fish.vel[1] += Math.random() * {2 * JITTER_AMOUNT} - {JITTER_AMOUNT};
                 }}
 
                 // 邊界碰撞檢測
@@ -168,12 +630,12 @@ class FishTank:
 
                 // 速度限制
                 const speed = Math.sqrt(fish.vel[0]**2 + fish.vel[1]**2);
-                if (speed > 4) {{
-                    fish.vel[0] = (fish.vel[0] / speed) * 4;
-                    fish.vel[1] = (fish.vel[1] / speed) * 4;
-                }} else if (speed < 1.5) {{
-                    fish.vel[0] = (fish.vel[0] / speed) * 1.5;
-                    fish.vel[1] = (fish.vel[1] / speed) * 1.5;
+                if (speed > {MAX_SPEED}) {{
+                    fish.vel[0] = (fish.vel[0] / speed) * {MAX_SPEED};
+                    fish.vel[1] = (fish.vel[1] / speed) * {MAX_SPEED};
+                }} else if (speed < {MIN_SPEED}) {{
+                    fish.vel[0] = (fish.vel[0] / speed) * {MIN_SPEED};
+                    fish.vel[1] = (fish.vel[1] / speed) * {MIN_SPEED};
                 }}
             }}
 
@@ -183,19 +645,7 @@ class FishTank:
                     
                     const fishElement = document.getElementById(fish.id);
                     if (fishElement) {{
-                        // 更新 DOM
-                        fishElement.style.transform = `translate(${'{'}fish.pos[0]{'}'}px, ${'{'}fish.pos[1]{'}'}px)`;
-                        
-                        // 根據速度方向更新圖片
-                        if (fish.vel[0] < 0) {{
-                            if (fishElement.src !== fish.sprite_left) {{
-                                fishElement.src = fish.sprite_left;
-                            }}
-                        }} else {{
-                            if (fishElement.src !== fish.sprite_right) {{
-                                fishElement.src = fish.sprite_right;
-                            }}
-                        }}
+                        {direction_js}
                     }}
                 }});
                 
@@ -211,4 +661,109 @@ class FishTank:
         </script>
         """
 
-        return tank_html + js_script
\ No newline at end of file
+        return tank_html + js_script
+
+    def _render_canvas_html(self) -> str:
+        """
+        以單一 <canvas> 繪製整個魚缸，適合數千隻魚的情況。
+
+        相同內容的 sprite 只送一次，並在瀏覽器端預先解碼成 `ImageBitmap`；
+        位置、速度與尺寸存放在 typed array 中，每一幀只需一次清除與 N 次 drawImage，
+        不會產生任何 DOM 版面配置或圖片重新解碼的工作。
+        """
+        sprite_index = {}
+        fish_sprites = [sprite_index.setdefault(fish.png, len(sprite_index)) for fish in self.fishes]
+        sprite_uris = [f"data:image/png;base64,{base64.b64encode(png).decode()}" for png in sprite_index]
+        pos_x, pos_y = self.positions.T.round(2).tolist()
+        vel_x, vel_y = self.velocities.T.round(3).tolist()
+        widths, heights = self.sizes.T.tolist()
+
+        canvas_html = f"""
+            <canvas id="fish-canvas" width="{self.width}" height="{self.height}" style="
+                position: absolute; left: 0; top: 0;
+            "></canvas>
+            """
+        tank_html = self._tank_container(canvas_html)
+        if not self.fishes:
+            return tank_html
+
+        js_script = f"""
+        <script>
+        // 確保腳本只執行一次
+        if (!window.fishAnimationStarted) {{
+            window.fishAnimationStarted = true;
+
+            const canvas = document.getElementById('fish-canvas');
+            const ctx = canvas.getContext('2d');
+            const spriteUris = {json.dumps(sprite_uris)};
+            const n = {len(self.fishes)};
+            const spriteOf = Int32Array.from({json.dumps(fish_sprites)});
+            const px = Float32Array.from({json.dumps(pos_x)});
+            const py = Float32Array.from({json.dumps(pos_y)});
+            const vx = Float32Array.from({json.dumps(vel_x)});
+            const vy = Float32Array.from({json.dumps(vel_y)});
+            const w = Float32Array.from({json.dumps(widths)});
+            const h = Float32Array.from({json.dumps(heights)});
+            const maxX = {self.width}, maxY = {self.height};
+
+            async function loadBitmap(uri) {{
+                const img = new Image();
+                img.src = uri;
+                await img.decode();
+                return createImageBitmap(img);
+            }}
+
+            function step() {{
+                for (let i = 0; i < n; i++) {{
+                    // 更新位置
+                    px[i] += vx[i];
+                    py[i] += vy[i];
+
+                    // 隨機微調速度
+                    if (Math.random() < {JITTER_PROBABILITY}) {{
+                        vx[i] += Math.random() * {2 * JITTER_AMOUNT} - {JITTER_AMOUNT};
+                        vy[i] += Math.random() * {2 * JITTER_AMOUNT} - {JITTER_AMOUNT};
+                    }}
+
+                    // 邊界碰撞檢測
+                    if (px[i] < 0) {{ px[i] = 0; vx[i] = -vx[i]; }}
+                    else if (px[i] > maxX - w[i]) {{ px[i] = maxX - w[i]; vx[i] = -vx[i]; }}
+                    if (py[i] < 0) {{ py[i] = 0; vy[i] = -vy[i]; }}
+                    else if (py[i] > maxY - h[i]) {{ py[i] = maxY - h[i]; vy[i] = -vy[i]; }}
+
+                    // 速度限制
+                    const speed = Math.sqrt(vx[i] * vx[i] + vy[i] * vy[i]);
+                    if (speed > {MAX_SPEED}) {{
+                        vx[i] = vx[i] / speed * {MAX_SPEED};
+                        vy[i] = vy[i] / speed * {MAX_SPEED};
+                    }} else if (speed < {MIN_SPEED}) {{
+                        vx[i] = vx[i] / speed * {MIN_SPEED};
+                        vy[i] = vy[i] / speed * {MIN_SPEED};
+                    }}
+                }}
+            }}
+
+            Promise.all(spriteUris.map(loadBitmap)).then(bitmaps => {{
+                function animate() {{
+                    step();
+                    ctx.setTransform(1, 0, 0, 1, 0, 0);
+                    ctx.clearRect(0, 0, maxX, maxY);
+                    for (let i = 0; i < n; i++) {{
+                        // 朝左時以水平鏡像的變換矩陣繪製同一張 bitmap
+                        if (vx[i] < 0) {{
+                            ctx.setTransform(-1, 0, 0, 1, px[i] + w[i], py[i]);
+                        }} else {{
+                            ctx.setTransform(1, 0, 0, 1, px[i], py[i]);
+                        }}
+                        ctx.drawImage(bitmaps[spriteOf[i]], 0, 0, w[i], h[i]);
+                    }}
+                    // 請求下一幀
+                    requestAnimationFrame(animate);
+                }}
+                animate();
+            }});
+        }}
+        </script>
+        """
+
+        return tank_html + js_script
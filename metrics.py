@@ -0,0 +1,168 @@
+# 效能量測與指標匯出 (metrics.py)
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# 預設關閉；設定 FISH_METRICS=1 或呼叫 enable() 後才開始記錄
+_enabled = os.environ.get("FISH_METRICS", "0") == "1"
+
+# 直方圖的上界 (秒)，與 Prometheus 用戶端函式庫的預設值相近，另外補上微秒級的區間
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """一個階段的耗時直方圖：每個區間的次數、總耗時與總次數。"""
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) # 最後一格是 +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """以區間內線性內插估計分位數 (秒)，與 Prometheus 的 histogram_quantile 相同。"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if cumulative + n >= rank and n > 0:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                if i == len(BUCKETS):
+                    return lower # 落在 +Inf 區間時只能回報最後一個上界
+                return lower + (BUCKETS[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return BUCKETS[-1]
+
+_histograms = {}
+_lock = threading.Lock()
+
+def enable(flag=True):
+    """開啟或關閉記錄 (整個行程共用)。"""
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    """目前是否正在記錄。"""
+    return _enabled
+
+def observe(stage, seconds):
+    """記錄一次耗時。"""
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+_NULL_TIMER = nullcontext()
+
+def timer(stage):
+    """
+    量測 with 區塊耗時的 context manager；關閉時回傳共用的空 context，幾乎沒有成本。
+
+    Args:
+        stage (str): 階段名稱，例如 "model.predict_images"。
+    """
+    return _Timer(stage) if _enabled else _NULL_TIMER
+
+def timed(stage):
+    """
+    量測函式耗時的裝飾器；關閉時只多一次全域變數檢查。
+
+    Args:
+        stage (str): 階段名稱。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def reset():
+    """清除所有已記錄的資料。"""
+    with _lock:
+        _histograms.clear()
+
+def snapshot():
+    """
+    回傳所有階段的統計摘要。
+
+    Returns:
+        dict: 階段名稱對應 count、總耗時、平均與估計的 p50 / p95 / p99 (毫秒)，
+              以及每個區間的累積次數。
+    """
+    with _lock:
+        items = [(stage, list(h.counts), h.total, h.count, h) for stage, h in sorted(_histograms.items())]
+        summary = {}
+        for stage, counts, total, count, histogram in items:
+            cumulative, buckets = 0, {}
+            for bound, n in zip(list(BUCKETS) + ["+Inf"], counts):
+                cumulative += n
+                buckets[str(bound)] = cumulative
+            summary[stage] = {
+                "count": count,
+                "sum_seconds": total,
+                "mean_ms": total / count * 1000 if count else None,
+                "p50_ms": _to_ms(histogram.quantile(0.5)),
+                "p95_ms": _to_ms(histogram.quantile(0.95)),
+                "p99_ms": _to_ms(histogram.quantile(0.99)),
+                "buckets": buckets,
+            }
+    return summary
+
+def _to_ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+def export_json():
+    """以 JSON 字串匯出 `snapshot()`。"""
+    return json.dumps(snapshot(), ensure_ascii=False, indent=2)
+
+def export_prometheus(metric="fish_stage_duration_seconds"):
+    """
+    以 Prometheus 文字格式 (text exposition format) 匯出所有直方圖。
+
+    Args:
+        metric (str): 指標名稱。
+
+    Returns:
+        str: 可直接由 Prometheus 抓取的文字。
+    """
+    lines = [
+        f"# HELP {metric} Duration of each serving stage in seconds.",
+        f"# TYPE {metric} histogram",
+    ]
+    for stage, stats in snapshot().items():
+        for bound, cumulative in stats["buckets"].items():
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{stage="{stage}"}} {stats["sum_seconds"]}')
+        lines.append(f'{metric}_count{{stage="{stage}"}} {stats["count"]}')
+    return "\n".join(lines) + "\n"
@@ -1,167 +1,1459 @@
 # AI 模型 (model.py)
 import numpy as np
 import os
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
-from sklearn.model_selection import train_test_split
+import json
+import queue
+import shutil
+import threading
+import time
+import zlib
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import Future
 
 # 匯入我們自己的 utils 函式
-from app_utils import load_quickdraw_images
+from app_utils import download_quickdraw_datasets, open_quickdraw_memmap
+from metrics import timed
+
+# TensorFlow 與 scikit-learn 只在訓練、匯出或使用 Keras 後端時才延遲匯入，
+# 讓使用 NumPy / TFLite 後端的服務路徑不必付出它們的啟動時間與記憶體。
+
+# 推論後端，可用環境變數 FISH_MODEL_BACKEND 設定 ("numpy" 或 "keras")
+DEFAULT_BACKEND = os.environ.get("FISH_MODEL_BACKEND", "numpy")
 
 # --- 1. 模型架構定義 ---
-def create_cnn_model(input_shape=(28, 28, 1)):
+def create_cnn_model(input_shape=(28, 28, 1), filters=(32, 64), dense_units=128, dropout=0.5):
     """
     建立一個用於二分類的 CNN 模型。
 
     Args:
         input_shape (tuple): 輸入圖片的形狀。
+        filters (tuple): 兩個卷積層的濾波器數量。
+        dense_units (int): 全連接層的神經元數量。
+        dropout (float): 全連接層之後的 Dropout 比例。
 
     Returns:
         tf.keras.Model: 一個未經編譯的 Keras 模型。
     """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Rescaling, Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+
     model = Sequential([
+        # 正規化像素值到 0-1 之間；模型直接接收 uint8 (0-255) 圖片，呼叫端不需自行除以 255
+        # (這一層沒有權重，舊版不含此層的權重檔仍可直接載入)
+        Rescaling(1.0 / 255, input_shape=input_shape),
+
         # 層 1: 卷積層 + 池化層
-        Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
+        Conv2D(filters[0], (3, 3), activation='relu'),
         MaxPooling2D((2, 2)),
         
         # 層 2: 卷積層 + 池化層
-        Conv2D(64, (3, 3), activation='relu'),
+        Conv2D(filters[1], (3, 3), activation='relu'),
         MaxPooling2D((2, 2)),
         
         # 層 3: 扁平化層
         Flatten(),
         
         # 層 4: 全連接層
-        Dense(128, activation='relu'),
-        Dropout(0.5), # 加入 Dropout 防止過擬合
+        Dense(dense_units, activation='relu'),
+        Dropout(dropout), # 加入 Dropout 防止過擬合
         
-        # 輸出層: 二分類，使用 sigmoid 激活函數
-        Dense(1, activation='sigmoid')
+        # 輸出層: 二分類，使用 sigmoid 激活函數 (混合精度訓練時仍以 float32 輸出，維持數值穩定)
+        Dense(1, activation='sigmoid', dtype='float32')
     ])
     
     return model
 
+def create_gap_model(input_shape=(28, 28, 1), filters=(32, 64)):
+    """
+    與 `create_cnn_model` 相同的卷積層，但以全域平均池化取代 Flatten -> Dense(128)。
+
+    原本的全連接層佔了絕大部分的參數與運算量，改成每個通道取平均後
+    直接接到輸出層，參數量約為原本的十分之一。
+
+    Args:
+        input_shape (tuple): 輸入圖片的形狀。
+        filters (tuple): 兩個卷積層的濾波器數量。
+
+    Returns:
+        tf.keras.Model: 一個未經編譯的 Keras 模型。
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Rescaling, Conv2D, MaxPooling2D, GlobalAveragePooling2D, Dense
+
+    return Sequential([
+        Rescaling(1.0 / 255, input_shape=input_shape),
+        Conv2D(filters[0], (3, 3), activation='relu'),
+        MaxPooling2D((2, 2)),
+        Conv2D(filters[1], (3, 3), activation='relu'),
+        MaxPooling2D((2, 2)),
+        GlobalAveragePooling2D(), # (5, 5, C) -> (C,)
+        Dense(1, activation='sigmoid', dtype='float32'),
+    ])
+
+def create_separable_model(input_shape=(28, 28, 1), filters=(16, 32, 64)):
+    """
+    以深度可分離卷積 (depthwise + pointwise) 為主、全域平均池化收尾的輕量模型。
+
+    第一層只有一個輸入通道，深度可分離卷積沒有好處，因此仍使用一般卷積；
+    之後每一層的運算量約為一般 3x3 卷積的 1/9 + 1/C_out。
+
+    Args:
+        input_shape (tuple): 輸入圖片的形狀。
+        filters (tuple): 三個卷積層的濾波器數量。
+
+    Returns:
+        tf.keras.Model: 一個未經編譯的 Keras 模型。
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import (Rescaling, Conv2D, SeparableConv2D, MaxPooling2D,
+                                         GlobalAveragePooling2D, Dense)
+
+    return Sequential([
+        Rescaling(1.0 / 255, input_shape=input_shape),
+        Conv2D(filters[0], (3, 3), activation='relu'), # (26, 26)
+        MaxPooling2D((2, 2)), # (13, 13)
+        SeparableConv2D(filters[1], (3, 3), activation='relu'), # (11, 11)
+        MaxPooling2D((2, 2)), # (5, 5)
+        SeparableConv2D(filters[2], (3, 3), activation='relu'), # (3, 3)
+        GlobalAveragePooling2D(),
+        Dense(1, activation='sigmoid', dtype='float32'),
+    ])
+
+# 可用的模型架構，名稱用於命令列與超參數搜尋
+ARCHITECTURES = {
+    "cnn": create_cnn_model,
+    "gap": create_gap_model,
+    "separable": create_separable_model,
+}
+
+def build_model_from_file(model_path):
+    """
+    依權重檔中記錄的架構 (`model.save()` 寫入的 model_config) 重建未載入權重的模型。
+
+    只有權重 (`save_weights()`) 或是加入 Rescaling 層之前的舊版檔案，一律視為
+    預設的 `create_cnn_model`。
+
+    Args:
+        model_path (str): Keras 權重檔 (`.h5`) 路徑。
+
+    Returns:
+        tf.keras.Model: 尚未載入權重的模型。
+    """
+    import tensorflow as tf
+
+    config = read_model_config(model_path)
+    if config is None or not any(layer["class_name"] == "Rescaling" for layer in config["config"]["layers"]):
+        return create_cnn_model()
+    return tf.keras.models.model_from_json(json.dumps(config))
+
+def read_model_config(model_path):
+    """讀取 `.h5` 檔中的 model_config (dict)；沒有時回傳 None。"""
+    import h5py
+
+    with h5py.File(model_path, "r") as f:
+        config = f.attrs.get("model_config")
+    if config is None:
+        return None
+    return json.loads(config.decode() if isinstance(config, bytes) else config)
+
 # --- 2. 訓練與儲存模型 ---
-def train_and_save_model(model_path="fish_classifier.h5"):
+# 正樣本類別與預設的負樣本類別 (我們使用貓的資料集作為 "非魚" 的代表)
+POSITIVE_CATEGORY = "fish"
+NEGATIVE_CATEGORIES = ("cat",)
+
+def split_category_indices(category, total, cap=None, val_fraction=0.2, seed=42):
+    """
+    為單一類別隨機選出最多 `cap` 張圖片，並切分成訓練與驗證索引。
+
+    亂數種子同時取決於 `seed` 與類別名稱，因此同樣的設定永遠得到同樣的切分。
+
+    Returns:
+        tuple: (train_indices, val_indices)，皆已排序以利循序讀取。
+    """
+    rng = np.random.default_rng([seed, zlib.crc32(category.encode())])
+    n = total if cap is None else min(cap, total)
+    chosen = rng.choice(total, size=n, replace=False)
+    n_val = int(round(n * val_fraction))
+    return np.sort(chosen[n_val:]), np.sort(chosen[:n_val])
+
+def prepare_category_sources(positive=POSITIVE_CATEGORY, negatives=NEGATIVE_CATEGORIES,
+                             max_items=10000, caps=None, val_fraction=0.2, seed=42):
+    """
+    以記憶體映射開啟正負樣本類別，並決定每個類別的訓練/驗證索引。
+
+    Args:
+        positive (str): 正樣本 (標籤 1) 的類別名稱。
+        negatives (list): 負樣本 (標籤 0) 的類別名稱列表。
+        max_items (int): 每個類別預設最多使用的圖片數量，None 表示全部。
+        caps (dict): 個別類別的數量上限，例如 {"cat": 5000}，會覆蓋 max_items。
+        val_fraction (float): 驗證集比例。
+        seed (int): 切分使用的亂數種子。
+
+    Returns:
+        list: 每個類別一個 dict (name, images, label, train, val)；
+              任一類別無法載入時回傳 None。
+    """
+    caps = caps or {}
+    # 先以執行緒池平行下載所有類別，之後的開啟都會直接命中快取
+    download_quickdraw_datasets([positive] + list(negatives))
+
+    sources = []
+    for name, label in [(positive, 1.0)] + [(negative, 0.0) for negative in negatives]:
+        images = open_quickdraw_memmap(name)
+        if images is None:
+            print(f"錯誤：無法載入類別 '{name}'，請檢查 utils.py 或網路連線。")
+            return None
+        train, val = split_category_indices(name, len(images), caps.get(name, max_items), val_fraction, seed)
+        sources.append({"name": name, "images": images, "label": label, "train": train, "val": val})
+        print(f"類別 '{name}' (標籤 {int(label)}): 訓練 {len(train)} 張，驗證 {len(val)} 張")
+    return sources
+
+# 切分好的資料集快取位置，可用環境變數 FISH_SPLIT_DIR 設定
+SPLIT_CACHE_DIR = os.environ.get("FISH_SPLIT_DIR", "splits")
+# 快取格式的版本，格式改變時遞增，舊版的快取就不會被誤用
+SPLIT_FORMAT_VERSION = 1
+
+def split_cache_key(positive=POSITIVE_CATEGORY, negatives=NEGATIVE_CATEGORIES,
+                    max_items=10000, caps=None, val_fraction=0.2, seed=42):
+    """
+    以切分設定計算快取的鍵值。
+
+    Returns:
+        tuple: (key, spec)。key 是設定內容的雜湊值，spec 是記錄在 manifest 中的設定。
+    """
+    spec = {
+        "format_version": SPLIT_FORMAT_VERSION,
+        "positive": positive,
+        "negatives": list(negatives),
+        "max_items": max_items,
+        "caps": dict(sorted((caps or {}).items())),
+        "val_fraction": val_fraction,
+        "seed": seed,
+    }
+    digest = hashlib.blake2b(json.dumps(spec, sort_keys=True).encode(), digest_size=8)
+    return digest.hexdigest(), spec
+
+def build_split_cache(positive=POSITIVE_CATEGORY, negatives=NEGATIVE_CATEGORIES, max_items=10000,
+                      caps=None, val_fraction=0.2, seed=42, cache_dir=None, rebuild=False, chunk_size=4096):
+    """
+    將訓練/驗證切分一次寫成可記憶體映射的 uint8 `.npy` 檔與 manifest。
+
+    每個類別一個檔案，前段是訓練集、後段是驗證集，皆為連續的資料列，
+    之後的訓練可以循序讀取，不必再開啟完整的 QuickDraw 檔案並隨機取樣。
+    所有檔案先寫在暫存資料夾，完成後才以改名的方式發布。
+
+    Args:
+        positive, negatives, max_items, caps, val_fraction, seed: 與 `prepare_category_sources` 相同。
+        cache_dir (str): 快取資料夾，None 表示使用 `SPLIT_CACHE_DIR`。
+        rebuild (bool): 已有快取時是否仍重新建立。
+        chunk_size (int): 每次從原始檔案複製的圖片數量。
+
+    Returns:
+        str: 這個設定的快取資料夾路徑；無法載入資料時回傳 None。
+    """
+    key, spec = split_cache_key(positive, negatives, max_items, caps, val_fraction, seed)
+    cache_dir = cache_dir or SPLIT_CACHE_DIR
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, "manifest.json")) and not rebuild:
+        return path
+
+    sources = prepare_category_sources(positive, negatives, max_items, caps, val_fraction, seed)
+    if sources is None:
+        return None
+
+    print(f"--- 建立資料集快取 {path} ---")
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    categories = []
+    for source in sources:
+        indices = np.concatenate([source["train"], source["val"]])
+        file_name = f"{source['name']}.npy"
+        out = np.lib.format.open_memmap(
+            os.path.join(tmp_path, file_name), mode="w+", dtype=np.uint8, shape=(len(indices), 28, 28)
+        )
+        for start in range(0, len(indices), chunk_size):
+            out[start:start + chunk_size] = source["images"][indices[start:start + chunk_size]]
+        out.flush()
+        del out
+        categories.append({
+            "name": source["name"],
+            "label": source["label"],
+            "file": file_name,
+            "train": len(source["train"]),
+            "val": len(source["val"]),
+            "source_size": len(source["images"]),
+        })
+
+    manifest = {"key": key, "spec": spec, "created_at": time.time(), "categories": categories}
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # 另一個行程已經先完成了同一個快取，使用它的版本即可
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+def open_split_cache(cache_dir=None, **kwargs):
+    """
+    開啟 (必要時先建立) 資料集快取，回傳與 `prepare_category_sources` 相同格式的類別列表。
+
+    圖片以唯讀的記憶體映射開啟，不會整份讀入記憶體。
+
+    Args:
+        cache_dir (str): 快取資料夾，None 表示使用 `SPLIT_CACHE_DIR`。
+        **kwargs: 傳給 `build_split_cache` 的切分設定。
+
+    Returns:
+        list: 每個類別一個 dict (name, images, label, train, val)；無法載入資料時回傳 None。
+    """
+    path = build_split_cache(cache_dir=cache_dir, **kwargs)
+    if path is None:
+        return None
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    sources = []
+    for category in manifest["categories"]:
+        n_train, n_val = category["train"], category["val"]
+        sources.append({
+            "name": category["name"],
+            "images": np.load(os.path.join(path, category["file"]), mmap_mode="r"),
+            "label": category["label"],
+            "train": np.arange(n_train),
+            "val": np.arange(n_train, n_train + n_val),
+        })
+    return sources
+
+def load_split(split="val", **kwargs):
+    """
+    將某個切分的圖片全部讀入記憶體 (uint8，未正規化)，供評估或量化校正使用。
+
+    Args:
+        split (str): "train" 或 "val"。
+        **kwargs: 傳給 `open_split_cache` 的參數。
+
+    Returns:
+        tuple: (X, y)；若無法載入資料則回傳 (None, None)。
+    """
+    sources = open_split_cache(**kwargs)
+    if sources is None:
+        return None, None
+    X = np.concatenate([source["images"][source[split]] for source in sources], axis=0)
+    y = np.concatenate([np.full(len(source[split]), source["label"]) for source in sources], axis=0)
+    return X, y
+
+def load_validation_split(**kwargs):
+    """
+    取得與 `train_and_save_model` 完全相同的驗證集 (uint8 圖片，未正規化)。
+
+    Returns:
+        tuple: (X_val, y_val)；若無法載入資料則回傳 (None, None)。
+    """
+    return load_split("val", **kwargs)
+
+def build_dataset(sources, split="train", batch_size=128, shuffle_buffer=10000, shard_size=1024, seed=42):
+    """
+    建立串流式的 `tf.data` 管線，不需把整個資料集載入記憶體。
+
+    每個類別的索引被切成多個 shard，shard 以 `interleave` 平行讀取並交錯混合，
+    接著以緩衝區洗牌、分批。圖片全程維持 uint8，正規化由模型的 Rescaling 層負責。
+    常駐記憶體只與 shuffle_buffer、batch_size 與 prefetch 深度有關。
+
+    Args:
+        sources (list): `prepare_category_sources` 的回傳值。
+        split (str): "train" 或 "val"；只有訓練集會洗牌。
+        batch_size (int): 每批的圖片數量。
+        shuffle_buffer (int): 洗牌緩衝區的圖片數量。
+        shard_size (int): 每個 shard 的圖片數量。
+        seed (int): 洗牌使用的亂數種子。
+
+    Returns:
+        tuple: (tf.data.Dataset, 圖片總數)。
+    """
+    import tensorflow as tf
+
+    training = split == "train"
+    tasks = np.array([
+        (source_id, start, min(start + shard_size, len(source[split])))
+        for source_id, source in enumerate(sources)
+        for start in range(0, len(source[split]), shard_size)
+    ], dtype=np.int64).reshape(-1, 3)
+
+    def read_shard(source_id, start, stop):
+        # 只從映射陣列複製這個 shard 的圖片
+        source = sources[source_id]
+        indices = source[split][start:stop]
+        return source["images"][indices], np.full(len(indices), source["label"], dtype=np.float32)
+
+    def load_shard(task):
+        images, labels = tf.numpy_function(read_shard, [task[0], task[1], task[2]], [tf.uint8, tf.float32])
+        images.set_shape([None, 28, 28])
+        labels.set_shape([None])
+        return tf.data.Dataset.from_tensor_slices((images, labels))
+
+    def add_channel(images, labels):
+        # 增加 "channel" 維度 (N, 28, 28) -> (N, 28, 28, 1)
+        return tf.expand_dims(images, axis=-1), labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(tasks)
+    if training:
+        dataset = dataset.shuffle(len(tasks), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        load_shard,
+        cycle_length=max(len(sources), 2),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training,
+    )
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(add_channel, num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.prefetch(tf.data.AUTOTUNE)
+    return dataset, sum(len(source[split]) for source in sources)
+
+def make_throughput_logger(images_per_epoch):
+    """
+    建立一個 Keras callback，在每個週期結束時印出訓練耗時與 images/sec。
+    """
+    import tensorflow as tf
+
+    class ThroughputLogger(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self._start = time.perf_counter()
+            self._train_seconds = None
+
+        def on_test_begin(self, logs=None):
+            # 只計算訓練部分，排除週期末的驗證時間
+            if self._train_seconds is None:
+                self._train_seconds = time.perf_counter() - self._start
+
+        def on_epoch_end(self, epoch, logs=None):
+            train_seconds = self._train_seconds or (time.perf_counter() - self._start)
+            throughput = images_per_epoch / train_seconds
+            print(f"週期 {epoch + 1}: 訓練耗時 {train_seconds:.1f} 秒，{throughput:.0f} images/sec")
+            if logs is not None:
+                logs["images_per_sec"] = throughput
+                logs["epoch_seconds"] = train_seconds
+
+    return ThroughputLogger()
+
+# 快速訓練模式：每個核心分到的批次大小與批次大小的上限
+FAST_BATCH_PER_CORE = 64
+FAST_MAX_BATCH_SIZE = 1024
+
+def available_cores():
+    """目前行程可使用的 CPU 核心數 (會考慮 taskset 等親和性設定)。"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def cpu_supports_bfloat16():
+    """CPU 是否有原生的 bfloat16 指令 (AVX512_BF16 或 AMX)；無法判斷時回傳 False。"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line.split(":", 1)[1].split() for line in f if line.startswith("flags")), [])
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def configure_fast_training(threads=None, mixed_precision=None):
+    """
+    為快速訓練設定 TensorFlow：執行緒數與 bfloat16 混合精度。
+
+    必須在 TensorFlow 執行任何運算之前呼叫，執行緒設定才會生效。
+
+    Args:
+        threads (int): 單一運算內部使用的執行緒數，None 表示使用所有可用核心。
+        mixed_precision (bool): 是否使用 bfloat16 混合精度，None 表示 CPU 支援時才開啟。
+
+    Returns:
+        dict: 實際套用的設定 (threads、mixed_precision)。
+    """
+    import tensorflow as tf
+
+    threads = threads or available_cores()
+    if mixed_precision is None:
+        mixed_precision = cpu_supports_bfloat16()
+
+    # 小模型的運算之間幾乎沒有可平行的部分，核心留給單一運算內部的平行化
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+    if mixed_precision:
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    return {"threads": threads, "mixed_precision": mixed_precision}
+
+def fast_batch_size(cores=None):
+    """依可用核心數決定快速模式的批次大小 (至少 128，最多 `FAST_MAX_BATCH_SIZE`)。"""
+    cores = cores or available_cores()
+    return int(min(max(128, FAST_BATCH_PER_CORE * cores), FAST_MAX_BATCH_SIZE))
+
+def make_distillation_model(student, teacher):
+    """
+    把學生與教師模型包成一個訓練用模型，輸出 [學生機率, 教師 logit]。
+
+    教師模型凍結且以推論模式執行，只有學生的權重會被更新；訓練完成後
+    只儲存學生模型本身。
+    """
+    import tensorflow as tf
+
+    teacher.trainable = False
+    # 從檔案重建的教師可能與學生同名 (例如都叫 sequential)，包一層另外命名
+    teacher = tf.keras.Model(teacher.inputs, teacher.outputs, name="teacher")
+    inputs = tf.keras.Input(shape=(28, 28, 1))
+    teacher_prob = tf.clip_by_value(teacher(inputs, training=False), 1e-7, 1 - 1e-7)
+    teacher_logit = tf.math.log(teacher_prob) - tf.math.log1p(-teacher_prob)
+    outputs = tf.keras.layers.Concatenate()([student(inputs), teacher_logit])
+    return tf.keras.Model(inputs, outputs)
+
+def make_distillation_loss(temperature=4.0, alpha=0.5):
+    """
+    知識蒸餾的損失函數：硬標籤的二元交叉熵，加上以溫度軟化後與教師輸出的交叉熵。
+
+    Args:
+        temperature (float): 軟化 logit 的溫度，越高越重視教師對「有多像魚」的判斷。
+        alpha (float): 硬標籤損失的權重，其餘 (1 - alpha) 給教師的軟標籤。
+    """
+    import tensorflow as tf
+
+    def distillation_loss(y_true, y_pred):
+        labels = tf.reshape(tf.cast(y_true, tf.float32), (-1, 1))
+        student_prob = tf.clip_by_value(y_pred[:, :1], 1e-7, 1 - 1e-7)
+        student_logit = tf.math.log(student_prob) - tf.math.log1p(-student_prob)
+        soft_targets = tf.sigmoid(y_pred[:, 1:] / temperature)
+        hard = tf.keras.losses.binary_crossentropy(labels, student_prob)
+        soft = tf.keras.losses.binary_crossentropy(soft_targets, tf.sigmoid(student_logit / temperature))
+        # 乘上 T^2 讓軟標籤梯度的大小不隨溫度改變
+        return alpha * hard + (1 - alpha) * temperature ** 2 * soft
+
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.binary_accuracy(tf.reshape(y_true, (-1, 1)), y_pred[:, :1])
+
+    return distillation_loss, accuracy
+
+def train_and_save_model(model_path="fish_classifier.h5", positive=POSITIVE_CATEGORY,
+                         negatives=NEGATIVE_CATEGORIES, max_items=10000, caps=None,
+                         epochs=10, batch_size=128, shuffle_buffer=10000,
+                         jit_compile=False, learning_rate=0.001, model_params=None,
+                         cache_dir=None, verbose="auto", architecture="cnn",
+                         distill_from=None, temperature=4.0, alpha=0.5):
     """
     載入資料、建立、編譯、訓練並儲存模型。
+
+    Args:
+        model_path (str): 模型的儲存路徑。
+        positive (str): 正樣本類別。
+        negatives (list): 任意數量的負樣本類別。
+        max_items (int): 每個類別預設最多使用的圖片數量，None 表示全部。
+        caps (dict): 個別類別的數量上限。
+        epochs (int): 訓練週期數。
+        batch_size (int): 每批的圖片數量。
+        shuffle_buffer (int): 洗牌緩衝區的圖片數量。
+        jit_compile (bool): 是否以 XLA 編譯訓練步驟。
+        learning_rate (float): Adam 的學習率。
+        model_params (dict): 傳給架構建構函式的參數 (例如 filters、dense_units、dropout)。
+        cache_dir (str): 資料集快取資料夾，None 表示使用 `SPLIT_CACHE_DIR`。
+        verbose: 傳給 `model.fit` 的 verbose。
+        architecture (str): `ARCHITECTURES` 中的架構名稱。
+        distill_from (str): 教師模型的權重檔路徑；指定時以知識蒸餾訓練學生模型。
+        temperature (float): 知識蒸餾的溫度。
+        alpha (float): 知識蒸餾中硬標籤損失的權重。
+
+    Returns:
+        dict: 訓練摘要 (總耗時、每個週期的耗時與 images/sec、最終驗證準確率)；
+              無法載入資料時回傳 None。
     """
+    import tensorflow as tf
+
     print("--- 開始模型訓練流程 ---")
-    
-    # 載入正樣本 (魚) 和負樣本 (貓)
-    # 我們使用貓的資料集作為 "非魚" 的代表
-    fish_images = load_quickdraw_images("fish", max_items=10000)
-    cat_images = load_quickdraw_images("cat", max_items=10000)
-    
-    if fish_images.size == 0 or cat_images.size == 0:
-        print("錯誤：無法載入訓練資料，請檢查 utils.py 或網路連線。")
-        return
 
-    # 建立標籤：1 代表 '魚', 0 代表 '非魚' (貓)
-    fish_labels = np.ones(fish_images.shape[0])
-    cat_labels = np.zeros(cat_images.shape[0])
-    
-    # 合併資料與標籤
-    X = np.concatenate((fish_images, cat_images), axis=0)
-    y = np.concatenate((fish_labels, cat_labels), axis=0)
-    
-    #正規化像素值到 0-1 之間
-    X = X.astype('float32') / 255.0
-    
-    # 增加一個 "channel" 維度，以符合 CNN 輸入 (N, 28, 28) -> (N, 28, 28, 1)
-    X = np.expand_dims(X, axis=-1)
-    
-    # 切分訓練集和驗證集
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    
-    print(f"訓練資料形狀: {X_train.shape}")
-    print(f"驗證資料形狀: {X_val.shape}")
-    
+    sources = open_split_cache(cache_dir, positive=positive, negatives=negatives, max_items=max_items, caps=caps)
+    if sources is None:
+        return None
+
+    train_dataset, n_train = build_dataset(sources, "train", batch_size, shuffle_buffer)
+    val_dataset, n_val = build_dataset(sources, "val", batch_size)
+
+    print(f"訓練資料形狀: {(n_train, 28, 28, 1)}")
+    print(f"驗證資料形狀: {(n_val, 28, 28, 1)}")
+
     # 建立模型
-    model = create_cnn_model(input_shape=X_train.shape[1:])
-    
+    model = ARCHITECTURES[architecture](input_shape=(28, 28, 1), **(model_params or {}))
+    loss, metrics, training_model = 'binary_crossentropy', ['accuracy'], model # 二分類使用二元交叉熵
+    if distill_from is not None:
+        teacher = build_model_from_file(distill_from)
+        teacher.load_weights(distill_from)
+        print(f"以 '{distill_from}' 作為教師模型進行知識蒸餾 (溫度 {temperature}，硬標籤權重 {alpha})")
+        training_model = make_distillation_model(model, teacher)
+        loss, accuracy = make_distillation_loss(temperature, alpha)
+        metrics = [accuracy]
+
     # 編譯模型
-    model.compile(
-        optimizer='adam',
-        loss='binary_crossentropy', # 二分類使用二元交叉熵
-        metrics=['accuracy']
+    training_model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate),
+        loss=loss,
+        metrics=metrics,
+        jit_compile=jit_compile,
     )
-    
+
     print("\n--- 模型摘要 ---")
     model.summary()
-    
+
     # 訓練模型
     print("\n--- 開始訓練 ---")
-    history = model.fit(
-        X_train, y_train,
-        epochs=10, # 為了快速展示，只訓練10個週期
-        batch_size=128,
-        validation_data=(X_val, y_val)
+    start = time.perf_counter()
+    history = training_model.fit(
+        train_dataset,
+        epochs=epochs, # 預設只訓練10個週期以便快速展示
+        validation_data=val_dataset,
+        callbacks=[make_throughput_logger(n_train)],
+        verbose=verbose,
     )
-    
+    seconds = time.perf_counter() - start
+
     # 儲存模型
     print(f"\n--- 訓練完成，儲存模型至 {model_path} ---")
     model.save(model_path)
     print("模型儲存成功！")
 
-# --- 3. 載入與預測 ---
-def load_ai_model(model_path="fish_classifier.h5"):
+    summary = {
+        "seconds": seconds,
+        "epoch_seconds": history.history["epoch_seconds"],
+        "epoch_images_per_sec": history.history["images_per_sec"],
+        "val_accuracy": float(history.history["val_accuracy"][-1]),
+        "params": model.count_params(),
+        "architecture": architecture,
+        "distilled_from": distill_from,
+        "batch_size": batch_size,
+        "jit_compile": jit_compile,
+        "mixed_precision": tf.keras.mixed_precision.global_policy().name != "float32",
+    }
+    print(f"總訓練時間 {seconds:.1f} 秒，最終驗證準確率 {summary['val_accuracy']:.4f}")
+    return summary
+
+# --- 3. 推論引擎 ---
+def weights_fingerprint(arrays):
+    """以所有權重陣列的內容計算雜湊值，用來判斷已載入的權重是否改變。"""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+class InferenceEngine:
+    """
+    包裝 Keras 模型的低延遲推論引擎。
+
+    `model.predict` 每次呼叫都會建立資料轉接器並跑完整的預測迴圈，
+    對單張 28x28 圖片來說開銷遠大於運算本身。這裡改用固定輸入簽章的
+    `tf.function` 直接呼叫 `model(x, training=False)`，只在建立時追蹤並
+    暖機一次，之後每次推論都直接執行已編譯好的計算圖。
+    """
+    def __init__(self, model, warmup=True):
+        """
+        Args:
+            model (tf.keras.Model): 已載入權重的 Keras 模型。
+            warmup (bool): 是否在建立時先執行一次推論以完成追蹤。
+        """
+        import tensorflow as tf
+
+        self.model = model
+        self.fingerprint = weights_fingerprint(model.get_weights())
+        # 推論時的輸入簽章：批次大小可變，其餘維度固定為 (28, 28, 1) 的 uint8
+        self._forward = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec(shape=(None, 28, 28, 1), dtype=tf.uint8)],
+        )
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        """以全黑圖片執行一次推論，讓計算圖的追蹤成本發生在快取模型時而非第一次點擊時。"""
+        self.predict_proba(np.zeros((1, 28, 28), dtype=np.uint8))
+
+    def load_weights(self, model_path):
+        """重新載入權重 (例如重新訓練之後)，並更新權重指紋。"""
+        self.model.load_weights(model_path)
+        self.fingerprint = weights_fingerprint(self.model.get_weights())
+
+    def predict_proba(self, images):
+        """
+        計算一批圖片為魚的機率。
+
+        Args:
+            images (np.array): 形狀為 (N, 28, 28) 的 uint8 圖片 (黑底白線)。
+
+        Returns:
+            np.array: 形狀為 (N,) 的 float32 機率陣列。
+        """
+        import tensorflow as tf
+
+        batch = np.expand_dims(images.astype(np.uint8, copy=False), axis=-1) # (N, 28, 28, 1)
+        return self._forward(tf.convert_to_tensor(batch)).numpy()[:, 0]
+
+class TFLiteEngine:
+    """
+    只使用 TFLite 直譯器的推論引擎，介面與 `InferenceEngine` 相同。
+
+    支援 float32 / float16 模型，以及輸入輸出皆為量化整數的 int8 模型
+    (輸入依直譯器提供的 scale / zero point 量化，輸出再反量化回機率)。
+    """
+    def __init__(self, model_path, num_threads=None):
+        """
+        Args:
+            model_path (str): `.tflite` 檔案路徑。
+            num_threads (int): 直譯器使用的執行緒數，None 表示使用預設值。
+        """
+        try:
+            # 優先使用輕量的 tflite_runtime，沒有安裝時才退回 TensorFlow 內建的直譯器
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self._interpreter_class = Interpreter
+        self._num_threads = num_threads
+        # 直譯器不是執行緒安全的，多個 session 同時呼叫時需要排隊
+        self._lock = threading.Lock()
+        self.load_weights(model_path)
+
+    def load_weights(self, model_path):
+        """重新載入 `.tflite` 檔案，並以檔案內容更新權重指紋。"""
+        with open(model_path, "rb") as f:
+            content = f.read()
+        interpreter = self._interpreter_class(model_content=content, num_threads=self._num_threads)
+        interpreter.allocate_tensors()
+        with self._lock:
+            self.model_path = model_path
+            self.fingerprint = weights_fingerprint([np.frombuffer(content, dtype=np.uint8)])
+            self._interpreter = interpreter
+            self._input = interpreter.get_input_details()[0]
+            self._output = interpreter.get_output_details()[0]
+            self._batch_size = int(self._input["shape"][0])
+            self._input_scale = read_tflite_metadata(model_path)["input_scale"]
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input["index"], [batch_size, 28, 28, 1])
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict_proba(self, images):
+        """
+        計算一批圖片為魚的機率。
+
+        Args:
+            images (np.array): 形狀為 (N, 28, 28) 的 uint8 圖片 (黑底白線)。
+
+        Returns:
+            np.array: 形狀為 (N,) 的 float32 機率陣列。
+        """
+        batch = np.expand_dims(images.astype('float32') * self._input_scale, axis=-1) # (N, 28, 28, 1)
+
+        input_dtype = self._input["dtype"]
+        if input_dtype != np.float32:
+            scale, zero_point = self._input["quantization"]
+            info = np.iinfo(input_dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(input_dtype)
+
+        with self._lock:
+            self._resize(len(batch))
+            self._interpreter.set_tensor(self._input["index"], batch)
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output["index"])
+
+        if self._output["dtype"] != np.float32:
+            scale, zero_point = self._output["quantization"]
+            output = (output.astype('float32') - zero_point) * scale
+        return output[:, 0].astype('float32')
+
+def _conv2d_relu(x, kernel, bias):
+    """以 stride tricks 取出 3x3 視窗 (im2col)，再用一次矩陣乘法完成 valid 卷積與 ReLU。"""
+    kh, kw = kernel.shape[:2]
+    # (N, H', W', C, kh, kw) 的唯讀視圖，不複製資料
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kh, kw), axis=(1, 2))
+    # Keras kernel 形狀為 (kh, kw, C_in, C_out)，對齊視窗的 (C, kh, kw) 軸後做張量縮併
+    out = np.tensordot(windows, kernel, axes=([3, 4, 5], [2, 0, 1]))
+    out += bias
+    return np.maximum(out, 0, out=out)
+
+def _separable_conv2d_relu(x, depthwise, pointwise, bias):
+    """深度可分離的 valid 卷積與 ReLU：每個通道各自做 3x3 卷積，再以 1x1 卷積混合通道。"""
+    kh, kw = depthwise.shape[:2]
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kh, kw), axis=(1, 2))
+    # depthwise kernel 形狀為 (kh, kw, C, M)，M 是 depth_multiplier；pointwise 為 (1, 1, C * M, C_out)
+    x = np.einsum("nhwcij,ijcm->nhwcm", windows, depthwise, optimize=True)
+    # 與 tf.nn.depthwise_conv2d 相同，輸出通道依 c * M + m 排列
+    out = x.reshape(*x.shape[:3], -1) @ pointwise[0, 0]
+    out += bias
+    return np.maximum(out, 0, out=out)
+
+def _max_pool_2x2(x):
+    """2x2、stride 2 的最大池化，與 Keras 一樣捨棄無法整除的最後一列/行。"""
+    n, h, w, c = x.shape
+    h, w = h // 2 * 2, w // 2 * 2
+    return x[:, :h, :w].reshape(n, h // 2, 2, w // 2, 2, c).max(axis=(2, 4))
+
+# NumPy 後端支援的 Keras 層；卷積與池化只支援 stride 1 / valid 與 2x2 的設定
+NUMPY_LAYERS = {
+    "Rescaling": "rescaling",
+    "Conv2D": "conv2d",
+    "SeparableConv2D": "separable_conv2d",
+    "MaxPooling2D": "max_pool",
+    "Flatten": "flatten",
+    "GlobalAveragePooling2D": "global_average_pool",
+    "Dense": "dense",
+}
+# 快取格式的版本，格式改變時遞增，舊的 .npz 快取會被重新產生
+NUMPY_CACHE_VERSION = 3
+
+def _numpy_layer_plan(model_config, weight_layer_names):
+    """
+    把 model_config 轉成 NumPy 後端的層列表 [{"type", "name", ...}]。
+
+    沒有 model_config 的檔案視為預設的 `create_cnn_model`；沒有 Rescaling 層的
+    舊版模型在最前面補上除以 255 的正規化。
+    """
+    if model_config is None:
+        names = list(weight_layer_names)
+        plan = [
+            {"type": "conv2d", "name": names[0], "activation": "relu"}, {"type": "max_pool"},
+            {"type": "conv2d", "name": names[1], "activation": "relu"}, {"type": "max_pool"},
+            {"type": "flatten"},
+            {"type": "dense", "name": names[2], "activation": "relu"},
+            {"type": "dense", "name": names[3], "activation": "sigmoid"},
+        ]
+    else:
+        plan = []
+        for layer in model_config["config"]["layers"]:
+            class_name, config = layer["class_name"], layer["config"]
+            if class_name in ("InputLayer", "Dropout"):
+                continue # Dropout 在推論時不作用
+            if class_name not in NUMPY_LAYERS:
+                raise ValueError(f"NumPy 後端不支援 {class_name} 層")
+            if class_name in ("Conv2D", "SeparableConv2D") and (
+                    tuple(config["strides"]) != (1, 1) or config["padding"] != "valid"):
+                raise ValueError(f"NumPy 後端只支援 stride 1、valid padding 的 {class_name}")
+            if class_name == "MaxPooling2D" and (
+                    tuple(config["pool_size"]) != (2, 2) or tuple(config["strides"]) != (2, 2)):
+                raise ValueError("NumPy 後端只支援 2x2、stride 2 的 MaxPooling2D")
+            if class_name in ("Conv2D", "SeparableConv2D") and config["activation"] != "relu":
+                raise ValueError(f"NumPy 後端的 {class_name} 只支援 relu 激活函數")
+            if class_name in ("Conv2D", "SeparableConv2D") and tuple(config.get("dilation_rate", (1, 1))) != (1, 1):
+                raise ValueError(f"NumPy 後端不支援 dilation_rate 不為 1 的 {class_name}")
+            if class_name in ("Conv2D", "SeparableConv2D", "Dense") and not config.get("use_bias", True):
+                raise ValueError(f"NumPy 後端不支援沒有偏差項的 {class_name}")
+            step = {"type": NUMPY_LAYERS[class_name], "name": config["name"]}
+            if "activation" in config:
+                if config["activation"] not in ("relu", "sigmoid", "linear"):
+                    raise ValueError(f"NumPy 後端不支援 {config['activation']} 激活函數")
+                step["activation"] = config["activation"]
+            if class_name == "Rescaling":
+                step["scale"], step["offset"] = float(config["scale"]), float(config["offset"])
+            plan.append(step)
+    if not any(step["type"] == "rescaling" for step in plan):
+        plan.insert(0, {"type": "rescaling", "scale": 1.0 / 255, "offset": 0.0})
+    return plan
+
+def load_numpy_weights(model_path="fish_classifier.h5"):
+    """
+    讀取 Keras 權重檔中的架構與各層的權重，並快取成同名的 `.npz` 檔。
+
+    之後的載入只需 `np.load` 快取檔，不必匯入 h5py 或 TensorFlow。快取內記錄
+    產生它的 `.h5` 的大小與修改時間，兩者任一不符 (重新訓練過，或以 `cp -p`、
+    `git checkout` 換成修改時間較舊的檔案) 或快取格式過舊時，就重新產生快取。
+    快取寫入失敗 (例如部署目錄唯讀) 時只印出警告，照常回傳讀到的權重。
+
+    Args:
+        model_path (str): Keras 權重檔 (`.h5`) 路徑。
+
+    Returns:
+        tuple: (plan, weights)。plan 是依序執行的層列表，weights 以層名稱對應
+               該層的權重陣列 (皆為 float32)。
+    """
+    cache_path = os.path.splitext(model_path)[0] + ".npz"
+    stat = os.stat(model_path)
+    source = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if ("plan" in cached.files and int(cached["version"]) == NUMPY_CACHE_VERSION
+                    and np.array_equal(cached["source"], source)):
+                plan = json.loads(str(cached["plan"]))
+                weights = {step["name"]: [cached[f"{step['name']}/{i}"] for i in range(step["n_weights"])]
+                           for step in plan if step.get("n_weights")}
+                return plan, weights
+
+    import h5py
+
+    weights = {}
+    with h5py.File(model_path, "r") as f:
+        # model.save() 會把權重放在 model_weights 群組，save_weights() 則放在根目錄
+        group = f["model_weights"] if "model_weights" in f else f
+        for layer_name in group.attrs["layer_names"]:
+            layer_name = layer_name.decode() if isinstance(layer_name, bytes) else layer_name
+            layer = group[layer_name]
+            weight_names = layer.attrs["weight_names"]
+            if len(weight_names) > 0:
+                weights[layer_name] = [np.asarray(layer[name], dtype=np.float32) for name in weight_names]
+    plan = _numpy_layer_plan(read_model_config(model_path), weights)
+    for step in plan:
+        if "name" in step:
+            step["n_weights"] = len(weights.get(step["name"], []))
+
+    arrays = {f"{name}/{i}": array for name, layer in weights.items() for i, array in enumerate(layer)}
+    try:
+        np.savez(cache_path, plan=json.dumps(plan), version=NUMPY_CACHE_VERSION, source=source, **arrays)
+        print(f"已將 '{model_path}' 的權重快取至 '{cache_path}'。")
+    except OSError as e:
+        print(f"無法寫入權重快取 '{cache_path}'，本次直接使用 '{model_path}' 的權重: {e}")
+    return plan, weights
+
+class NumpyEngine:
+    """
+    以純 NumPy 實作 Keras 模型前向傳播的推論引擎，不需匯入 TensorFlow。
+
+    介面與 `InferenceEngine` 相同。依權重檔記錄的架構逐層執行，支援
+    `ARCHITECTURES` 中的所有模型；Dropout 在推論時不作用，因此直接略過。
+    """
+    def __init__(self, model_path="fish_classifier.h5"):
+        """
+        Args:
+            model_path (str): Keras 權重檔 (`.h5`) 路徑。
+        """
+        self.load_weights(model_path)
+
+    def load_weights(self, model_path):
+        """重新載入權重 (例如重新訓練之後)，並更新權重指紋。"""
+        plan, weights = load_numpy_weights(model_path)
+        self.model_path = model_path
+        self.layers = [(step, weights.get(step.get("name"), [])) for step in plan]
+        self.fingerprint = weights_fingerprint([array for _, layer in self.layers for array in layer])
+
+    def predict_proba(self, images):
+        """
+        計算一批圖片為魚的機率。
+
+        Args:
+            images (np.array): 形狀為 (N, 28, 28) 的 uint8 圖片 (黑底白線)。
+
+        Returns:
+            np.array: 形狀為 (N,) 的 float32 機率陣列。
+        """
+        x = np.expand_dims(images.astype('float32'), axis=-1) # (N, 28, 28, 1)
+
+        for step, weights in self.layers:
+            kind = step["type"]
+            if kind == "rescaling":
+                x = x * np.float32(step["scale"]) + np.float32(step["offset"])
+            elif kind == "conv2d":
+                x = _conv2d_relu(x, *weights)
+            elif kind == "separable_conv2d":
+                x = _separable_conv2d_relu(x, *weights)
+            elif kind == "max_pool":
+                x = _max_pool_2x2(x)
+            elif kind == "flatten":
+                x = x.reshape(len(x), -1) # 與 Keras Flatten 相同的 (H, W, C) 順序
+            elif kind == "global_average_pool":
+                x = x.mean(axis=(1, 2))
+            elif kind == "dense":
+                kernel, bias = weights
+                x = x @ kernel + bias
+                if step["activation"] == "relu":
+                    x = np.maximum(x, 0)
+                elif step["activation"] == "sigmoid":
+                    # sigmoid 的 tanh 寫法，避免 exp 在極端 logit 時溢位
+                    x = 0.5 * (1.0 + np.tanh(0.5 * x))
+        return x[:, 0]
+
+def export_tflite(model_path="fish_classifier.h5", output_dir=".", calibration_items=1000):
+    """
+    將訓練好的 CNN 轉換成 TFLite flatbuffer，輸出 float16 與 int8 兩種版本。
+
+    int8 版本使用訓練後量化 (post-training quantization)，以 QuickDraw
+    魚與貓的圖片作為校正資料，輸入輸出皆為 uint8。
+
+    Args:
+        model_path (str): Keras 權重檔路徑。
+        output_dir (str): 輸出 `.tflite` 檔案的資料夾。
+        calibration_items (int): 每個類別用於校正的圖片數量。
+
+    Returns:
+        dict: {"float16": 路徑, "int8": 路徑}，若失敗則回傳 None。
+    """
+    engine = load_ai_model(model_path, backend="keras")
+    if engine is None:
+        return None
+    model = engine.model
+    input_scale = model_input_scale(model)
+
+    calibration_images, _ = load_split("train", max_items=calibration_items)
+    if calibration_images is None:
+        return None
+    calibration_images = np.random.default_rng(42).permutation(calibration_images)
+
+    def representative_dataset():
+        for image in calibration_images:
+            # 與推論時相同的輸入：模型內含 Rescaling 層時直接使用 0-255 的像素值
+            yield [np.expand_dims(image.astype('float32') * input_scale, axis=(0, -1))]
+
+    base_name = os.path.splitext(os.path.basename(model_path))[0]
+    paths = {}
+    for variant in ("float16", "int8"):
+        suffix = "fp16" if variant == "float16" else variant
+        paths[variant] = os.path.join(output_dir, f"{base_name}_{suffix}.tflite")
+        save_tflite(model, paths[variant], variant, representative_dataset)
+
+    for variant, path in paths.items():
+        print(f"已輸出 {variant} TFLite 模型: {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+    return paths
+
+def save_tflite(model, path, variant="float16", representative_dataset=None):
+    """
+    將 Keras 模型轉換成 TFLite 檔案，並在旁邊寫入記錄輸入縮放比例的 `.json`。
+
+    Args:
+        model (tf.keras.Model): 已載入權重的模型。
+        path (str): 輸出的 `.tflite` 路徑。
+        variant (str): "float32"、"float16" (權重以半精度儲存) 或 "int8"
+                       (權重與激活值皆量化，輸入輸出為 uint8)。
+        representative_dataset (callable): int8 量化的校正資料產生器。
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant == "float16":
+        # 推論時仍以 float32 計算
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    elif variant != "float32":
+        raise ValueError(f"未知的 TFLite 版本 '{variant}'")
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    write_tflite_metadata(path, input_scale=model_input_scale(model), variant=variant)
+
+def tflite_metadata_path(path):
+    """`.tflite` 檔旁記錄前處理設定的 `.json` 路徑。"""
+    return os.path.splitext(path)[0] + ".json"
+
+def write_tflite_metadata(path, **metadata):
+    with open(tflite_metadata_path(path), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+def read_tflite_metadata(path):
+    """
+    讀取 `.tflite` 檔旁的 `.json`。
+
+    沒有這個檔案的是加入 Rescaling 層之前匯出的舊版模型，輸入需要先正規化到 0-1。
+
+    Returns:
+        dict: 至少包含 input_scale (像素值在送進模型前乘上的比例)。
+    """
+    metadata_path = tflite_metadata_path(path)
+    if not os.path.exists(metadata_path):
+        return {"input_scale": 1.0 / 255}
+    with open(metadata_path, encoding="utf-8") as f:
+        return json.load(f)
+
+class PredictionCache:
+    """
+    以 28x28 uint8 圖片內容雜湊為鍵的 LRU 預測快取。
+
+    同一張 (未改動的) 畫作重複按下「AI 魔法辨識」時直接回傳上次的信心值。
+    項目超過 `ttl_seconds` 即視為過期，總數超過 `max_entries` 時淘汰最久未用的項目。
+    所有方法皆為執行緒安全，可供多個 session 共用。
+    """
+    def __init__(self, max_entries=4096, ttl_seconds=3600.0):
+        """
+        Args:
+            max_entries (int): 最多保留的項目數。
+            ttl_seconds (float): 每個項目的存活秒數，None 表示永不過期。
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (到期時間, 信心值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(image_array):
+        """以形狀、型別與像素內容計算 16 bytes 的雜湊鍵。"""
+        image_array = np.ascontiguousarray(image_array)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image_array.dtype}{image_array.shape}".encode())
+        digest.update(image_array.tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        """取得快取的信心值，未命中或已過期時回傳 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, confidence):
+        """存入一筆信心值，必要時淘汰最久未用的項目。"""
+        expires_at = None if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, confidence)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空所有項目 (例如模型權重改變時)。"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """回傳目前的項目數與命中/未命中/淘汰等計數。"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+class CachedEngine:
+    """
+    在任一推論引擎前加上 `PredictionCache`，介面與被包裝的引擎相同。
+
+    只有未命中的圖片才會送進引擎計算；每次呼叫都會比對引擎的權重指紋，
+    權重改變 (例如呼叫 `load_weights`) 時自動清空快取。
     """
-    載入預先訓練好的 Keras 模型。
+    def __init__(self, engine, cache=None):
+        """
+        Args:
+            engine: `InferenceEngine`、`TFLiteEngine` 或 `NumpyEngine`。
+            cache (PredictionCache): 使用的快取，None 表示建立預設大小的快取。
+        """
+        self.engine = engine
+        self.cache = cache or PredictionCache()
+        self._fingerprint = engine.fingerprint
+
+    def load_weights(self, model_path):
+        """重新載入被包裝引擎的權重，快取會在下一次推論時失效。"""
+        self.engine.load_weights(model_path)
+
+    def predict_proba(self, images):
+        """
+        計算一批圖片為魚的機率，命中快取的圖片不需重新計算。
+
+        Args:
+            images (np.array): 形狀為 (N, 28, 28) 的 uint8 圖片 (黑底白線)。
+
+        Returns:
+            np.array: 形狀為 (N,) 的 float32 機率陣列。
+        """
+        if self.engine.fingerprint != self._fingerprint:
+            self.cache.clear()
+            self._fingerprint = self.engine.fingerprint
+
+        keys = [self.cache.key(image) for image in images]
+        probabilities = np.empty(len(images), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            confidence = self.cache.get(key)
+            if confidence is None:
+                missing.append(i)
+            else:
+                probabilities[i] = confidence
+
+        if missing:
+            computed = self.engine.predict_proba(np.asarray(images)[missing])
+            for i, confidence in zip(missing, computed):
+                probabilities[i] = confidence
+                self.cache.put(keys[i], float(confidence))
+        return probabilities
+
+# --- 4. 載入與預測 ---
+@timed("model.load_ai_model")
+def load_ai_model(model_path="fish_classifier.h5", backend=None):
+    """
+    載入預先訓練好的模型，並包裝成已暖機的推論引擎。
+
+    副檔名為 `.tflite` 時一律使用只依賴 TFLite 直譯器的 `TFLiteEngine`；
+    Keras 權重檔則依 `backend` 選擇純 NumPy 的 `NumpyEngine` 或
+    TensorFlow 的 `InferenceEngine`。
     
     Args:
         model_path (str): 模型的檔案路徑。
+        backend (str): "numpy" 或 "keras"，None 表示使用 `DEFAULT_BACKEND`。
         
     Returns:
-        model: 載入完成的模型物件，若失敗則回傳 None。
+        InferenceEngine | TFLiteEngine | NumpyEngine: 載入完成的推論引擎，若失敗則回傳 None。
     """
+    backend = backend or DEFAULT_BACKEND
     if not os.path.exists(model_path):
         print(f"錯誤：模型檔案 '{model_path}' 不存在。")
         print("請先執行 'python model.py' 來訓練並產生模型檔案。")
         return None
     
     try:
-        # 建立模型架構
-        model = create_cnn_model()
+        if model_path.endswith(".tflite"):
+            engine = TFLiteEngine(model_path)
+            print(f"TFLite 模型從 '{model_path}' 載入成功！")
+            return engine
+
+        if backend == "numpy":
+            engine = NumpyEngine(model_path)
+            print(f"模型權重從 '{model_path}' 載入成功 (NumPy 後端)！")
+            return engine
+        if backend != "keras":
+            raise ValueError(f"未知的推論後端 '{backend}'")
+
+        # 依檔案中記錄的架構建立模型
+        model = build_model_from_file(model_path)
         # 只載入權重
         model.load_weights(model_path)
         print(f"模型權重從 '{model_path}' 載入成功！")
-        return model
+        return InferenceEngine(model)
     except Exception as e:
         print(f"模型載入失敗: {e}")
         return None
 
+def model_input_scale(model):
+    """Keras 模型的像素縮放比例：第一層是 Rescaling 時直接接收 0-255，舊版模型需要先除以 255。"""
+    first = [layer for layer in model.layers if layer.__class__.__name__ != "InputLayer"][:1]
+    return 1.0 if any(layer.__class__.__name__ == "Rescaling" for layer in first) else 1.0 / 255
+
+def _predict_proba(images, model):
+    """
+    對一批 uint8 圖片計算為魚的機率，同時支援各種推論引擎與原始 Keras 模型。
+    """
+    if hasattr(model, "predict_proba"):
+        return model.predict_proba(images)
+
+    # 直接呼叫 Keras 模型，避開 model.predict 的預測迴圈開銷；
+    # 模型內含 Rescaling 層時直接輸入 0-255 的像素值，舊版模型才需要自行正規化
+    img_processed = np.expand_dims(images.astype('float32') * model_input_scale(model), axis=-1)
+    return model(img_processed, training=False).numpy()[:, 0]
+
+@timed("model.predict_images")
+def predict_images(images, model):
+    """
+    以單次向量化前向傳播預測一批圖片是否為魚。
+
+    Args:
+        images (np.array): 形狀為 (N, 28, 28) 的圖片陣列 (黑底白線)。
+        model: `load_ai_model` 回傳的推論引擎，或預訓練 Keras 模型物件。
+
+    Returns:
+        list: 每張圖片的 (is_fish, confidence)，順序與輸入相同。
+    """
+    images = np.asarray(images)
+    if model is None:
+        # 如果模型未載入，回傳預設值
+        return [(False, 0.0)] * len(images)
+    if len(images) == 0:
+        return []
+
+    results = []
+    for prediction in _predict_proba(images, model):
+        confidence = float(prediction)
+        is_fish = confidence > 0.5 # 假設閾值為 0.5
+        results.append((is_fish, confidence))
+    return results
+
 def predict_image(image_array, model):
     """
     使用載入的模型來預測圖片是否為魚。
     
     Args:
         image_array (np.array): 經過前處理的圖片陣列 (28x28, 黑底白線)。
-        model: 預訓練 Keras 模型物件。
+        model: `load_ai_model` 回傳的推論引擎，或預訓練 Keras 模型物件。
         
     Returns:
         tuple: (is_fish, confidence)
     """
-    if model is None:
-        # 如果模型未載入，回傳預設值
-        return False, 0.0
+    return predict_images(np.expand_dims(image_array, axis=0), model)[0]
 
-    #正規化並調整形狀以符合模型輸入
-    img_processed = image_array.astype('float32') / 255.0
-    img_processed = np.expand_dims(img_processed, axis=(0, -1)) # (1, 28, 28, 1)
-    
-    # 進行預測
-    prediction = model.predict(img_processed)[0][0]
-    
-    confidence = float(prediction)
-    is_fish = confidence > 0.5 # 假設閾值為 0.5
-    
-    return is_fish, confidence
+# --- 5. 微批次推論服務 ---
+class MicroBatcher:
+    """
+    將多個 Streamlit session 同時送出的辨識請求合併成一次前向傳播。
+
+    背景執行緒會在收到第一個請求後，最多等待 `max_wait_ms` 毫秒或湊滿
+    `max_batch_size` 張圖片，再以 `predict_images` 一次算完，並透過
+    `concurrent.futures.Future` 把結果交還給各個呼叫者。
+    """
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5.0):
+        """
+        Args:
+            model: `load_ai_model` 回傳的推論引擎，或預訓練 Keras 模型物件。
+            max_batch_size (int): 每批最多合併的請求數。
+            max_wait_ms (float): 收到第一個請求後最多等待的毫秒數。
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="MicroBatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image_array):
+        """
+        送出一張圖片的辨識請求。
+
+        形狀或型別不對的圖片會在這裡直接以 ValueError 拒絕，只讓送錯的呼叫者失敗，
+        不會等到 `np.stack` 合併整批時才出錯、連帶讓同一批其他 session 的請求一起失敗。
+
+        Args:
+            image_array (np.array): 經過前處理的圖片陣列 (28x28, 黑底白線)。
+
+        Returns:
+            concurrent.futures.Future: 完成時結果為 (is_fish, confidence)。
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher 已關閉，無法再送出請求。")
+        image = np.asarray(image_array)
+        if image.shape != (28, 28) or image.dtype.kind not in "biuf":
+            raise ValueError(f"MicroBatcher 只接受 28x28 的數值圖片，收到形狀 {image.shape}、型別 {image.dtype}")
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image_array, timeout=None):
+        """`submit` 的阻塞版本，介面與 `predict_image` 相同。"""
+        return self.submit(image_array).result(timeout=timeout)
+
+    def close(self):
+        """處理完佇列中剩餘的請求後停止背景執行緒。"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._process(batch)
+            if stopping:
+                return
+
+    def _process(self, batch):
+        futures = [future for _, future in batch]
+        try:
+            results = predict_images(np.stack([image for image, _ in batch]), self.model)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
 
 # --- 測試用 ---
 if __name__ == '__main__':
-    # 執行此腳本將會觸發完整的訓練流程
-    train_and_save_model()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="訓練魚分類模型或匯出 TFLite 版本")
+    parser.add_argument("--export-tflite", action="store_true", help="將已訓練的模型匯出為 float16 / int8 TFLite 檔案")
+    parser.add_argument("--negatives", nargs="+", default=list(NEGATIVE_CATEGORIES), help="作為 '非魚' 的 QuickDraw 類別")
+    parser.add_argument("--max-items", type=int, default=10000, help="每個類別最多使用的圖片數量")
+    parser.add_argument("--cap", action="append", default=[], metavar="類別=數量", help="個別類別的數量上限，可重複指定")
+    parser.add_argument("--epochs", type=int, default=10, help="訓練週期數")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批的圖片數量 (預設 128，快速模式依核心數決定)")
+    parser.add_argument("--fast", action="store_true", help="快速訓練：依核心數設定執行緒與批次大小，CPU 支援時使用 bfloat16 混合精度")
+    parser.add_argument("--threads", type=int, default=None, help="快速模式使用的執行緒數 (預設為所有可用核心)")
+    parser.add_argument("--no-bf16", action="store_true", help="快速模式下不使用 bfloat16 混合精度")
+    parser.add_argument("--jit", action="store_true", help="以 XLA 編譯訓練步驟 (CPU 上的卷積通常反而較慢，請先以 benchmark.py train 確認)")
+    parser.add_argument("--model-path", default="fish_classifier.h5", help="模型的儲存路徑")
+    parser.add_argument("--architecture", choices=sorted(ARCHITECTURES), default="cnn",
+                        help="模型架構：cnn (Flatten)、gap (全域平均池化) 或 separable (深度可分離卷積)")
+    parser.add_argument("--distill-from", metavar="教師模型", help="以指定的模型作為教師，用知識蒸餾訓練學生模型")
+    parser.add_argument("--temperature", type=float, default=4.0, help="知識蒸餾的溫度")
+    parser.add_argument("--alpha", type=float, default=0.5, help="知識蒸餾中硬標籤損失的權重")
+    parser.add_argument("--report", help="將訓練摘要 (耗時、images/sec、驗證準確率) 存成 JSON 檔")
+    parser.add_argument("--build-dataset", action="store_true", help="只建立切分好的資料集快取，不訓練")
+    parser.add_argument("--rebuild-dataset", action="store_true", help="重新建立資料集快取 (例如原始檔案更新之後)")
+    args = parser.parse_args()
+
+    if args.export_tflite:
+        export_tflite()
+    else:
+        caps = {name: int(count) for name, count in (item.split("=", 1) for item in args.cap)}
+        if args.build_dataset or args.rebuild_dataset:
+            path = build_split_cache(negatives=args.negatives, max_items=args.max_items, caps=caps,
+                                     rebuild=args.rebuild_dataset)
+            if path is not None:
+                print(f"資料集快取: {path}")
+        if not args.build_dataset:
+            batch_size, learning_rate = args.batch_size or 128, 0.001
+            if args.fast:
+                settings = configure_fast_training(args.threads, False if args.no_bf16 else None)
+                batch_size = args.batch_size or fast_batch_size(settings["threads"])
+                # 批次變大時依平方根比例提高學習率，讓相同週期數下的收斂程度接近預設設定
+                learning_rate = 0.001 * (batch_size / 128) ** 0.5
+                print(f"快速模式：{settings['threads']} 個執行緒，批次大小 {batch_size}，"
+                      f"bfloat16 混合精度{'開啟' if settings['mixed_precision'] else '關閉'}")
+            # 執行此腳本將會觸發完整的訓練流程
+            summary = train_and_save_model(
+                model_path=args.model_path,
+                negatives=args.negatives,
+                max_items=args.max_items,
+                caps=caps,
+                epochs=args.epochs,
+                batch_size=batch_size,
+                jit_compile=args.jit,
+                learning_rate=learning_rate,
+                architecture=args.architecture,
+                distill_from=args.distill_from,
+                temperature=args.temperature,
+                alpha=args.alpha,
+            )
+            if summary is not None and args.report:
+                with open(args.report, "w", encoding="utf-8") as f:
+                    json.dump(summary, f, indent=2)
+                print(f"訓練摘要已儲存至 {args.report}")
@@ -0,0 +1,245 @@
+# 超參數搜尋 (sweep.py)
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+from model import NEGATIVE_CATEGORIES, build_split_cache, configure_fast_training, train_and_save_model
+
+# 預設的搜尋空間：每個參數的候選值
+DEFAULT_SPACE = {
+    "filters": [[16, 32], [32, 64]],
+    "dense_units": [32, 128],
+    "dropout": [0.3, 0.5],
+    "epochs": [5],
+    "batch_size": [128],
+}
+
+# 架構參數傳給 create_cnn_model，其餘傳給 train_and_save_model
+MODEL_PARAMS = ("filters", "dense_units", "dropout")
+TRAINING_PARAMS = ("epochs", "batch_size", "learning_rate")
+
+# 每個 worker 分到的 CPU 核心，由 initializer 設定
+_worker_cores = None
+
+def expand_space(space, n_random=None, seed=0):
+    """
+    將搜尋空間展開成候選設定的列表。
+
+    Args:
+        space (dict): 參數名稱對應候選值列表。
+        n_random (int): 隨機搜尋時取樣的設定數量，None 表示完整的網格搜尋。
+        seed (int): 隨機搜尋的亂數種子。
+
+    Returns:
+        list: 每個候選設定一個 dict。
+    """
+    unknown = set(space) - set(MODEL_PARAMS) - set(TRAINING_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的參數: {', '.join(sorted(unknown))}")
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if n_random is not None and n_random < len(grid):
+        grid = random.Random(seed).sample(grid, n_random)
+    return grid
+
+def partition_cores(n_workers):
+    """
+    把目前行程可用的核心平均分給 n 個 worker。
+
+    Returns:
+        list: 每個 worker 一組核心編號；核心比 worker 少時，worker 數會減少到核心數。
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    n_workers = max(1, min(n_workers, len(cores)))
+    return [[int(core) for core in chunk] for chunk in np.array_split(cores, n_workers)]
+
+def _init_worker(core_queue):
+    """worker 啟動時取得一組核心並綁定，TensorFlow 的執行緒數也依核心數設定。"""
+    global _worker_cores
+    _worker_cores = [int(core) for core in core_queue.get()]
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _worker_cores)
+    os.environ["OMP_NUM_THREADS"] = str(len(_worker_cores))
+    configure_fast_training(threads=len(_worker_cores), mixed_precision=False)
+
+def measure_inference_latency(model_path, repeats=200, warmup=10):
+    """以服務時預設的 NumPy 後端量測單張圖片推論延遲的中位數 (毫秒)。"""
+    from model import NumpyEngine
+
+    engine = NumpyEngine(model_path)
+    image = np.random.default_rng(0).integers(0, 256, size=(1, 28, 28), dtype=np.uint8)
+    for _ in range(warmup):
+        engine.predict_proba(image)
+    latencies = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        engine.predict_proba(image)
+        latencies[i] = (time.perf_counter() - start) * 1000
+    return float(np.median(latencies))
+
+def run_trial(task):
+    """
+    在 worker 中訓練一個候選設定，並量測參數量與推論延遲。
+
+    Args:
+        task (tuple): (trial_id, params, data, output_dir)。
+
+    Returns:
+        dict: 設定、驗證準確率、參數量、延遲與訓練耗時；失敗時含 error 欄位。
+    """
+    import tensorflow as tf
+
+    trial_id, params, data, output_dir = task
+    model_path = os.path.join(output_dir, f"trial_{trial_id:03d}.h5")
+    result = {"trial": trial_id, **params, "cores": ",".join(map(str, _worker_cores or []))}
+
+    tf.keras.backend.clear_session()
+    model_params = {name: params[name] for name in MODEL_PARAMS if name in params}
+    training_params = {name: params[name] for name in TRAINING_PARAMS if name in params}
+    try:
+        # 每個候選設定的訓練輸出寫到各自的記錄檔
+        with open(os.path.join(output_dir, f"trial_{trial_id:03d}.log"), "w", encoding="utf-8") as log, \
+                contextlib.redirect_stdout(log):
+            summary = train_and_save_model(
+                model_path=model_path, model_params=model_params, verbose=2, **data, **training_params
+            )
+        if summary is None:
+            raise RuntimeError("無法載入訓練資料")
+        result.update({
+            "val_accuracy": summary["val_accuracy"],
+            "params": summary["params"],
+            "latency_ms": measure_inference_latency(model_path),
+            "train_seconds": summary["seconds"],
+            "model_path": model_path,
+        })
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def pareto_front(results):
+    """
+    標記 Pareto 最佳的候選：沒有其他候選在驗證準確率、參數量與延遲上同時不差且至少一項更好。
+    """
+    ok = [r for r in results if "error" not in r]
+    for r in ok:
+        r["pareto"] = not any(
+            other is not r
+            and other["val_accuracy"] >= r["val_accuracy"]
+            and other["params"] <= r["params"]
+            and other["latency_ms"] <= r["latency_ms"]
+            and (other["val_accuracy"], -other["params"], -other["latency_ms"])
+            != (r["val_accuracy"], -r["params"], -r["latency_ms"])
+            for other in ok
+        )
+    return [r for r in ok if r["pareto"]]
+
+def write_results(results, output_dir):
+    """將結果寫成 results.csv 與 results.json，回傳 CSV 路徑。"""
+    columns = ["trial", *MODEL_PARAMS, *TRAINING_PARAMS, "val_accuracy", "params", "latency_ms",
+               "train_seconds", "pareto", "cores", "model_path", "error"]
+    columns = [c for c in columns if any(c in r for r in results)]
+    csv_path = os.path.join(output_dir, "results.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for r in results:
+            writer.writerow({key: json.dumps(value) if isinstance(value, list) else value for key, value in r.items()})
+    with open(os.path.join(output_dir, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    return csv_path
+
+def print_results(results):
+    """依驗證準確率由高到低印出結果表，Pareto 最佳的候選以 * 標示。"""
+    print(f"{'':1} {'trial':>5} {'filters':>10} {'dense':>6} {'dropout':>8} {'epochs':>7} {'batch':>6} "
+          f"{'val_acc':>8} {'params':>9} {'lat(ms)':>8} {'train(s)':>9}")
+    ranked = sorted(results, key=lambda r: -r.get("val_accuracy", -1))
+    for r in ranked:
+        if "error" in r:
+            print(f"  {r['trial']:>5} 失敗: {r['error']}")
+            continue
+        print(f"{'*' if r.get('pareto') else ' '} {r['trial']:>5} {str(r.get('filters', '-')):>10} "
+              f"{r.get('dense_units', '-'):>6} {r.get('dropout', '-'):>8} {r.get('epochs', '-'):>7} "
+              f"{r.get('batch_size', '-'):>6} {r['val_accuracy']:>8.4f} {r['params']:>9} "
+              f"{r['latency_ms']:>8.3f} {r['train_seconds']:>9.1f}")
+
+def run_sweep(space=None, workers=None, n_random=None, seed=0, output_dir="sweep_results",
+              negatives=NEGATIVE_CATEGORIES, max_items=10000, caps=None):
+    """
+    以行程池平行訓練搜尋空間中的候選設定。
+
+    資料集快取在主行程中先建立一次，所有 worker 以記憶體映射共用同一份檔案，
+    每個 worker 綁定一組不重疊的核心，避免彼此的執行緒互相搶佔。
+
+    Args:
+        space (dict): 搜尋空間，None 表示使用 `DEFAULT_SPACE`。
+        workers (int): worker 數量 (不會超過核心數)，None 表示每個候選設定一個，最多每個核心一個。
+        n_random (int): 隨機搜尋的設定數量，None 表示完整的網格搜尋。
+        seed (int): 隨機搜尋的亂數種子。
+        output_dir (str): 模型、記錄檔與結果表的輸出資料夾。
+        negatives (list): 負樣本類別。
+        max_items (int): 每個類別最多使用的圖片數量。
+        caps (dict): 個別類別的數量上限。
+
+    Returns:
+        list: 每個候選設定的結果；無法載入資料時回傳 None。
+    """
+    trials = expand_space(space or DEFAULT_SPACE, n_random, seed)
+    data = {"negatives": list(negatives), "max_items": max_items, "caps": caps}
+    if build_split_cache(**data) is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+
+    core_sets = partition_cores(workers or len(trials))
+    print(f"--- 搜尋 {len(trials)} 個候選設定，{len(core_sets)} 個 worker，每個 worker 的核心: {core_sets} ---")
+
+    # TensorFlow 在 fork 之後無法安全使用，worker 一律以 spawn 啟動
+    context = multiprocessing.get_context("spawn")
+    core_queue = context.Queue()
+    for cores in core_sets:
+        core_queue.put(cores)
+
+    tasks = [(trial_id, params, data, output_dir) for trial_id, params in enumerate(trials)]
+    results = []
+    start = time.perf_counter()
+    with context.Pool(len(core_sets), initializer=_init_worker, initargs=(core_queue,)) as pool:
+        for result in pool.imap_unordered(run_trial, tasks):
+            status = f"失敗: {result['error']}" if "error" in result else f"val_acc={result['val_accuracy']:.4f}"
+            print(f"候選 {result['trial']} 完成 ({len(results) + 1}/{len(tasks)})，{status}")
+            results.append(result)
+    results.sort(key=lambda r: r["trial"])
+
+    pareto_front(results)
+    csv_path = write_results(results, output_dir)
+    print(f"\n--- 搜尋完成，總耗時 {time.perf_counter() - start:.1f} 秒 ---")
+    print_results(results)
+    print(f"結果已儲存至 {csv_path}")
+    return results
+
+# --- 測試用 ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="平行搜尋 CNN 的超參數")
+    parser.add_argument("--space", help="搜尋空間的 JSON 檔，例如 {\"dense_units\": [32, 64, 128], \"epochs\": [5]}")
+    parser.add_argument("--random", type=int, default=None, metavar="N", help="隨機搜尋 N 個設定 (預設為完整的網格搜尋)")
+    parser.add_argument("--seed", type=int, default=0, help="隨機搜尋的亂數種子")
+    parser.add_argument("--workers", type=int, default=None, help="平行訓練的 worker 數 (預設每個候選設定一個，最多每個核心一個)")
+    parser.add_argument("--output-dir", default="sweep_results", help="輸出資料夾")
+    parser.add_argument("--negatives", nargs="+", default=list(NEGATIVE_CATEGORIES), help="作為 '非魚' 的 QuickDraw 類別")
+    parser.add_argument("--max-items", type=int, default=10000, help="每個類別最多使用的圖片數量")
+    parser.add_argument("--cap", action="append", default=[], metavar="類別=數量", help="個別類別的數量上限，可重複指定")
+    args = parser.parse_args()
+
+    space = None
+    if args.space:
+        with open(args.space, encoding="utf-8") as f:
+            space = json.load(f)
+    caps = {name: int(count) for name, count in (item.split("=", 1) for item in args.cap)}
+    run_sweep(space, args.workers, args.random, args.seed, args.output_dir,
+              args.negatives, args.max_items, caps)
@@ -0,0 +1,53 @@
+# 魚缸 Streamlit 自訂元件 (tank_component.py)
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from fish_animation import JITTER_PROBABILITY, JITTER_AMOUNT, MIN_SPEED, MAX_SPEED
+
+# 前端只有一個不需建置的 index.html，以 path 宣告即可
+_component = components.declare_component(
+    "fish_tank", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "tank_component")
+)
+
+# 運動規則由伺服器端傳入，與 fish_animation 的常數保持同一個來源
+_RULES = {
+    "jitter_probability": JITTER_PROBABILITY,
+    "jitter_amount": JITTER_AMOUNT,
+    "min_speed": MIN_SPEED,
+    "max_speed": MAX_SPEED,
+}
+
+def fish_tank(tank, key="fish_tank"):
+    """
+    以自訂元件顯示魚缸。
+
+    iframe 只在第一次渲染時建立，之後每次 rerun 只傳送瀏覽器尚未擁有的魚
+    (`FishTank.delta_since`)，動畫在 rerun 之間不會重新開始。瀏覽器會回報它
+    已有的最大魚編號，作為下一次差異的起點。
+
+    Args:
+        tank (FishTank): 要顯示的魚缸。
+        key (str): 元件在 session 中的識別鍵。
+
+    Returns:
+        int: 瀏覽器端已載入的最大魚編號。
+    """
+    ack_key = f"{key}_version"
+    # 元件的回傳值會存在 session_state[key]，沒有時使用上一次呼叫的結果
+    acknowledged = st.session_state.get(key) or st.session_state.get(ack_key) or {}
+    version = acknowledged.get("version", 0)
+
+    value = _component(
+        width=tank.width,
+        height=tank.height,
+        background_image_url=tank.background_image_url,
+        rules=_RULES,
+        delta=tank.delta_since(version),
+        key=key,
+        default=None,
+    )
+    if value is not None:
+        st.session_state[ack_key] = value
+    return (value or acknowledged).get("version", 0)
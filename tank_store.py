@@ -0,0 +1,186 @@
+# 共用魚缸儲存區 (tank_store.py)
+import bisect
+import os
+import sqlite3
+import threading
+import time
+
+from fish_animation import MAX_FISH, MAX_SPRITE_BYTES
+from metrics import timed
+
+# 所有 session 共用的魚缸資料庫位置
+FISH_TANK_DB = os.environ.get("FISH_TANK_DB", "fish_tank.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fish (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    png BLOB NOT NULL,
+    png_size INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    pos_x REAL NOT NULL,
+    pos_y REAL NOT NULL,
+    vel_x REAL NOT NULL,
+    vel_y REAL NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+class TankStore:
+    """
+    以 SQLite (WAL 模式) 儲存、所有 session 共用的魚缸。
+
+    - 每隻魚以遞增的 id 識別，id 同時作為增量讀取的版本號：
+      `fish_since(version)` 只回傳 id 大於 version 的魚。
+    - 超過容量時從最舊 (id 最小) 的魚開始刪除，因此目前存在的魚一定是
+      id 連續的一段；小於 `min_id` 的魚都已被移除。
+    - 讀取經過行程內的快取，只有其他連線寫入過資料庫 (`PRAGMA data_version`
+      改變) 時才會查詢新加入的魚，一般的渲染不會讀取磁碟。
+    - 寫入使用每個執行緒各自的連線與 `BEGIN IMMEDIATE` 交易，多個 session
+      (甚至多個行程) 同時新增魚時由 SQLite 的鎖與 busy_timeout 排隊。
+    """
+    def __init__(self, path=None, max_fish=MAX_FISH, max_sprite_bytes=MAX_SPRITE_BYTES, busy_timeout=5.0):
+        """
+        Args:
+            path (str): 資料庫檔案路徑，None 表示使用 `FISH_TANK_DB`。
+            max_fish (int): 魚的數量上限，None 表示不限制。
+            max_sprite_bytes (int): 所有 sprite 的 PNG 總位元組數上限，None 表示不限制。
+            busy_timeout (float): 等待其他寫入者釋放鎖的最長秒數。
+        """
+        self.path = path or FISH_TANK_DB
+        self.max_fish = max_fish
+        self.max_sprite_bytes = max_sprite_bytes
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+        # 讀取快取：依 id 排序的資料列，以及用來偵測其他連線寫入的專用連線
+        self._lock = threading.Lock()
+        self._reader = self._connect(check_same_thread=False)
+        self._data_version = None
+        self._ids = []
+        self._rows = []
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=check_same_thread
+        )
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self):
+        """回傳目前執行緒的寫入連線 (第一次使用時建立)。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @timed("tank_store.add_fish")
+    def add_fish(self, png, width, height, pos, vel):
+        """
+        新增一隻魚，並在同一個交易中依容量上限刪除最舊的魚。
+
+        Args:
+            png (bytes): RGBA sprite 的 PNG 位元組。
+            width (int): sprite 寬度 (px)。
+            height (int): sprite 高度 (px)。
+            pos (tuple): 初始位置 (x, y)。
+            vel (tuple): 初始速度 (vx, vy)。
+
+        Returns:
+            int: 新魚的 id (亦即新增後的版本號)。
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fish_id = conn.execute(
+                "INSERT INTO fish (png, png_size, width, height, pos_x, pos_y, vel_x, vel_y, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (png, len(png), int(width), int(height), float(pos[0]), float(pos[1]),
+                 float(vel[0]), float(vel[1]), time.time()),
+            ).lastrowid
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return fish_id
+
+    def _evict(self, conn):
+        """刪除超過容量的最舊魚，最新加入的魚一定保留。"""
+        cutoff = None
+        if self.max_fish is not None:
+            row = conn.execute(
+                "SELECT id FROM fish ORDER BY id DESC LIMIT 1 OFFSET ?", (max(self.max_fish, 1) - 1,)
+            ).fetchone()
+            cutoff = row[0] if row else None
+        if self.max_sprite_bytes is not None:
+            total, oldest_kept = 0, None
+            for fish_id, png_size in conn.execute("SELECT id, png_size FROM fish ORDER BY id DESC"):
+                total += png_size
+                if total > self.max_sprite_bytes and oldest_kept is not None:
+                    cutoff = oldest_kept if cutoff is None else max(cutoff, oldest_kept)
+                    break
+                oldest_kept = fish_id
+        if cutoff is not None:
+            conn.execute("DELETE FROM fish WHERE id < ?", (cutoff,))
+
+    def _refresh(self):
+        """其他連線寫入過資料庫時，才把新加入的魚讀進快取並丟掉已刪除的魚。"""
+        data_version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+
+        # 讀取最小 id 與新資料列放在同一個讀取交易中，確保看到一致的快照
+        self._reader.execute("BEGIN")
+        try:
+            min_id = self._reader.execute("SELECT MIN(id) FROM fish").fetchone()[0]
+            last_id = self._ids[-1] if self._ids else 0
+            new_rows = self._reader.execute(
+                "SELECT id, png, width, height, pos_x, pos_y, vel_x, vel_y FROM fish WHERE id > ? ORDER BY id",
+                (last_id,),
+            ).fetchall()
+        finally:
+            self._reader.execute("COMMIT")
+
+        if min_id is None:
+            self._ids, self._rows = [], []
+            return
+        start = bisect.bisect_left(self._ids, min_id)
+        self._ids = self._ids[start:] + [row[0] for row in new_rows]
+        self._rows = self._rows[start:] + new_rows
+
+    @timed("tank_store.fish_since")
+    def fish_since(self, version=0, limit=None):
+        """
+        增量讀取魚缸內容。
+
+        Args:
+            version (int): 呼叫端已取得的最大 id，0 表示從頭讀取。
+            limit (int): 最多回傳幾筆 (分頁)，None 表示全部。
+
+        Returns:
+            tuple: (min_id, rows)。min_id 是目前最舊的魚的 id (魚缸是空的時候為 None)，
+                   呼叫端持有的 id 小於它的魚都已被移除；rows 是 id 大於 version 的魚，
+                   每筆為 (id, png, width, height, pos_x, pos_y, vel_x, vel_y)。
+        """
+        with self._lock:
+            self._refresh()
+            start = bisect.bisect_right(self._ids, version)
+            end = len(self._rows) if limit is None else start + limit
+            return (self._ids[0] if self._ids else None), self._rows[start:end]
+
+    def count(self):
+        """目前魚缸中的魚數量 (來自快取)。"""
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def clear(self):
+        """刪除所有的魚。"""
+        conn = self._connection()
+        conn.execute("DELETE FROM fish")
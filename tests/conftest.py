@@ -0,0 +1,5 @@
+# 讓測試可以直接匯入專案根目錄的模組 (model.py、app_utils.py ...)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
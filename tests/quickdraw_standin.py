@@ -0,0 +1,106 @@
+# 本機的 QuickDraw 下載替身伺服器，用來測試 dataset_cache.QuickDrawCache
+import base64
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class QuickDrawStandIn:
+    """
+    模擬 GCS 的 `<名稱>.npy` 下載：支援 `Range: bytes=N-` (206 / 416)，並以
+    `x-goog-hash` 提供整個物件的 MD5。
+
+    - cut_first：這些類別的第一次回應只送出一半的內容就關閉連線。
+    - corrupt：這些類別的內容被竄改，但 x-goog-hash 仍是原本的 MD5。
+    - delay：每個請求回應前等待的秒數，用來觀察同時下載的數量。
+    """
+    def __init__(self, files, cut_first=(), corrupt=(), delay=0.0):
+        self.files = dict(files)
+        self.cut_first = set(cut_first)
+        self.corrupt = set(corrupt)
+        self.delay = delay
+        self.requests = [] # (名稱, Range 標頭, 狀態碼)
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def _make_handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.active += 1
+                    standin.max_active = max(standin.max_active, standin.active)
+                try:
+                    time.sleep(standin.delay)
+                    self._respond()
+                finally:
+                    with standin._lock:
+                        standin.active -= 1
+
+            def _respond(self):
+                name = self.path.rsplit("/", 1)[-1][:-len(".npy")]
+                range_header = self.headers.get("Range")
+                if name not in standin.files:
+                    standin.requests.append((name, range_header, 404))
+                    self.send_error(404)
+                    return
+
+                content = standin.files[name]
+                md5 = base64.b64encode(hashlib.md5(content).digest()).decode()
+                if name in standin.corrupt:
+                    content = bytes(b ^ 0xFF for b in content[:16]) + content[16:]
+
+                start = 0
+                match = re.match(r"bytes=(\d+)-$", range_header or "")
+                if match:
+                    start = int(match.group(1))
+                    if start >= len(content):
+                        standin.requests.append((name, range_header, 416))
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(content)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+
+                status = 206 if match else 200
+                body = content[start:]
+                standin.requests.append((name, range_header, status))
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("x-goog-hash", f"crc32c=AAAAAA==,md5={md5}")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+                self.end_headers()
+
+                if name in standin.cut_first:
+                    standin.cut_first.discard(name)
+                    # 只送出一半就中斷連線，模擬下載途中斷線
+                    self.wfile.write(body[:len(body) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                self.wfile.write(body)
+
+        return Handler
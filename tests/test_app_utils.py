@@ -0,0 +1,38 @@
+# 畫布前處理的測試
+import numpy as np
+
+from app_utils import prepare_canvas
+
+def test_sprite_edges_keep_stroke_color_on_transparent_canvas():
+    # 透明背景上的紅色細線，縮小後的邊緣是半透明的
+    canvas = np.zeros((400, 560, 4), dtype=np.uint8)
+    canvas[100:300, 100:500:7] = (255, 0, 0, 255)
+
+    _, sprite = prepare_canvas(canvas)
+    pixels = np.asarray(sprite)
+    visible = pixels[:, :, 3] > 0
+    assert ((pixels[:, :, 3] > 0) & (pixels[:, :, 3] < 255)).any()
+    # 沒有預乘 alpha 時，透明像素的黑色會讓半透明邊緣變暗
+    assert (pixels[visible][:, :3] == (255, 0, 0)).all()
+
+def test_opaque_canvas_sprite_is_unchanged():
+    canvas = np.full((400, 560, 4), 255, dtype=np.uint8)
+    canvas[150:250, 200:360, :3] = 0
+
+    _, sprite = prepare_canvas(canvas)
+    pixels = np.asarray(sprite)
+    assert (pixels[:, :, 3] == 255).all()
+    assert pixels[:, :, :3].max() == 0
+
+def test_pastel_stroke_is_inside_sprite_bbox():
+    # (255, 250, 200) 的灰階約 246，高於門檻，但最小通道 200 仍是可見的筆跡
+    canvas = np.full((400, 560, 4), 255, dtype=np.uint8)
+    canvas[150:250, 200:260, :3] = 0
+    canvas[150:250, 260:360, :3] = (255, 250, 200)
+
+    _, sprite = prepare_canvas(canvas, sprite_size=1000)
+    pixels = np.asarray(sprite)
+    # 邊界框涵蓋整段淡色筆跡，且淡色筆跡沒有被去背
+    assert sprite.size == (160, 100)
+    assert (pixels[:, 60:, :3] == (255, 250, 200)).all()
+    assert (pixels[:, :, 3] == 255).all()
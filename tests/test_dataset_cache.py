@@ -0,0 +1,113 @@
+# QuickDrawCache 的下載、續傳與驗證測試 (使用本機的替身伺服器)
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+import dataset_cache
+from dataset_cache import QuickDrawCache
+from quickdraw_standin import QuickDrawStandIn
+
+def make_content(seed=0, size=200_000):
+    return np.random.default_rng(seed).integers(0, 256, size=size, dtype=np.uint8).tobytes()
+
+@pytest.fixture
+def make_cache(tmp_path, monkeypatch):
+    """建立指向替身伺服器的快取 (以 QUICKDRAW_BASE_URL 設定下載位置)。"""
+    def factory(standin, **kwargs):
+        monkeypatch.setattr(dataset_cache, "QUICKDRAW_BASE_URL", standin.base_url)
+        return QuickDrawCache(cache_dir=str(tmp_path), chunk_size=4096, timeout=5, **kwargs)
+    return factory
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_download_leaves_no_part_file(tmp_path, make_cache):
+    content = make_content()
+    with QuickDrawStandIn({"fish": content}) as standin:
+        path = make_cache(standin).fetch("fish")
+
+    assert path == str(tmp_path / "fish.npy")
+    assert read(path) == content
+    assert not os.path.exists(path + ".part")
+    assert standin.requests == [("fish", None, 200)]
+
+def test_resume_after_dropped_connection(tmp_path, make_cache):
+    content = make_content()
+    with QuickDrawStandIn({"fish": content}, cut_first={"fish"}) as standin:
+        path = make_cache(standin).fetch("fish")
+
+    assert read(path) == content
+    assert not os.path.exists(path + ".part")
+    # 第二次請求只要求尚未收到的部分
+    (_, first_range, first_status), (_, resume_range, resume_status) = standin.requests
+    assert (first_range, first_status) == (None, 200)
+    assert resume_status == 206
+    offset = int(resume_range[len("bytes="):-1])
+    assert 0 < offset < len(content)
+
+def test_complete_part_file_is_finished_on_416(tmp_path, make_cache):
+    content = make_content()
+    (tmp_path / "fish.npy.part").write_bytes(content)
+    with QuickDrawStandIn({"fish": content}) as standin:
+        path = make_cache(standin).fetch("fish")
+
+    assert read(path) == content
+    assert not os.path.exists(path + ".part")
+    assert standin.requests == [("fish", f"bytes={len(content)}-", 416)]
+
+def test_md5_mismatch_is_rejected(tmp_path, make_cache):
+    with QuickDrawStandIn({"fish": make_content()}, corrupt={"fish"}) as standin:
+        assert make_cache(standin, retries=2).fetch("fish") is None
+
+    # 損毀的內容不會被改名成正式檔案，也不會留下 .part 讓下一次續傳
+    assert not os.path.exists(tmp_path / "fish.npy")
+    assert not os.path.exists(tmp_path / "fish.npy.part")
+    assert [status for _, _, status in standin.requests] == [200, 200]
+
+def test_sha256_mismatch_is_rejected(tmp_path, make_cache):
+    content = make_content()
+    with QuickDrawStandIn({"fish": content}) as standin:
+        cache = make_cache(standin, retries=1, checksums={"fish": "0" * 64})
+        assert cache.fetch("fish") is None
+    assert not os.path.exists(tmp_path / "fish.npy")
+
+    with QuickDrawStandIn({"fish": content}) as standin:
+        cache = make_cache(standin, checksums={"fish": hashlib.sha256(content).hexdigest().upper()})
+        assert read(cache.fetch("fish")) == content
+
+def test_final_file_appears_atomically(tmp_path, make_cache, monkeypatch):
+    content = make_content()
+    replaced = []
+    real_replace = os.replace
+
+    def spy(src, dst):
+        # 改名前正式檔案不存在，.part 已是完整且通過驗證的內容
+        assert not os.path.exists(dst)
+        assert src == dst + ".part" and read(src) == content
+        replaced.append(dst)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(dataset_cache.os, "replace", spy)
+    with QuickDrawStandIn({"fish": content}) as standin:
+        path = make_cache(standin).fetch("fish")
+    assert replaced == [path]
+
+def test_missing_category_is_not_retried(tmp_path, make_cache):
+    with QuickDrawStandIn({}) as standin:
+        assert make_cache(standin).fetch("unicorn") is None
+    assert standin.requests == [("unicorn", None, 404)]
+
+def test_fetch_many_downloads_in_parallel(tmp_path, make_cache):
+    files = {name: make_content(seed) for seed, name in enumerate(["fish", "cat", "dog", "apple"])}
+    with QuickDrawStandIn(files, delay=0.3) as standin:
+        paths = make_cache(standin, max_workers=4).fetch_many(["fish", "cat", "dog", "apple", "fish"])
+
+    assert set(paths) == set(files)
+    for name, path in paths.items():
+        assert read(path) == files[name]
+    # 重複的類別只下載一次，且多個類別同時在下載
+    assert sorted(name for name, _, _ in standin.requests) == sorted(files)
+    assert standin.max_active > 1
@@ -0,0 +1,66 @@
+# 串流評估的測試
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from evaluate import evaluate, read_chunk, plan_chunks
+from model import NumpyEngine, create_gap_model
+
+@pytest.fixture
+def dataset(tmp_path):
+    """隨機權重的模型與兩個類別檔 (一個是 (N, 784)、一個是 (N, 28, 28) 格式)。"""
+    model = create_gap_model()
+    rng = np.random.default_rng(0)
+    model.set_weights([rng.normal(0, 0.3, size=w.shape).astype(np.float32) for w in model.get_weights()])
+    model_path = str(tmp_path / "model.h5")
+    model.save(model_path)
+
+    fish = rng.integers(0, 256, size=(700, 784), dtype=np.uint8)
+    cat = (rng.random((500, 28, 28)) < 0.1).astype(np.uint8) * 255
+    np.save(tmp_path / "fish.npy", fish)
+    np.save(tmp_path / "cat.npy", cat)
+    return model_path, str(tmp_path / "fish.npy"), str(tmp_path / "cat.npy"), fish, cat
+
+def open_npy_files():
+    """目前行程開啟中的 .npy 檔 (multiprocessing 自己的管線等不算在內)。"""
+    paths = []
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            paths.append(os.readlink(f"/proc/self/fd/{fd}"))
+        except OSError:
+            pass # listdir 本身用到的描述子在讀取時已經關閉
+    return [path for path in paths if path.endswith(".npy")]
+
+def test_chunks_cover_file_and_skip_excluded(dataset):
+    _, fish_path, _, fish, _ = dataset
+    exclude = np.array([0, 5, 299, 300, 699])
+    chunks = [read_chunk(task) for task in plan_chunks(fish_path, 300, exclude=exclude)]
+    expected = np.delete(fish, exclude, axis=0).reshape(-1, 28, 28)
+    np.testing.assert_array_equal(np.concatenate(chunks), expected)
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_metrics_match_exact_computation(dataset, workers):
+    model_path, fish_path, cat_path, fish, cat = dataset
+    report = evaluate([fish_path], [cat_path], model_path, backend="numpy", batch_size=128, workers=workers)
+    # 評估結束後不會留下開啟的類別檔
+    if os.path.exists("/proc/self/fd"):
+        assert open_npy_files() == []
+
+    engine = NumpyEngine(model_path)
+    pos = engine.predict_proba(fish.reshape(-1, 28, 28))
+    neg = engine.predict_proba(cat)
+    confusion = report["confusion"]
+    assert report["images"] == len(fish) + len(cat)
+    # 門檻對齊到直方圖的區間邊界，只有落在 0.5 附近一個區間內的分數可能不同
+    near = lambda p: np.abs(p - 0.5) < 1e-4
+    assert abs(confusion["tp"] - int((pos > 0.5).sum())) <= int(near(pos).sum())
+    assert abs(confusion["fp"] - int((neg > 0.5).sum())) <= int(near(neg).sum())
+
+    # AUC 與以排序計算的結果一致 (直方圖的同分處理誤差很小)
+    scores = np.concatenate([pos, neg])
+    ranks = scores.argsort().argsort() + 1
+    exact_auc = (ranks[:len(pos)].sum() - len(pos) * (len(pos) + 1) / 2) / (len(pos) * len(neg))
+    assert report["auc"] == pytest.approx(exact_auc, abs=1e-3)
@@ -0,0 +1,25 @@
+# MicroBatcher 的測試
+import numpy as np
+import pytest
+
+from model import MicroBatcher
+
+class MeanEngine:
+    """以像素平均值當作機率的假推論引擎，只用來驗證批次合併的行為。"""
+    def predict_proba(self, images):
+        return images.reshape(len(images), -1).mean(axis=1) / 255.0
+
+def test_bad_image_is_rejected_without_failing_the_batch():
+    batcher = MicroBatcher(MeanEngine(), max_batch_size=8, max_wait_ms=50.0)
+    try:
+        good = batcher.submit(np.full((28, 28), 255, dtype=np.uint8))
+        with pytest.raises(ValueError):
+            batcher.submit(np.zeros((32, 32), dtype=np.uint8))
+        with pytest.raises(ValueError):
+            batcher.submit(np.full((28, 28), "x", dtype=object))
+        other = batcher.submit(np.zeros((28, 28), dtype=np.uint8))
+
+        assert good.result(timeout=5) == (True, 1.0)
+        assert other.result(timeout=5) == (False, 0.0)
+    finally:
+        batcher.close()
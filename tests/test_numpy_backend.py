@@ -0,0 +1,117 @@
+# NumPy 推論後端與 Keras 的數值一致性測試
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from model import ARCHITECTURES, InferenceEngine, NumpyEngine, build_model_from_file
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIPPED_MODEL = os.path.join(REPO_DIR, "fish_classifier.h5")
+TOLERANCE = 1e-5
+
+def random_images(n=64, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, size=(n, 28, 28), dtype=np.uint8)
+
+def keras_engine(model_path):
+    model = build_model_from_file(model_path)
+    model.load_weights(model_path)
+    return InferenceEngine(model)
+
+def save_random_model(architecture, model_path, seed=0):
+    """以隨機權重 (偏差也不為 0) 建立並儲存一個架構，讓每一層都影響輸出。"""
+    import tensorflow as tf
+
+    tf.keras.backend.clear_session()
+    model = ARCHITECTURES[architecture]()
+    rng = np.random.default_rng(seed)
+    model.set_weights([rng.normal(0, 0.1, size=w.shape).astype(np.float32) for w in model.get_weights()])
+    model.save(model_path)
+
+def assert_backends_agree(model_path):
+    images = random_images()
+    expected = keras_engine(model_path).predict_proba(images)
+    np.testing.assert_allclose(NumpyEngine(model_path).predict_proba(images), expected, atol=TOLERANCE)
+
+@pytest.mark.skipif(not os.path.exists(SHIPPED_MODEL), reason="沒有 fish_classifier.h5")
+def test_shipped_model_matches_keras(tmp_path):
+    # 複製到暫存資料夾，.npz 快取才不會寫進專案目錄
+    model_path = str(tmp_path / "fish_classifier.h5")
+    shutil.copy(SHIPPED_MODEL, model_path)
+    assert_backends_agree(model_path)
+
+@pytest.mark.parametrize("architecture", sorted(ARCHITECTURES))
+def test_architecture_matches_keras(tmp_path, architecture):
+    model_path = str(tmp_path / f"{architecture}.h5")
+    save_random_model(architecture, model_path)
+    assert_backends_agree(model_path)
+
+@pytest.mark.parametrize("architecture", sorted(ARCHITECTURES))
+def test_npz_cache_round_trip(tmp_path, architecture):
+    model_path = str(tmp_path / f"{architecture}.h5")
+    save_random_model(architecture, model_path, seed=1)
+    images = random_images(seed=1)
+
+    fresh = NumpyEngine(model_path) # 由 .h5 產生快取
+    assert os.path.exists(str(tmp_path / f"{architecture}.npz"))
+    cached = NumpyEngine(model_path) # 由 .npz 快取載入
+    np.testing.assert_array_equal(cached.predict_proba(images), fresh.predict_proba(images))
+    assert cached.fingerprint == fresh.fingerprint
+
+def test_npz_cache_rebuilt_when_h5_replaced_by_older_file(tmp_path):
+    model_path = str(tmp_path / "model.h5")
+    save_random_model("cnn", model_path, seed=1)
+    NumpyEngine(model_path) # 產生快取
+
+    # 換成另一組權重，並把修改時間改得比快取還舊 (如 cp -p 或 git checkout)
+    save_random_model("cnn", model_path, seed=2)
+    os.utime(model_path, (0, 0))
+    images = random_images(seed=2)
+    np.testing.assert_allclose(NumpyEngine(model_path).predict_proba(images),
+                               keras_engine(model_path).predict_proba(images), atol=TOLERANCE)
+
+def test_npz_cache_write_failure_still_loads(tmp_path, monkeypatch):
+    model_path = str(tmp_path / "model.h5")
+    save_random_model("cnn", model_path, seed=1)
+
+    def read_only_savez(*args, **kwargs):
+        raise PermissionError("read-only file system")
+    monkeypatch.setattr(np, "savez", read_only_savez)
+
+    images = random_images(seed=1)
+    np.testing.assert_allclose(NumpyEngine(model_path).predict_proba(images),
+                               keras_engine(model_path).predict_proba(images), atol=TOLERANCE)
+    assert not os.path.exists(str(tmp_path / "model.npz"))
+
+def test_separable_depth_multiplier_matches_keras(tmp_path):
+    import tensorflow as tf
+
+    model = tf.keras.Sequential([
+        tf.keras.layers.Rescaling(1.0 / 255, input_shape=(28, 28, 1)),
+        tf.keras.layers.Conv2D(3, (3, 3), activation="relu"),
+        tf.keras.layers.SeparableConv2D(5, (3, 3), depth_multiplier=2, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(1, activation="sigmoid"),
+    ])
+    rng = np.random.default_rng(2)
+    model.set_weights([rng.normal(0, 0.3, size=w.shape).astype(np.float32) for w in model.get_weights()])
+    model_path = str(tmp_path / "depth_multiplier.h5")
+    model.save(model_path)
+    assert_backends_agree(model_path)
+
+def test_unsupported_layer_is_rejected(tmp_path):
+    import tensorflow as tf
+
+    model = tf.keras.Sequential([
+        tf.keras.layers.Rescaling(1.0 / 255, input_shape=(28, 28, 1)),
+        tf.keras.layers.Conv2D(4, (3, 3), padding="same", activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(1, activation="sigmoid"),
+    ])
+    model_path = str(tmp_path / "same_padding.h5")
+    model.save(model_path)
+    with pytest.raises(ValueError):
+        NumpyEngine(model_path)
@@ -0,0 +1,45 @@
+# TFLite 後端的輸入縮放測試
+import json
+import os
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from model import TFLiteEngine, model_input_scale, read_tflite_metadata, save_tflite, tflite_metadata_path
+
+def functional_model(with_rescaling=True):
+    """以 keras.Input 建立的函數式模型：輸入張量名稱與 Rescaling 無關。"""
+    inputs = tf.keras.Input(shape=(28, 28, 1))
+    x = tf.keras.layers.Rescaling(1.0 / 255, name="normalize")(inputs) if with_rescaling else inputs
+    x = tf.keras.layers.Conv2D(4, (3, 3), activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(1, activation="sigmoid")(x)
+    model = tf.keras.Model(inputs, outputs)
+    rng = np.random.default_rng(0)
+    model.set_weights([rng.normal(0, 0.5, size=w.shape).astype(np.float32) for w in model.get_weights()])
+    return model
+
+@pytest.mark.parametrize("with_rescaling", [True, False])
+def test_input_scale_comes_from_metadata(tmp_path, with_rescaling):
+    model = functional_model(with_rescaling)
+    path = str(tmp_path / "model.tflite")
+    save_tflite(model, path, "float32")
+
+    assert read_tflite_metadata(path)["input_scale"] == model_input_scale(model)
+    images = np.random.default_rng(1).integers(0, 256, size=(16, 28, 28), dtype=np.uint8)
+    expected = model(np.expand_dims(images.astype("float32") * model_input_scale(model), -1)).numpy()[:, 0]
+    np.testing.assert_allclose(TFLiteEngine(path).predict_proba(images), expected, atol=1e-5)
+
+def test_missing_metadata_means_legacy_export(tmp_path):
+    path = str(tmp_path / "model.tflite")
+    save_tflite(functional_model(), path, "float32")
+    os.remove(tflite_metadata_path(path))
+    assert read_tflite_metadata(path)["input_scale"] == pytest.approx(1.0 / 255)
+
+def test_metadata_records_variant(tmp_path):
+    path = str(tmp_path / "model_fp16.tflite")
+    save_tflite(functional_model(), path, "float16")
+    with open(tflite_metadata_path(path), encoding="utf-8") as f:
+        assert json.load(f) == {"input_scale": 1.0, "variant": "float16"}